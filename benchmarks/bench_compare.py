@@ -0,0 +1,162 @@
+'''Rough timings for kobold.compare.
+
+Run with:
+
+    PYTHONPATH=. python benchmarks/bench_compare.py [name ...]
+
+With no names, every benchmark is run.'''
+
+import sys
+import timeit
+
+from kobold import compare
+from kobold.compare.result import CompareResult
+
+
+def nested_fixture(width=20, depth=3, name='leaf'):
+    if depth == 0:
+        return {'id': width, 'name': name, 'tags': ['a', 'b', 'c']}
+    return {
+        'items': [nested_fixture(width, depth - 1, name)
+                  for _ in range(width)],
+        'meta': {'count': width, 'depth': depth}}
+
+
+def count_nodes(value):
+    pending = [value]
+    count = 0
+    while pending:
+        value = pending.pop()
+        count += 1
+        if isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+    return count
+
+
+def report(name, seconds, number):
+    print('{:<40} {:>10.3f} ms/call'.format(
+        name,
+        seconds / number * 1000))
+
+
+def report_rate(name, seconds, number, nodes):
+    print('{:<40} {:>10.0f} nodes/s'.format(
+        name,
+        nodes * number / seconds))
+
+
+def run_recursively(step):
+    # Drives the same comparison steps as Compare.run, but on Python's
+    # call stack - the way the comparison functions used to call
+    # each other
+    if isinstance(step, CompareResult):
+        return step
+    result = None
+    while True:
+        try:
+            next_step = step.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = run_recursively(next_step)
+
+
+def bench_compile(number=20):
+    expected = nested_fixture()
+    actual = nested_fixture()
+    compiled = compare.Compare.compile(expected)
+    report(
+        'compare (nested dict/list)',
+        timeit.timeit(lambda: compare.compare(expected, actual),
+                      number=number),
+        number)
+    report(
+        'compiled match (nested dict/list)',
+        timeit.timeit(lambda: compiled.match(actual), number=number),
+        number)
+
+
+def best_of(function, number, repeat=5):
+    return min(timeit.repeat(function, number=number, repeat=repeat))
+
+
+def bench_engine(number=5):
+    expected = nested_fixture()
+    nodes = count_nodes(expected)
+    for (name, actual) in (('match', nested_fixture()),
+                           ('mismatch', nested_fixture(name='other'))):
+        report_rate(
+            'explicit stack ({})'.format(name),
+            best_of(
+                lambda: compare.compare(expected, actual).diff(),
+                number),
+            number,
+            nodes)
+        report_rate(
+            'recursive ({})'.format(name),
+            best_of(
+                lambda: run_recursively(compare.Compare.compare_step(
+                    expected, actual, None, {}, False)).diff(),
+                number),
+            number,
+            nodes)
+
+
+def bench_json(number=3):
+    import json
+    from kobold.compare.hints import JSONParsingHint
+    rows = [{'id': i, 'name': 'row {}'.format(i), 'tags': ['a', 'b']}
+            for i in range(100000)]
+    document = json.dumps(
+        {'status': 'ok', 'rows': rows, 'meta': {'page': 1, 'count': 100000}})
+    for (name, payload) in (
+            ('first key', {'status': 'ok'}),
+            ('key after rows', {'meta': {'count': 100000}})):
+        expected = JSONParsingHint(payload)
+        for hash_setting in ('full', 'existing'):
+            if hash_setting == 'full':
+                # A full compare would fail - time the parse alone
+                function = lambda: expected.parse(document)
+            else:
+                function = lambda: compare.compare(
+                    expected, document, type_compare='existing')
+            report(
+                'json {} ({})'.format(name, hash_setting),
+                best_of(function, number),
+                number)
+
+
+def bench_fingerprint(number=3):
+    from kobold.compare.fingerprint import FingerprintCache
+    expected = nested_fixture(20, 3)
+    actual = nested_fixture(20, 3)
+    changed = nested_fixture(20, 3)
+    changed['items'][3]['items'][5]['items'][7]['name'] = 'x'
+    nodes = count_nodes(actual)
+    cache = FingerprintCache()
+    cache.compare(expected, actual)
+    for (name, function) in (
+            ('compare', lambda: compare.compare(expected, actual)),
+            ('fingerprinted, unchanged',
+             lambda: cache.compare(expected, actual)),
+            ('fingerprinted, one change',
+             lambda: cache.compare(expected, changed))):
+        report_rate(name, best_of(function, number), number, nodes)
+
+
+benchmarks = {
+    'compile': bench_compile,
+    'engine': bench_engine,
+    'fingerprint': bench_fingerprint,
+    'json': bench_json,
+}
+
+
+def main(names):
+    for name in names or benchmarks:
+        benchmarks[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
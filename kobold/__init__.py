@@ -20,12 +20,30 @@ class ValidationError(Exception):
     pass
 
 
-from . import (
-    assertions,
-    compare,
-    doubles,
-    hash_functions,
-    html,
-    response)
-
-from kobold.compare import DontCare
+# Submodules (and DontCare) are only imported when they're first used,
+# so that "import kobold" stays cheap
+submodules = (
+    'assertions',
+    'compare',
+    'doubles',
+    'hash_functions',
+    'html',
+    'response',
+    'snapshot',
+    'swap')
+
+
+def __getattr__(name):
+    if name in submodules:
+        # Importing the submodule sets it as an attribute here
+        __import__('kobold.' + name)
+        return globals()[name]
+    elif name == 'DontCare':
+        from kobold.compare import DontCare
+        return DontCare
+    raise AttributeError(
+        "module 'kobold' has no attribute '{}'".format(name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(submodules) + ['DontCare'])
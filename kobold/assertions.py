@@ -1,5 +1,3 @@
-import pprint
-
 import kobold
 
 def assert_response_matches(expected,
@@ -25,31 +23,127 @@ def assert_equal(
         expected, 
         actual, 
         type_compare=None,
-        exception_context=None):
+        exception_context=None,
+        fingerprints=None,
+        max_mismatches=None,
+        max_depth=None,
+        max_diff_chars=None,
+        diff_path=None):
     '''
     If two data structures don't match (in the kobold.compare sense),
-    raise an AssertionError
+    raise an AssertionError.  max_mismatches and max_depth limit how
+    much of the diff is collected (see kobold.compare.DiffBudget), and
+    max_diff_chars how much of it goes in the message.  If diff_path is
+    given, every mismatch is written to that file as well.
     '''
 
     if type_compare is None:
         type_compare = {}
     result = kobold.compare.compare(expected, 
                      actual,
-                     type_compare=type_compare)
-    raise_if_not_match(result, exception_context=exception_context)
+                     type_compare=type_compare,
+                     fingerprints=fingerprints,
+                     max_mismatches=max_mismatches,
+                     max_depth=max_depth)
+    raise_if_not_match(
+        result,
+        exception_context=exception_context,
+        max_diff_chars=max_diff_chars,
+        diff_path=diff_path)
 
 assert_match = assert_equal
 
-def raise_if_not_match(result, exception_context=None):
-    if result != 'match':
-        expected_diff, actual_diff = result
-        assertion_text =\
-            "Expected\n\n%s\n\nBut Got\n\n%s" %\
-                    (pprint.pformat(expected_diff),
-                     pprint.pformat(actual_diff))
-        if exception_context is None:
-            exception_text = assertion_text
+# How many characters of the diff go in an assertion message, unless
+# max_diff_chars says otherwise
+default_max_diff_chars = 20000
+
+
+class MismatchError(AssertionError):
+    '''The AssertionError for a mismatch.  The message - a line for
+       each mismatched path (see kobold.compare.render) - is only
+       worked out when it's asked for, so a mismatch that's caught
+       and retried costs nothing to describe.'''
+
+    def __init__(self,
+                 result,
+                 exception_context=None,
+                 max_diff_chars=None,
+                 diff_path=None,
+                 message=None):
+        super().__init__()
+        self.result = result
+        self.exception_context = exception_context
+        self.max_diff_chars = max_diff_chars
+        self.diff_path = diff_path
+        self.message = message
+
+    def __reduce__(self):
+        # The result may not pickle (it can hold the parsers of the
+        # hints it compared), so the error is rebuilt from its message -
+        # in the process a worker raised it in, say
+        return (
+            self.__class__,
+            (None, None, None, self.diff_path, str(self)))
+
+    def __str__(self):
+        if self.message is None:
+            self.message = self.render()
+        return self.message
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, str(self))
+
+    def render(self):
+        max_diff_chars = self.max_diff_chars
+        if max_diff_chars is None:
+            max_diff_chars = default_max_diff_chars
+        if isinstance(self.result, kobold.compare.CompareResult):
+            from kobold.compare import render
+            assertion_text = render.render(self.result, max_diff_chars)
         else:
-            exception_text = "{}: {}".format(exception_context, assertion_text)
-        raise AssertionError(exception_text)
+            assertion_text = tuple_diff_text(self.result)
+            if len(assertion_text) > max_diff_chars:
+                assertion_text = "{}\n... {:,} more characters".format(
+                    assertion_text[:max_diff_chars],
+                    len(assertion_text) - max_diff_chars)
+        assertion_text = assertion_text.rstrip("\n")
+        if self.diff_path is not None:
+            assertion_text += "\n(every mismatch is in {})".format(
+                self.diff_path)
+        if self.exception_context is None:
+            return assertion_text
+        return "{}: {}".format(self.exception_context, assertion_text)
+
+
+def tuple_diff_text(diff):
+    '''The text for a diff tuple, from before comparisons returned
+       results'''
+    import pprint
+    expected_diff, actual_diff = diff
+    return "Expected\n\n%s\n\nBut Got\n\n%s\n" % (
+        pprint.pformat(expected_diff),
+        pprint.pformat(actual_diff))
+
 
+def raise_if_not_match(result,
+                       exception_context=None,
+                       max_diff_chars=None,
+                       diff_path=None):
+    if isinstance(result, kobold.compare.CompareResult):
+        # (Comparing with "match" would build the whole diff)
+        matched = result.matched
+    else:
+        matched = result == 'match'
+    if not matched:
+        if diff_path is not None:
+            from kobold.compare import render
+            with open(diff_path, 'w', encoding='utf-8') as diff_file:
+                if isinstance(result, kobold.compare.CompareResult):
+                    render.write(result, diff_file)
+                else:
+                    diff_file.write(tuple_diff_text(result))
+        raise MismatchError(
+            result,
+            exception_context=exception_context,
+            max_diff_chars=max_diff_chars,
+            diff_path=diff_path)
@@ -1,21 +1,33 @@
 import collections
-import datetime
-import json
+import collections.abc
+import contextvars
+import copy
+import math
+import numbers
 import re
-import six
-
-from dateutil import parser
+import sys
+import threading
 
 import kobold
-from kobold import NotPresent
-from kobold.hash_functions import (
-    combine
-)
-from . import hints
+from kobold import NotPresent, hash_functions
+from . import hints, matching
+from .result import (
+    ArrayMismatch,
+    CompareResult,
+    DisplayMismatch,
+    HashMismatch,
+    ListMismatch,
+    MATCH,
+    Match,
+    Mismatch,
+    SetMismatch,
+    StreamMismatch,
+    TruncatedMismatch)
 from .hints import (
     Base64Hint,
     Hint,
     JSONParsingHint,
+    KeyedList,
     MultiMatch,
     ObjectAttrParsingHint,
     ObjectDictParsingHint,
@@ -23,22 +35,120 @@ from .hints import (
     ParsingHint,
     TypeCompareHint,
     UrlParsingHint,
-    UrlEncodedParsingHint)
+    UrlEncodedParsingHint,
+    current_match_counts)
 
 pattern_type = getattr(re, '_pattern_type', None)
 if pattern_type is None:
     pattern_type = getattr(re, 'Pattern')
 
 
-def compare(expected, actual, type_compare=None, names=None):
-    '''A wrapper around Compare.compare'''
+def compare(expected,
+            actual,
+            type_compare=None,
+            names=None,
+            workers=None,
+            fingerprints=None,
+            max_mismatches=None,
+            max_depth=None):
+    '''A wrapper around Compare.compare.  fingerprints is an optional
+       FingerprintCache (see kobold.compare.fingerprint), for skipping
+       the parts of actual that matched in earlier comparisons.
+
+       max_mismatches and max_depth limit how much of the diff is
+       collected, for structures too big to diff in full (see
+       DiffBudget).  If any mismatches were left out, the result is a
+       TruncatedMismatch, which says how many.'''
     if names is None:
         names = {}
-    return Compare.compare(
+    if max_mismatches is not None or max_depth is not None:
+        if workers is not None:
+            raise kobold.ValidationError(
+                'max_mismatches and max_depth cannot be used with workers')
+        budget = DiffBudget(max_mismatches, max_depth)
+        token = current_diff_budget.set(budget)
+        try:
+            result = compare(
+                expected,
+                actual,
+                type_compare=type_compare,
+                names=names,
+                fingerprints=fingerprints)
+        finally:
+            current_diff_budget.reset(token)
+        if budget.skipped:
+            return TruncatedMismatch(result, budget.skipped)
+        return result
+    if fingerprints is not None:
+        if workers is not None:
+            raise kobold.ValidationError(
+                'fingerprints and workers cannot be used together')
+        return fingerprints.compare(
             expected,
             actual,
             type_compare=type_compare,
             names=names)
+    return Compare.compare(
+            expected,
+            actual,
+            type_compare=type_compare,
+            names=names,
+            workers=workers)
+
+
+def matches(expected, actual, type_compare=None, names=None, workers=None):
+    '''True if compare(expected, actual, type_compare) would return
+       a match.  The comparison stops at the first mismatch, and
+       never builds a diff, so this is the cheaper choice when
+       the diff isn't going to be displayed.'''
+    if names is None:
+        names = {}
+    return Compare.compare(
+            expected,
+            actual,
+            type_compare=type_compare,
+            names=names,
+            fail_fast=True,
+            workers=workers).matched
+
+
+def compare_stream(expected,
+                   actual,
+                   type_compare=None,
+                   names=None,
+                   max_mismatches=None):
+    '''A wrapper around Compare.stream_compare'''
+    if names is None:
+        names = {}
+    return Compare.stream_compare(
+            expected,
+            actual,
+            type_compare=type_compare,
+            names=names,
+            max_mismatches=max_mismatches)
+
+
+def read_json_lines(source):
+    '''Yields the value on each line of a JSON Lines file (a path, or
+       an open file), reading one line at a time.  Blank lines are
+       skipped.  A path is read as UTF-8, as JSON Lines always is.'''
+    import json
+    if hasattr(source, 'read'):
+        lines = source
+    else:
+        lines = open(source, encoding='utf-8')
+    try:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(
+                    'Invalid JSON on line {}: {}'.format(number, e))
+    finally:
+        if lines is not source:
+            lines.close()
 
 
 class DontCare(object):
@@ -62,6 +172,8 @@ class DontCare(object):
 
        no_rules: The second argument may be anything - I literally
        do not care.
+
+       Other rules can be added with add_dontcare_rule.
        '''
 
     
@@ -87,10 +199,26 @@ class DontCare(object):
 
 
     def validate(self):
-        if self.rule == 'isinstance':
-            if self.options.get('of_class') is None:
-                raise kobold.ValidationError('isinstance dontcares must have an "of_class" option specified')
-        
+        # The rule is looked up once, here, rather than on every
+        # comparison
+        if self.rule is None:
+            make_validator = validate_anything
+        else:
+            make_validator = dontcare_rules.get(self.rule)
+        if make_validator is None:
+            self.validator = unknown_rule_validator(self.rule)
+        else:
+            self.validator = make_validator(**self.options)
+
+    def __getstate__(self):
+        # Validators are often closures, which can't be pickled
+        state = dict(self.__dict__)
+        state.pop('validator', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.validate()
 
     def compare_with(self, other_thing, names=None):
         if names is None:
@@ -107,57 +235,224 @@ class DontCare(object):
             else:
                 names[self.name] = other_thing
 
+        return self.validator(other_thing)
 
-        if self.rule == 'not_none_or_missing':
-            return (
-                other_thing is not None and
-                other_thing is not kobold.NotPresent)
-        elif self.rule == 'list':
-            if not isinstance(other_thing, list):
-                return False
 
-            if self.options['length']:
-                return len(other_thing) == self.options['length']
-        elif self.rule == 'json':
-            try:
-                json.loads(other_thing)
-                return True
-            except:
-                return False
-        elif self.rule == 'iso8601_datetime':
-            try:
-                parser.parse(other_thing)
-                return True
-            except:
-                return False
-        elif self.rule == 'date_string_with_format':
-            format_string = self.options['format_string']
+def add_dontcare_rule(rule, make_validator):
+    '''Make rule available to DontCare(rule, ...).  make_validator is
+       called with the DontCare's options (the keyword arguments it was
+       made with) whenever a DontCare with this rule is made, and
+       returns the validator: a function that takes the actual value,
+       and returns True if it's acceptable.  DontCares that have
+       already been made aren't affected.'''
+    dontcare_rules[rule] = make_validator
+
+
+def remove_dontcare_rule(rule):
+    dontcare_rules.pop(rule, None)
+
+
+def unknown_rule_validator(rule):
+    # Subclasses of DontCare are free to make up their own rules, as long
+    # as they have their own compare_with - so an unknown rule is only
+    # an error if it's ever used
+    def validate_unknown(other_thing):
+        raise kobold.ValidationError(
+            'DontCare rule {} not recognized'.format(rule))
+    return validate_unknown
+
+
+def validate_anything(**options):
+    return lambda other_thing: True
+
+
+def validate_not_none_or_missing(**options):
+    def not_none_or_missing(other_thing):
+        return (
+            other_thing is not None and
+            other_thing is not kobold.NotPresent)
+    return not_none_or_missing
+
+
+def validate_list(length=None, **options):
+    def is_list(other_thing):
+        if not isinstance(other_thing, list):
+            return False
+        return length is None or len(other_thing) == length
+    return is_list
+
+
+def validate_json(**options):
+    import json
+
+    def is_json(other_thing):
+        try:
+            json.loads(other_thing)
+            return True
+        except Exception:
+            return False
+    return is_json
+
+
+def validate_iso8601_datetime(**options):
+    import datetime
+
+    def is_iso8601_datetime(other_thing):
+        if type(other_thing) is str:
+            # Much quicker than dateutil, for the strings it
+            # understands
             try:
-                datetime.datetime.strptime(
-                    other_thing,
-                    format_string)
+                datetime.datetime.fromisoformat(other_thing)
                 return True
-            except Exception as e:
-                return False
-        elif self.rule == 'isinstance':
-            return isinstance(other_thing, self.options['of_class'])
-        elif self.rule is None or self.rule == 'no_rules':
+            except ValueError:
+                pass
+
+        from dateutil import parser
+        try:
+            parser.parse(other_thing)
             return True
-        elif self.rule == 'number_within':
-            number = self.options['number']
-            _range = self.options['range']
-            return (
-                other_thing > number - _range and
-                other_thing < number + _range
-            )
-        else:
-            raise kobold.ValidationError(
-                'DontCare rule {} not recognized'.format(self.rule)
-            )
+        except Exception:
+            return False
+    return cache_validations(is_iso8601_datetime)
+
+
+def validate_date_string_with_format(format_string=None, **options):
+    import datetime
+    if format_string is None:
+        raise kobold.ValidationError(
+            'date_string_with_format dontcares must have a '
+            '"format_string" option specified')
+
+    def is_date_string_with_format(other_thing):
+        try:
+            datetime.datetime.strptime(other_thing, format_string)
+            return True
+        except Exception:
+            return False
+    return cache_validations(is_date_string_with_format)
+
+
+def cache_validations(validator):
+    '''validator, remembering what it said about each string (up to
+       max_cached_validations of them)'''
+    validated = {}
+
+    def cached_validator(other_thing):
+        if type(other_thing) is not str:
+            return validator(other_thing)
+        valid = validated.get(other_thing)
+        if valid is None:
+            valid = validator(other_thing)
+            if len(validated) >= max_cached_validations:
+                validated.clear()
+            validated[other_thing] = valid
+        return valid
+    return cached_validator
+
+
+def validate_isinstance(of_class=None, **options):
+    if of_class is None:
+        raise kobold.ValidationError(
+            'isinstance dontcares must have an "of_class" option specified')
+    return lambda other_thing: isinstance(other_thing, of_class)
+
+
+def validate_number_within(number=None, range=None, **options):
+    if number is None or range is None:
+        raise kobold.ValidationError(
+            'number_within dontcares must have "number" and "range" '
+            'options specified')
+    low = number - range
+    high = number + range
+    return lambda other_thing: low < other_thing < high
+
+
+# DontCare rules, by name - see add_dontcare_rule
+dontcare_rules = {
+    'not_none_or_missing': validate_not_none_or_missing,
+    'list': validate_list,
+    'json': validate_json,
+    'iso8601_datetime': validate_iso8601_datetime,
+    'date_string_with_format': validate_date_string_with_format,
+    'isinstance': validate_isinstance,
+    'no_rules': validate_anything,
+    'number_within': validate_number_within}
+
+# How many strings each date rule remembers the validity of
+max_cached_validations = 1024
 
 CompareRule = DontCare
+
+# What the comparison functions return for a mismatch when they've been
+# asked to fail fast, in place of a diff
+MISMATCH = Mismatch('mismatch', 'mismatch')
         
 
+class Bindings(dict):
+    '''The names bound by named DontCares, with a log of each name set,
+       so that trying out a pairing can be undone cheaply:
+
+           checkpoint = bindings.checkpoint()
+           ... compare, binding names ...
+           bindings.rollback(checkpoint)
+
+       Only setting names (directly or with update) is logged.'''
+
+    def __init__(self, names=None):
+        super().__init__(names or {})
+        # (name, what it was before - or NotPresent) for each name set
+        self.log = []
+
+    @classmethod
+    def of(cls, names):
+        '''names, if it's already Bindings, otherwise Bindings
+           starting out with a copy of names'''
+        if isinstance(names, Bindings):
+            return names
+        return cls(names)
+
+    def __setitem__(self, name, value):
+        self.log.append((name, self.get(name, NotPresent)))
+        super().__setitem__(name, value)
+
+    def update(self, *args, **kwargs):
+        for (name, value) in dict(*args, **kwargs).items():
+            self[name] = value
+
+    def checkpoint(self):
+        return len(self.log)
+
+    def rollback(self, checkpoint):
+        '''Undo everything set since checkpoint'''
+        log = self.log
+        while len(log) > checkpoint:
+            name, previous = log.pop()
+            if previous is NotPresent:
+                super().__delitem__(name)
+            else:
+                super().__setitem__(name, previous)
+
+    def changes_since(self, checkpoint):
+        '''{name: value} for each name set since checkpoint'''
+        return dict(
+            (name, self[name]) for (name, _) in self.log[checkpoint:])
+
+    def consistent(self, changes):
+        '''True if none of the names in changes are bound to
+           anything else'''
+        for (name, value) in changes.items():
+            bound = self.get(name, NotPresent)
+            if bound is not NotPresent and bound != value:
+                return False
+        return True
+
+    def keep(self, names):
+        '''Copy what's been set into names, if names isn't these
+           Bindings already'''
+        if names is not self:
+            names.update(self.changes_since(0))
+
+
 class ListDiff(list):
     def __init__(self, arr=None, display_type=list):
         if arr is None:
@@ -195,179 +490,471 @@ class StructuredString(object):
         self.arguments = arguments
 
 
+class TypeCompare(dict):
+    '''A type_compare that can't be changed.  It's still a dict, so it
+       can be read like any other type_compare, but it's hashable, and
+       interned - there's only ever one TypeCompare with a given set of
+       settings.  List and set settings are stored as tuples and
+       frozensets, and dict settings as TypeCompares.
+
+       Get one from normalize_type_compare, or TypeCompare.intern.  The
+       TypeCompare for a type_compare laid over another (by a
+       TypeCompareHint, or a __compare key) is worked out once, and
+       remembered by the one underneath, so comparisons don't build
+       any new type_compares as they work through a structure.'''
+    __slots__ = ('_key', '_derived', 'normalized')
+
+    @classmethod
+    def intern(cls, settings):
+        if type(settings) is cls:
+            return settings
+        # The same dict (a TypeCompareHint's, or a __compare key's) is
+        # usually interned over and over, as each value it applies to
+        # is compared - so it's remembered, along with a copy to check
+        # that it hasn't been changed since
+        remembered = interned_overrides.get(id(settings))
+        if (remembered is not None and
+                remembered[0] is settings and
+                remembered[1] == settings):
+            return remembered[2]
+
+        frozen = {}
+        for key, value in settings.items():
+            frozen[key] = freeze_setting(key, value)
+        key = frozenset(frozen.items())
+        type_compare = interned_type_compares.get(key)
+        if type_compare is None:
+            type_compare = cls(frozen)
+            object.__setattr__(type_compare, '_key', key)
+            object.__setattr__(type_compare, '_derived', {})
+            object.__setattr__(
+                type_compare,
+                'normalized',
+                all(name in frozen for name in default_type_compare_settings))
+            interned_type_compares[key] = type_compare
+        if len(interned_overrides) >= max_interned_overrides:
+            interned_overrides.clear()
+        interned_overrides[id(settings)] = (
+            settings,
+            copy.deepcopy(settings),
+            type_compare)
+        return type_compare
+
+    def derive(self, overrides):
+        '''This type_compare, with overrides (a type_compare - a dict of
+           settings, a hash setting, or None) laid over it'''
+        if overrides is None:
+            return self
+        if not isinstance(overrides, str):
+            overrides = TypeCompare.intern(overrides)
+        derived = self._derived.get(overrides)
+        if derived is None:
+            settings = dict(self)
+            if isinstance(overrides, str):
+                settings['hash'] = overrides
+            else:
+                settings.update(overrides)
+            derived = self._derived[overrides] = TypeCompare.intern(settings)
+        return derived
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __reduce__(self):
+        return (TypeCompare.intern, (dict(self),))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TypeCompare is immutable')
+
+    def immutable(self, *args, **kwargs):
+        raise TypeError('TypeCompare is immutable')
+
+    __setitem__ = __delitem__ = __ior__ = immutable
+    clear = pop = popitem = setdefault = update = immutable
+
+
+def freeze_setting(key, value):
+    if key == 'dontcare_keys':
+        return frozenset(value)
+    elif isinstance(value, (list, tuple)):
+        return tuple(value)
+    elif isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    elif isinstance(value, dict):
+        return TypeCompare.intern(value)
+    else:
+        return value
+
+
+interned_type_compares = {}
+
+# The TypeCompare that each dict of settings was last interned as, by
+# the dict's id (see TypeCompare.intern)
+interned_overrides = {}
+
+# The most dicts of settings interned_overrides holds before it starts
+# over
+max_interned_overrides = 1024
+
+default_type_compare_settings = {
+    'hash' : 'full',
+    'list': 'full',
+    'ordered' : True,
+    'dontcare_keys': ()}
+default_type_compare = TypeCompare.intern(default_type_compare_settings)
+
+
 def normalize_type_compare(type_compare, defaults=None):
+    '''The TypeCompare for type_compare (a dict of settings, a hash
+       setting, or None), filled in with defaults'''
     if defaults is None:
-        defaults = {
-            'hash' : 'full',
-            'list': 'full',
-            'ordered' : True}
+        if type(type_compare) is TypeCompare and type_compare.normalized:
+            return type_compare
+        defaults = default_type_compare
+    else:
+        defaults = TypeCompare.intern(defaults)
+    return defaults.derive(type_compare)
 
-    if isinstance(type_compare, str):
-        type_compare = {'hash': type_compare}
-    elif type_compare is None:
-        type_compare = {}
 
-    type_compare = combine(defaults, type_compare)
-    return type_compare
+force_compare_types = None
 
 
 def get_force_compare_types():
-    import unittest.mock
-
-    return (unittest.mock._Call,)
+    global force_compare_types
+    if force_compare_types is None:
+        # Importing unittest.mock is slow (it brings in asyncio), and
+        # there can't be any mock calls to compare until something
+        # else has imported it
+        mock = sys.modules.get('unittest.mock')
+        if mock is None:
+            return ()
+        force_compare_types = (mock._Call,)
+    return force_compare_types
 
 
 class Compare(object):
+    '''The comparison functions don't call each other directly.  Each
+       one is written as a generator (the *_steps methods), which yields
+       the sub-comparisons it needs the results of, and returns its own
+       CompareResult.  run drives these generators with an explicit
+       stack, so comparisons aren't limited by Python's recursion limit,
+       however deeply expected and actual are nested.
+
+       The public methods (compare, hash_compare, list_compare and so on)
+       each run one of these generators to completion.'''
+
+    @classmethod
+    def compile(cls, expected, type_compare=None):
+        '''Build a reusable comparison plan for expected.  The plan's
+           match(actual) method returns the same result as
+           compare(expected, actual, type_compare), but does all of the
+           work that only depends on expected (and type_compare) once,
+           up front.'''
+        from .compiled import compile_expected
+        return compile_expected(expected, type_compare)
+
     @classmethod
     def compare(cls,
                 expected,
                 actual,
                 type_compare=None,
-                names=None):
+                names=None,
+                fail_fast=False,
+                workers=None):
+        '''Returns a CompareResult - MATCH, or a mismatch whose diff()
+           is a tuple of the mismatched parts of expected and actual.
+           With fail_fast, the comparison stops at the first mismatch,
+           and returns MISMATCH.  With workers, a large enough hash or
+           ordered list is compared in shards, across that many
+           processes (see kobold.compare.parallel).'''
         if names is None:
             names = {}
-        type_compare = normalize_type_compare(
-            type_compare)
-        force_compare_types = get_force_compare_types()
-        if isinstance(expected, hints.TypeCompareHint):
-            # If this is a TypeCompareHint, create a new type_compare
-            # based on what's on the class, but using the type_compare
-            # provided to the function as a default
-            type_compare = normalize_type_compare(
-                expected.type_compare,
-                defaults=type_compare)
-            return cls.compare(
-                expected.payload,
+        if workers is not None and workers > 1:
+            from .parallel import parallel_compare
+            return parallel_compare(
+                cls,
+                expected,
                 actual,
                 type_compare,
-                names=names)
-        if type_compare['ordered'] and type_compare['list'] == 'existing':
-            raise kobold.ValidationError(
-                'Ordered list compare must always be "full", not "existing"')
-
-        if expected is DontCare:
-            expected = DontCare()
+                names,
+                fail_fast,
+                workers)
+        return cls.run(cls.compare_step(
+            expected,
+            actual,
+            type_compare,
+            names,
+            fail_fast))
 
-        if isinstance(expected, DontCare):
-            if expected.compare_with(actual, names=names):
-                return 'match'
-            else:
-                return (str(expected), actual)
-        elif (type(expected) in force_compare_types and
-                type(actual) in force_compare_types):
-            if expected == actual:
-                return 'match'
-            else:
-                return (expected, actual)
+    @classmethod
+    def stream_compare(cls,
+                       expected,
+                       actual,
+                       type_compare=None,
+                       names=None,
+                       max_mismatches=None):
+        '''Compares two iterables (generators, files read with
+           read_json_lines, or anything else that can be iterated over)
+           in order, an element at a time, as compare would two lists.
+           Neither is read into memory - only the mismatches are kept,
+           and the comparison stops once it has max_mismatches of them
+           (max_stream_mismatches, by default).  Returns MATCH, or
+           a StreamMismatch.'''
+        if names is None:
+            names = {}
+        if max_mismatches is None:
+            max_mismatches = max_stream_mismatches
+        type_compare = normalize_type_compare(type_compare)
+        expected = iter(expected)
+        actual = iter(actual)
+        entries = []
+        index = 0
+        while True:
+            expected_value = next(expected, NotPresent)
+            actual_value = next(actual, NotPresent)
+            if expected_value is NotPresent and actual_value is NotPresent:
+                break
+            result = cls.run(cls.compare_step(
+                expected_value,
+                actual_value,
+                type_compare,
+                names,
+                False))
+            if result is not MATCH:
+                entries.append((index, result))
+                if len(entries) >= max_mismatches:
+                    return StreamMismatch(entries, True)
+            index += 1
+
+        if len(entries) == 0:
+            return MATCH
+        else:
+            return StreamMismatch(entries, False)
 
-        elif (type(expected) == pattern_type and 
-              isinstance(actual, six.string_types)):
-            match = expected.match(actual)
-            if match:
-                return 'match'
+    @classmethod
+    def run(cls, step):
+        '''Drive a comparison step to its CompareResult.  A step is
+           either a CompareResult already, or a generator that yields
+           steps and is sent back their results.  Generators that are
+           waiting on a result are kept on a stack here, rather than
+           on Python's call stack.'''
+        if isinstance(step, CompareResult):
+            return step
+        # Everything a comparison keeps track of as it goes lives in
+        # context variables, set here, so that expected values are
+        # never changed and can be shared between threads
+        if current_parse_cache.get() is None:
+            # Hints parsed while this runs are remembered until it's done
+            token = current_parse_cache.set(ParseCache())
+            try:
+                return cls.run(step)
+            finally:
+                current_parse_cache.reset(token)
+        if current_match_counts.get() is None:
+            token = current_match_counts.set({})
+            try:
+                return cls.run(step)
+            finally:
+                current_match_counts.reset(token)
+
+        budget = current_diff_budget.get()
+        stack = []
+        while True:
+            if isinstance(step, CompareResult):
+                if not stack:
+                    return step
+                generator = stack[-1]
+                result = step
             else:
-                return ('regex: %s' % expected.pattern, actual)
-        elif isinstance(expected, hints.ParsingHint):
+                generator = step
+                stack.append(generator)
+                result = None
+            if budget is not None:
+                # How far down the comparison is, for max_depth
+                budget.depth = len(stack)
             try:
-                return cls.compare(
-                    expected.payload,
-                    expected.parse(actual),
+                step = generator.send(result)
+            except StopIteration as stop:
+                # Finished - its result goes to whatever's waiting on it
+                stack.pop()
+                step = stop.value
+
+    @classmethod
+    def compare_step(cls, expected, actual, type_compare, names, fail_fast):
+        '''The step for comparing expected with actual.  How to compare
+           them is looked up by their types (see find_comparer).  Values
+           that can be compared without looking inside them are compared
+           straight away, and the CompareResult returned.  For anything
+           else, this returns the generator that compares them.'''
+        if not fail_fast:
+            budget = current_diff_budget.get()
+            if budget is not None:
+                return cls.budgeted_step(
+                    budget,
+                    expected,
+                    actual,
                     type_compare,
-                    names=names)
-            except kobold.InvalidMatch:
-                return (expected, actual)
-        elif (acts_like_a_hash(expected) and 
-              acts_like_a_hash(actual)):
-            return cls.hash_compare(
-                expected, 
-                actual, 
-                type_compare,
-                names=names)
-        elif (isinstance(expected, tuple) and isinstance(actual, tuple)):
-            return cls.list_compare(
+                    names)
+        return cls.dispatch_step(
+            expected,
+            actual,
+            type_compare,
+            names,
+            fail_fast)
+
+    @classmethod
+    def budgeted_step(cls, budget, expected, actual, type_compare, names):
+        '''compare_step, collecting only as much detail as budget
+           (a DiffBudget) allows.  Past that, the comparison carries on,
+           so that every mismatch is counted, but a mismatch comes back
+           as MISMATCH, which the hash and list comparisons leave out of
+           their diffs.'''
+        if budget.spent():
+            step = cls.dispatch_step(
                 expected,
                 actual,
                 type_compare,
-                iter_type=tuple,
-                names=names)
-        elif (acts_like_a_list(expected) and 
-              acts_like_a_list(actual)):
-            return cls.list_compare(
-                expected, 
+                names,
+                False)
+            if isinstance(step, CompareResult) and step is not MATCH:
+                budget.skipped += 1
+                return MISMATCH
+            # Everything inside is compared with the budget spent too,
+            # so this can only come to MATCH or MISMATCH
+            return step
+        elif budget.max_depth is not None and budget.depth >= budget.max_depth:
+            step = cls.dispatch_step(
+                expected,
                 actual,
                 type_compare,
-                iter_type=list,
-                names=names)
+                names,
+                True)
+            if isinstance(step, CompareResult):
+                return budget.summarize(step, expected, actual)
+            return cls.summarized_steps(budget, step, expected, actual)
+
+        step = cls.dispatch_step(expected, actual, type_compare, names, False)
+        if isinstance(step, CompareResult) and step is not MATCH:
+            budget.mismatches += 1
+        return step
 
-        elif (isinstance(expected, StructuredString) and 
-                isinstance(actual, six.string_types)):
-            return cls.structured_string_compare(
+    @classmethod
+    def summarized_steps(cls, budget, step, expected, actual):
+        result = yield step
+        return budget.summarize(result, expected, actual)
+
+    @classmethod
+    def dispatch_step(cls, expected, actual, type_compare, names, fail_fast):
+        '''compare_step, without a DiffBudget'''
+        while True:
+            type_compare = normalize_type_compare(
+                type_compare)
+            if expected is DontCare:
+                expected = DontCare()
+
+            expected_type = type(expected)
+            actual_type = type(actual)
+            # Looked up once - if it's replaced while the comparer is
+            # being found, the comparer is only stored in the old one
+            cache = comparer_cache
+            comparer = cache.get((expected_type, actual_type))
+            if comparer is None:
+                comparer = find_comparer(expected, actual)
+                # isinstance goes by __class__, which some objects (like
+                # mocks with a spec) fake.  Those can't be cached by type.
+                if (expected.__class__ is expected_type and
+                        actual.__class__ is actual_type):
+                    if len(cache) >= max_cached_comparers:
+                        cache.clear()
+                    cache[(expected_type, actual_type)] = comparer
+
+            if (comparer is not compare_type_compare_hint and
+                    type_compare['ordered'] and
+                    type_compare['list'] == 'existing'):
+                raise kobold.ValidationError(
+                    'Ordered list compare must always be "full", not "existing"')
+
+            step = comparer(
+                cls,
                 expected,
                 actual,
                 type_compare,
-                names=names)
-
-        else:
-            if expected == actual:
-                return 'match'
-            else:
-                return (expected, actual)
+                names,
+                fail_fast)
+            if type(step) is tuple:
+                # Compare something else in place of expected and actual
+                expected, actual, type_compare = step
+                continue
+            return step
 
     @classmethod
     def hash_compare(cls,
                      expected,
                      actual,
                      type_compare={},
-                     names=None):
+                     names=None,
+                     fail_fast=False):
         if names is None:
             names = {}
-        default_type_compare =\
-            {'hash' : 'full',
-             'dontcare_keys' : [],
-             'ordered' : True}
-        type_compare =\
-            combine(default_type_compare, type_compare)
+        return cls.run(cls.hash_compare_steps(
+            expected,
+            actual,
+            normalize_type_compare(type_compare),
+            names,
+            fail_fast))
+
+    @classmethod
+    def hash_compare_steps(cls, expected, actual, type_compare, names, fail_fast):
         if '__compare' in expected:
             compare_override = expected['__compare']
             if acts_like_a_hash(compare_override):
-                type_compare = combine(default_type_compare, compare_override)
+                type_compare = normalize_type_compare(compare_override)
+            elif isinstance(compare_override, str):
+                type_compare = type_compare.derive(compare_override)
             else:
-                type_compare['hash'] = compare_override
+                type_compare = type_compare.derive(
+                    {'hash': compare_override})
             expected = dict((k, v) for (k, v) in expected.items() if k != '__compare')
 
-        expected_return = {}
-        actual_return = {}
+        mismatched = {}
+        skipped = False
 
+        # In a fixed order (expected's, then any only in actual), so
+        # that a DiffBudget always records the same mismatches
+        keys = list(expected.keys())
         if type_compare['hash'] == 'full':
-            keys = set([])
-            keys.update(expected.keys())
-            keys.update(actual.keys())
-        else:
-            keys = set(expected.keys())
+            keys.extend(key for key in actual.keys() if key not in expected)
 
         for key in keys:
             if key in type_compare['dontcare_keys']:
-                result = cls.compare(
-                    DontCare, 
+                result = yield cls.compare_step(
+                    DontCare,
                     actual.get(key, kobold.NotPresent),
                     type_compare,
-                    names=names)
+                    names,
+                    fail_fast)
             else:
-                result = cls.compare(
+                result = yield cls.compare_step(
                     expected.get(key, kobold.NotPresent),
                     actual.get(key, kobold.NotPresent),
                     type_compare,
-                    names=names)
-
-            if result != 'match':
-                expected_sub, actual_sub = result
-                expected_return[key] = expected_sub
-                actual_return[key] = actual_sub
+                    names,
+                    fail_fast)
+
+            if result is not MATCH:
+                if fail_fast or result is MISMATCH:
+                    # (Or, with a DiffBudget, a mismatch that was only
+                    # counted - see budgeted_step)
+                    skipped = True
+                    if fail_fast:
+                        return MISMATCH
+                else:
+                    mismatched[key] = result
 
-        if len(expected_return) == 0:
-            return 'match'
+        if len(mismatched) == 0:
+            return MISMATCH if skipped else MATCH
         else:
-            return (expected_return, actual_return)
+            return HashMismatch(mismatched)
 
     @classmethod
     def ordered_list_compare(
@@ -376,11 +963,32 @@ class Compare(object):
             actual,
             type_compare,
             iter_type=list,
-            names=None):
+            names=None,
+            fail_fast=False):
         if names is None:
             names = {}
-        expected_elements = ListDiff(display_type=iter_type)
-        actual_elements = ListDiff(display_type=iter_type)
+        return cls.run(cls.ordered_list_compare_steps(
+            expected,
+            actual,
+            normalize_type_compare(type_compare),
+            iter_type,
+            names,
+            fail_fast))
+
+    @classmethod
+    def ordered_list_compare_steps(
+            cls,
+            expected,
+            actual,
+            type_compare,
+            iter_type,
+            names,
+            fail_fast):
+        # The mismatched entries, and how many entries the diff
+        # of each list will have
+        entries = []
+        position = 0
+        skipped = False
 
         expected_index = 0
         for actual_index in range(max(len(expected), len(actual))):
@@ -388,7 +996,7 @@ class Compare(object):
                 expected_value = kobold.NotPresent
             else:
                 expected_value = expected[expected_index]
-                
+
             if len(actual) > actual_index:
                 actual_value = actual[actual_index]
             else:
@@ -402,7 +1010,7 @@ class Compare(object):
             # *don't* increment the expected_index for the next run,
             # since a MultiMatch can match multiple elements in the list.
             #
-            # If this is not a MultiMatch, always increment the 
+            # If this is not a MultiMatch, always increment the
             # expected_index
 
             if isinstance(expected_value, MultiMatch):
@@ -411,46 +1019,312 @@ class Compare(object):
                     if lookahead_index < len(expected):
                         lookahead_value = expected[lookahead_index]
 
-                        lookahead_result = cls.compare(
+                        lookahead_result = yield cls.compare_step(
                             lookahead_value,
                             actual_value,
                             type_compare,
-                            names=names)
-                        if lookahead_result == 'match':
+                            names,
+                            False)
+                        if lookahead_result is MATCH:
                             expected_index += 1
                             continue
             else:
                 expected_index += 1
 
-            result = cls.compare(expected_value,
-                                 actual_value,
-                                 type_compare,
-                                 names=names)
-            if result == 'match':
-                expected_elements.append_match()
-                actual_elements.append_match()
-            else:
-                expected_sub, actual_sub = result
-                expected_elements.append(expected_sub)
-                actual_elements.append(actual_sub)
+            result = yield cls.compare_step(
+                expected_value,
+                actual_value,
+                type_compare,
+                names,
+                fail_fast)
+            if result is not MATCH:
+                if fail_fast:
+                    return MISMATCH
+                elif result is MISMATCH:
+                    # Only counted, with a DiffBudget
+                    skipped = True
+                else:
+                    entries.append((position, position, result))
+            position += 1
 
-        if (len(expected_elements) == 0 and
-            len(actual_elements) == 0):
-            return 'match'
+        if len(entries) == 0:
+            return MISMATCH if skipped else MATCH
         else:
-            return (expected_elements.display(),
-                    actual_elements.display())
+            return ListMismatch(
+                entries,
+                position,
+                position,
+                iter_type,
+                truncated=skipped)
 
     @classmethod
-    def unordered_list_compare(
+    def aligned_list_compare(
             cls,
             expected,
             actual,
             type_compare,
             iter_type=list,
             names=None):
-        # Make a list of all the indexes of the "expected" list 
-        # and the "actual" list.  
+        if names is None:
+            names = {}
+        return cls.run(cls.aligned_list_compare_steps(
+            expected,
+            actual,
+            normalize_type_compare(type_compare),
+            iter_type,
+            names))
+
+    @classmethod
+    def aligned_list_compare_steps(
+            cls,
+            expected,
+            actual,
+            type_compare,
+            iter_type,
+            names):
+        # Line the two lists up with Myers' O(ND) diff, using kobold
+        # comparison (rather than ==) to decide whether two elements
+        # are the same.  Unlike ordered_list_compare, an element that
+        # was inserted or removed only shows up once in the diff -
+        # everything after it is still lined up with its partner.
+        #
+        # In the returned diff, the expected list has an entry for each
+        # expected element, and the actual list has one for each actual
+        # element.  Where a run of removed elements sits opposite a run
+        # of inserted elements, they're paired up in order and diffed
+        # with each other.
+        probes = {}
+        bindings = Bindings.of(names)
+
+        def probe(expected_index, actual_index, full=False):
+            # Each pair is only ever compared once.  The names bound by
+            # every pair are rolled back, and only bound again for pairs
+            # that end up lined up with each other.
+            key = (expected_index, actual_index)
+            probed = probes.get(key)
+            if probed is None:
+                return probe_steps(key, full)
+            return probed[0]
+
+        def probe_steps(key, full):
+            checkpoint = bindings.checkpoint()
+            result = yield cls.compare_step(
+                expected[key[0]],
+                actual[key[1]],
+                type_compare,
+                bindings,
+                not full)
+            probes[key] = (result, bindings.changes_since(checkpoint), full)
+            bindings.rollback(checkpoint)
+            return result
+
+        # Trim the common prefix and suffix.  When the lists match, this
+        # is the only pass over them.  The first pair that doesn't match
+        # at each end is compared in full, rather than failing fast, as
+        # it's often lined up in the end anyway - and comparing it twice
+        # (once to find it doesn't match, and once for its diff) would
+        # make nested lists take time quadratic in how deep they go.
+        # (Not with a DiffBudget, which counts every mismatch compared
+        # in full.)
+        full = current_diff_budget.get() is None
+        expected_len = len(expected)
+        actual_len = len(actual)
+        start = 0
+        while (start < expected_len and start < actual_len and
+                (yield probe(start, start, full)) is MATCH):
+            start += 1
+        expected_end = expected_len
+        actual_end = actual_len
+        while (expected_end > start and actual_end > start and
+                (yield probe(expected_end - 1, actual_end - 1, full))
+                is MATCH):
+            expected_end -= 1
+            actual_end -= 1
+
+        if (start == expected_len and start == actual_len and
+                not any(probes[(i, i)][1] for i in range(start))):
+            return MATCH
+
+        edits = [('equal', i, i) for i in range(start)]
+        middle = yield from cls.myers_edits(
+            expected_end - start,
+            actual_end - start,
+            lambda x, y: probe(start + x, start + y))
+        if middle is None:
+            # Too many differences for alignment to be worth it
+            ret = yield from cls.ordered_list_compare_steps(
+                expected,
+                actual,
+                type_compare,
+                iter_type,
+                bindings,
+                False)
+            bindings.keep(names)
+            return ret
+        for (edit, x, y) in middle:
+            edits.append((
+                edit,
+                None if x is None else start + x,
+                None if y is None else start + y))
+        offset = actual_end - expected_end
+        edits.extend(
+            ('equal', i, i + offset)
+            for i in range(expected_end, expected_len))
+        edits.append(('end', None, None))
+
+        entries = []
+        skipped = False
+        removed = []
+        inserted = []
+        for (edit, expected_index, actual_index) in edits:
+            if edit == 'remove':
+                removed.append(expected_index)
+                continue
+            elif edit == 'insert':
+                inserted.append(actual_index)
+                continue
+
+            # The end of a run of changes - pair up what was
+            # removed with what was inserted
+            for (i, j) in zip(removed, inserted):
+                result = None
+                probed = probes.get((i, j))
+                if probed is not None and probed[2]:
+                    # Already compared in full
+                    if bindings.consistent(probed[1]):
+                        bindings.update(probed[1])
+                        result = probed[0]
+                if result is None:
+                    result = yield cls.compare_step(
+                        expected[i],
+                        actual[j],
+                        type_compare,
+                        bindings,
+                        False)
+                if result is MISMATCH:
+                    # Only counted, with a DiffBudget
+                    skipped = True
+                elif result is not MATCH:
+                    entries.append((i, j, result))
+            only_removed = removed[len(inserted):]
+            only_inserted = inserted[len(removed):]
+            recorded = mismatches_to_record(len(only_removed))
+            for i in only_removed[:recorded]:
+                entries.append((
+                    i,
+                    None,
+                    display_mismatch(cls, expected[i], kobold.NotPresent)))
+            if recorded < len(only_removed):
+                skipped = True
+            recorded = mismatches_to_record(len(only_inserted))
+            for j in only_inserted[:recorded]:
+                entries.append((
+                    None,
+                    j,
+                    display_mismatch(cls, kobold.NotPresent, actual[j])))
+            if recorded < len(only_inserted):
+                skipped = True
+            removed = []
+            inserted = []
+
+            if edit == 'equal':
+                changes = probes[(expected_index, actual_index)][1]
+                if changes:
+                    if bindings.consistent(changes):
+                        bindings.update(changes)
+                    else:
+                        # Lined up, but binds a name differently than
+                        # an earlier element did
+                        result = yield cls.compare_step(
+                            expected[expected_index],
+                            actual[actual_index],
+                            type_compare,
+                            bindings,
+                            False)
+                        if result is MISMATCH:
+                            skipped = True
+                        elif result is not MATCH:
+                            entries.append(
+                                (expected_index, actual_index, result))
+
+        bindings.keep(names)
+        if not entries:
+            return MISMATCH if skipped else MATCH
+        return ListMismatch(
+            entries,
+            expected_len,
+            actual_len,
+            iter_type,
+            truncated=skipped)
+
+    @classmethod
+    def myers_edits(cls, expected_len, actual_len, same):
+        '''The shortest edit script that turns a list of length
+           expected_len into a list of length actual_len, where
+           same(x, y) returns a step whose result is MATCH if element x
+           of the first list is the same as element y of the second.
+
+           This is a generator of steps (see run), which returns a list
+           of ('equal', x, y), ('remove', x, None) and ('insert', None, y)
+           tuples in list order, or None if more than
+           max_alignment_edits edits would be needed.'''
+        max_edits = min(expected_len + actual_len, max_alignment_edits)
+        frontier = {1: 0}
+        trace = []
+        for edit_count in range(max_edits + 1):
+            trace.append(frontier.copy())
+            for diagonal in range(-edit_count, edit_count + 1, 2):
+                if (diagonal == -edit_count or
+                        (diagonal != edit_count and
+                            frontier[diagonal - 1] < frontier[diagonal + 1])):
+                    x = frontier[diagonal + 1]
+                else:
+                    x = frontier[diagonal - 1] + 1
+                y = x - diagonal
+                while (x < expected_len and y < actual_len and
+                        (yield same(x, y)) is MATCH):
+                    x += 1
+                    y += 1
+                frontier[diagonal] = x
+                if x >= expected_len and y >= actual_len:
+                    return cls.myers_backtrack(
+                        trace,
+                        expected_len,
+                        actual_len)
+        return None
+
+    @classmethod
+    def myers_backtrack(cls, trace, x, y):
+        edits = []
+        for edit_count in range(len(trace) - 1, -1, -1):
+            frontier = trace[edit_count]
+            diagonal = x - y
+            if (diagonal == -edit_count or
+                    (diagonal != edit_count and
+                        frontier[diagonal - 1] < frontier[diagonal + 1])):
+                previous_diagonal = diagonal + 1
+            else:
+                previous_diagonal = diagonal - 1
+            previous_x = frontier[previous_diagonal]
+            previous_y = previous_x - previous_diagonal
+            while x > previous_x and y > previous_y:
+                x -= 1
+                y -= 1
+                edits.append(('equal', x, y))
+            if edit_count > 0:
+                if x == previous_x:
+                    edits.append(('insert', None, previous_y))
+                else:
+                    edits.append(('remove', previous_x, None))
+            x = previous_x
+            y = previous_y
+        edits.reverse()
+        return edits
+
+    @classmethod
+    def first_fit_match(cls, expected, actual, type_compare, names):
+        # Make a list of all the indexes of the "expected" list
+        # and the "actual" list.
         # Iterate through the "expected" list.  For each item,
         # try to find a corresponding match in the "actual" list
         # (by iterating through that - n^2 style).
@@ -461,16 +1335,15 @@ class Compare(object):
         #
         # A lot of the complexity here is that we're iterating over
         # lists of indexes (expected and actual) and removing items
-        # from the list as we go.  The next iteration is +1 if we don't 
+        # from the list as we go.  The next iteration is +1 if we don't
         # remove an element, but is +0 if we *do* remove an element.
         # There should be a saner way of going about this.
-
-        if names is None:
-            names = {}
-        candidate_names = names.copy()
-
-        child_names_list = []
-        
+        #
+        # MultiMatch elements are skipped, and their indexes returned
+        # separately.  names (Bindings) is updated with the names bound
+        # by each pairing, and pairings that don't match are rolled back.
+        #
+        # This is a generator of steps (see run).
         multimatch_indexes = []
         missing_expected_indexes = list(range(len(expected)))
         missing_actual_indexes = list(range(len(actual)))
@@ -484,31 +1357,184 @@ class Compare(object):
                 continue
             actual_index_index = 0
             while actual_index_index < len(missing_actual_indexes):
-                child_names = {}
                 actual_index = missing_actual_indexes[actual_index_index]
                 actual_element = actual[actual_index]
-                result = cls.compare(expected_element, 
-                                     actual_element, 
-                                     type_compare,
-                                     names=child_names)
-                if result == 'match':
-                    names_result = cls.compare(
-                        candidate_names,
-                        child_names,
-                        type_compare='existing')
-                    if names_result == 'match':
-                        candidate_names.update(child_names)
-                    else:
-                        continue
+                checkpoint = names.checkpoint()
+                result = yield cls.compare_step(
+                    expected_element,
+                    actual_element,
+                    type_compare,
+                    names,
+                    True)
+                if result is MATCH:
                     missing_expected_indexes.pop(expected_index_index)
                     missing_actual_indexes.pop(actual_index_index)
                     expected_index_index -= 1
                     actual_index_index -= 1
                     break
+                names.rollback(checkpoint)
                 actual_index_index += 1
             expected_index_index += 1
 
-        # Take a second pass through the actual list and try to 
+        return (
+            missing_expected_indexes,
+            missing_actual_indexes,
+            multimatch_indexes)
+
+    @classmethod
+    def optimal_match(cls, expected, actual, type_compare, names):
+        # Compare every expected element with every actual element
+        # (once each) to build a graph of which pairs are compatible,
+        # and then find the largest set of pairs that can be made
+        # at the same time.  Unlike first_fit_match, an element that
+        # could match anything (like a DontCare) can't steal the only
+        # partner of a more specific element.
+        #
+        # Names bound by each pair are rolled back, and checked for
+        # consistency afterwards, in expected order.  A pair whose names
+        # conflict with the names bound so far is left unmatched.
+        #
+        # Returns the same thing as first_fit_match, and is also a
+        # generator of steps.
+        multimatch_indexes = []
+        left_indexes = []
+        adjacency = []
+        pair_names = {}
+        for expected_index, expected_element in enumerate(expected):
+            if isinstance(expected_element, MultiMatch):
+                multimatch_indexes.append(expected_index)
+                continue
+            rights = []
+            for actual_index, actual_element in enumerate(actual):
+                checkpoint = names.checkpoint()
+                result = yield cls.compare_step(
+                    expected_element,
+                    actual_element,
+                    type_compare,
+                    names,
+                    True)
+                if result is MATCH:
+                    rights.append(actual_index)
+                    if names.checkpoint() > checkpoint:
+                        pair_names[(expected_index, actual_index)] =\
+                            names.changes_since(checkpoint)
+                names.rollback(checkpoint)
+            left_indexes.append(expected_index)
+            adjacency.append(rights)
+
+        match_left = matching.maximum_matching(
+            adjacency,
+            len(actual))
+
+        missing_expected_indexes = list(multimatch_indexes)
+        matched_actual_indexes = set()
+        for left, expected_index in enumerate(left_indexes):
+            actual_index = match_left[left]
+            if actual_index is not None:
+                changes = pair_names.get((expected_index, actual_index))
+                if changes:
+                    if names.consistent(changes):
+                        names.update(changes)
+                    else:
+                        actual_index = None
+
+            if actual_index is None:
+                missing_expected_indexes.append(expected_index)
+            else:
+                matched_actual_indexes.add(actual_index)
+
+        missing_expected_indexes.sort()
+        missing_actual_indexes = [
+            actual_index for actual_index in range(len(actual))
+            if actual_index not in matched_actual_indexes]
+        return (
+            missing_expected_indexes,
+            missing_actual_indexes,
+            multimatch_indexes)
+
+    @classmethod
+    def unordered_list_compare(
+            cls,
+            expected,
+            actual,
+            type_compare,
+            iter_type=list,
+            names=None,
+            fail_fast=False):
+        if names is None:
+            names = {}
+        return cls.run(cls.unordered_list_compare_steps(
+            expected,
+            actual,
+            normalize_type_compare(type_compare),
+            iter_type,
+            names,
+            fail_fast))
+
+    @classmethod
+    def unordered_list_compare_steps(
+            cls,
+            expected,
+            actual,
+            type_compare,
+            iter_type,
+            names,
+            fail_fast):
+        # Names are bound as the elements are paired up, and only kept
+        # if the lists match
+        bindings = Bindings.of(names)
+        checkpoint = bindings.checkpoint()
+        ret = yield from cls.unordered_list_match_steps(
+            expected,
+            actual,
+            type_compare,
+            iter_type,
+            bindings,
+            fail_fast)
+        if ret is MATCH:
+            bindings.keep(names)
+        else:
+            bindings.rollback(checkpoint)
+        return ret
+
+    @classmethod
+    def unordered_list_match_steps(
+            cls,
+            expected,
+            actual,
+            type_compare,
+            iter_type,
+            names,
+            fail_fast):
+        # When the elements can be matched by hashing, do that.
+        # Otherwise, fall back to trying every pairing.
+        matching_mode = type_compare.get('matching', 'first_fit')
+        bucketed = cls.hash_bucket_match(expected, actual, type_compare)
+        if bucketed is not None:
+            missing_expected_indexes, missing_actual_indexes = bucketed
+            multimatch_indexes = []
+        elif matching_mode == 'first_fit':
+            (missing_expected_indexes,
+             missing_actual_indexes,
+             multimatch_indexes) = yield from cls.first_fit_match(
+                expected,
+                actual,
+                type_compare,
+                names)
+        elif matching_mode == 'optimal':
+            (missing_expected_indexes,
+             missing_actual_indexes,
+             multimatch_indexes) = yield from cls.optimal_match(
+                expected,
+                actual,
+                type_compare,
+                names)
+        else:
+            raise NotImplementedError(
+                'Invalid value for matching type_compare '
+                'setting: {}'.format(matching_mode))
+
+        # Take a second pass through the actual list and try to
         # match against any MultiMatches
         actual_index_index = 0
         while actual_index_index < len(missing_actual_indexes):
@@ -517,12 +1543,13 @@ class Compare(object):
             matched = []
             for multimatch_index in multimatch_indexes:
                 expected_element = expected[multimatch_index]
-                result = cls.compare(
+                result = yield cls.compare_step(
                     expected_element,
                     actual_element,
                     type_compare,
-                    names=names)
-                if result == 'match':
+                    names,
+                    False)
+                if result is MATCH:
                     matched.append(expected_element)
 
             for multimatch in matched:
@@ -545,6 +1572,31 @@ class Compare(object):
                 if expected_element.matched():
                     missing_expected_indexes.remove(index)
 
+        if fail_fast:
+            if type_compare['list'] not in ('full', 'existing'):
+                raise NotImplementedError(
+                    'Invalid value for list match type_compare '
+                    'setting: {}'.format(
+                        type_compare['list']))
+            if (len(missing_expected_indexes) > 0 or
+                    (type_compare['list'] == 'full' and
+                     len(missing_actual_indexes) > 0)):
+                return MISMATCH
+            return MATCH
+
+        if type_compare['list'] == 'full':
+            if (len(missing_expected_indexes) == 0 and
+                len(missing_actual_indexes) == 0):
+                return MATCH
+        elif type_compare['list'] == 'existing':
+            if len(missing_expected_indexes) == 0:
+                return MATCH
+        else:
+            raise NotImplementedError(
+                'Invalid value for list match type_compare '
+                'setting: {}'.format(
+                    type_compare['list']))
+
         # The remaining elements in the expected and actual
         # lists (the elements that didn't have a partner in the
         # other list) are all still "full".  My theory (unsubstantiated)
@@ -554,14 +1606,16 @@ class Compare(object):
         # I figure, let's diff the missing elements from the "expected" 
         # list with the missing elements from the "actual" list in order.
         # That should at least give us friendlier output.
-        # So, this section gets us the ordered diffs of the remaining
-        # elements
-        max_len = max(len(expected), len(actual))
-        displayed_expecteds = [None] * max_len
-        displayed_actuals = [None] * max_len
-
-        for i in range(max(len(missing_expected_indexes),
-                           len(missing_actual_indexes))):
+        # So, this section pairs up the remaining elements for display.
+        # The diffs themselves aren't worked out unless they're asked for.
+        pair_count = max(
+            len(missing_expected_indexes),
+            len(missing_actual_indexes))
+        recorded = mismatches_to_record(pair_count)
+        if recorded == 0:
+            return MISMATCH
+        entries = []
+        for i in range(recorded):
             if i < len(missing_expected_indexes):
                 missing_expected_index = missing_expected_indexes[i]
                 missing_expected = expected[missing_expected_index]
@@ -576,75 +1630,95 @@ class Compare(object):
                 missing_actual_index = None
                 missing_actual = kobold.NotPresent
 
-            displayed_expected = cls.display(
-                    missing_expected,
-                    missing_actual)
-            displayed_actual = cls.display(
-                    missing_actual,
-                    missing_expected)
-
-
-            if missing_expected_index is not None:
-                displayed_expecteds[missing_expected_index] = displayed_expected
-
-            if missing_actual_index is not None:
-                displayed_actuals[missing_actual_index] = displayed_actual
-
-        # For each element of the expected and actual lists,
-        # if there was a match, just append the "match" character
-        # (_).  If there wasn't a match, append the in-order diff
-        # from above.
-        expected_return = ListDiff(display_type=iter_type)
-        actual_return = ListDiff(display_type=iter_type)
-        for i in range(len(expected)):
-            if i in missing_expected_indexes:
-                expected_return.append(displayed_expecteds[i])
-            else:
-                expected_return.append_match()
+            entries.append((
+                missing_expected_index,
+                missing_actual_index,
+                display_mismatch(cls, missing_expected, missing_actual)))
 
-        for j in range(len(actual)):
-            if j in missing_actual_indexes:
-                actual_return.append(displayed_actuals[j])
-            else:
-                actual_return.append_match()
+        # Matched elements show up as the "match" character (_) in
+        # the diff of each list
+        return ListMismatch(
+            entries,
+            len(expected),
+            len(actual),
+            iter_type,
+            truncated=recorded < pair_count)
+
+    @classmethod
+    def hash_bucket_match(cls, expected, actual, type_compare):
+        '''A linear-time replacement for the pairwise search in
+           unordered_list_compare, for when every expected element
+           can only ever match an actual element that is equal to it,
+           and every actual element is a plain value (see
+           is_plain_expected and is_plain_value).  Actual elements are bucketed by
+           their hashable form, and each expected element takes the
+           first remaining actual element from its bucket - the same
+           pairing that the pairwise search would make.
+
+           Returns the (missing_expected_indexes, missing_actual_indexes)
+           that the pairwise search would have left, or None if the
+           fast path doesn't apply.'''
+        for element in expected:
+            if not is_plain_expected(element, type_compare):
+                return None
+
+        try:
+            buckets = {}
+            for actual_index, element in enumerate(actual):
+                if not is_plain_value(element):
+                    # Its __eq__ could match more than what's equal
+                    # to it in a bucket
+                    return None
+                key = hash_functions.make_hashable(element)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = collections.deque()
+                bucket.append(actual_index)
+
+            missing_expected_indexes = []
+            for expected_index, element in enumerate(expected):
+                bucket = buckets.get(hash_functions.make_hashable(element))
+                if bucket:
+                    bucket.popleft()
+                else:
+                    missing_expected_indexes.append(expected_index)
+        except (TypeError, RecursionError):
+            # Something in the actual list can't be hashed (or has keys
+            # that can't be sorted, or is nested too deeply to hash)
+            return None
+
+        missing_actual_indexes = sorted(
+            actual_index
+            for bucket in buckets.values()
+            for actual_index in bucket)
+        return (missing_expected_indexes, missing_actual_indexes)
 
-        if type_compare['list'] == 'full':
-            if (len(expected_return) == 0 and
-                len(actual_return) == 0):
-                names.update(candidate_names)
-                return 'match'
-            else:
-                return (expected_return.display(),
-                        actual_return.display())
-        elif type_compare['list'] == 'existing':
-            if len(expected_return) == 0:
-                names.update(candidate_names)
-                return 'match'
-            else:
-                return (expected_return.display(),
-                        actual_return.display())
-        else:
-            raise NotImplementedError(
-                'Invalid value for list match type_compare '
-                'setting: {}'.format(
-                    type_compare['list']))
-                                 
     @classmethod
     def list_compare(cls,
                      expected,
                      actual,
                      type_compare,
                      iter_type=list,
-                     names=None):
+                     names=None,
+                     fail_fast=False):
         if names is None:
             names = {}
-        default_type_compare =\
-            {'hash' : 'full',
-             'ordered' : True}
-
-        type_compare =\
-            combine(default_type_compare, type_compare)
+        return cls.run(cls.list_compare_steps(
+            expected,
+            actual,
+            normalize_type_compare(type_compare),
+            iter_type,
+            names,
+            fail_fast))
 
+    @classmethod
+    def list_compare_steps(cls,
+                           expected,
+                           actual,
+                           type_compare,
+                           iter_type,
+                           names,
+                           fail_fast):
         if type(expected) == set and type(actual) == set:
             isset = True
             expected = list(expected)
@@ -653,69 +1727,200 @@ class Compare(object):
             isset = False
 
         if (isinstance(expected, OrderedList) or
-                (type_compare['ordered'] and 
-                    not isset and 
+                (type_compare['ordered'] and
+                    not isset and
                     not isinstance(expected, UnorderedList)
                 )
             ):
-            ret = cls.ordered_list_compare(
-                expected,
-                actual,
-                type_compare,
-                iter_type=iter_type,
-                names=names)
+            # Alignment only changes how the diff is displayed, so
+            # there's no need for it when failing fast
+            alignment = type_compare.get('alignment', 'index')
+            tolerance = type_compare.get('float')
+            if (tolerance is not None and
+                    (alignment == 'index' or
+                        (alignment == 'myers' and fail_fast)) and
+                    is_number_list(expected) and
+                    is_number_list(actual)):
+                ret = cls.number_list_compare(
+                    expected,
+                    actual,
+                    tolerance,
+                    iter_type,
+                    fail_fast)
+            elif (alignment == 'myers' and
+                    not fail_fast and
+                    not any(isinstance(element, MultiMatch)
+                            for element in expected)):
+                ret = yield from cls.aligned_list_compare_steps(
+                    expected,
+                    actual,
+                    type_compare,
+                    iter_type,
+                    names)
+            elif alignment in ('index', 'myers'):
+                ret = yield from cls.ordered_list_compare_steps(
+                    expected,
+                    actual,
+                    type_compare,
+                    iter_type,
+                    names,
+                    fail_fast)
+            else:
+                raise NotImplementedError(
+                    'Invalid value for alignment type_compare '
+                    'setting: {}'.format(alignment))
         else:
-            ret = cls.unordered_list_compare(
+            ret = yield from cls.unordered_list_compare_steps(
                 expected,
                 actual,
                 type_compare,
-                iter_type=iter_type,
-                names=names)
-        if ret == 'match' or not isset:
+                iter_type,
+                names,
+                fail_fast)
+        if ret is MATCH or not isset or fail_fast:
             return ret
         else:
-            ret_exp, ret_act = ret
-            ret_exp = [x for x in ret_exp if x != '_']
-            ret_act = [x for x in ret_act if x != '_']
-            return (set(ret_exp), set(ret_act))
+            return SetMismatch(ret)
+
+
+    @classmethod
+    def number_list_compare(cls,
+                            expected,
+                            actual,
+                            tolerance,
+                            iter_type,
+                            fail_fast):
+        '''Compare two lists of numbers within tolerance (a "float"
+           type_compare setting) all at once - with numpy, for long
+           enough lists, when it's installed'''
+        length = min(len(expected), len(actual))
+        mismatched = None
+        if length >= min_numpy_list_length:
+            mismatched = numpy_number_mismatches(
+                expected[:length],
+                actual[:length],
+                tolerance)
+        if mismatched is None:
+            mismatched = [
+                index
+                for (index, (expected_element, actual_element))
+                in enumerate(zip(expected, actual))
+                if not (expected_element == actual_element or
+                        numbers_close(
+                            expected_element,
+                            actual_element,
+                            tolerance))]
+
+        position = max(len(expected), len(actual))
+        if not mismatched and len(expected) == len(actual):
+            return MATCH
+        elif fail_fast:
+            return MISMATCH
+
+        count = len(mismatched) + position - length
+        recorded = mismatches_to_record(count)
+        if recorded == 0:
+            return MISMATCH
+        entries = [
+            (index, index, Mismatch(expected[index], actual[index]))
+            for index in mismatched[:recorded]]
+        for index in range(length, length + recorded - len(entries)):
+            if index < len(expected):
+                entries.append(
+                    (index, index, Mismatch(expected[index], NotPresent)))
+            else:
+                entries.append(
+                    (index, index, Mismatch(NotPresent, actual[index])))
+        return ListMismatch(
+            entries,
+            position,
+            position,
+            iter_type,
+            truncated=recorded < count)
 
 
     # These "display" functions are used by the unordered list comparison
     # for intelligently displaying unordered diffs of lists
     @classmethod
     def display(cls, element, other_element):
-        if element is DontCare:
-            element = DontCare()
-        if isinstance(element, DontCare):
-            return str(element)
-        elif acts_like_a_hash(element) and acts_like_a_hash(other_element):
-            return cls.display_hash(element, other_element)
-        elif isinstance(element, tuple) and isinstance(other_element, tuple):
-            return cls.display_list(element, other_element, iter_type=tuple)
-        elif acts_like_a_list(element) and acts_like_a_list(other_element):
-            return cls.display_list(element, other_element, iter_type=list)
-        elif type(element) == pattern_type:
-            return 'regex: %s' % element.pattern
-        elif isinstance(other_element, hints.ParsingHint):
-            try:
-                return cls.display(
-                    other_element.parse(element),
-                    other_element.payload)
-            except kobold.InvalidMatch:
-                return cls.display(
+        # Like the comparison, this works through the two values with
+        # an explicit stack.  Each entry is a pair of values to display,
+        # and where to put the result (a slot in a list, or a key in a
+        # dict).  Tuples are built as lists, and converted once their
+        # contents are done - innermost first.
+        root = [None]
+        tuples = []
+        stack = [(element, other_element, root, 0)]
+        while stack:
+            element, other_element, target, slot = stack.pop()
+            while True:
+                if element is DontCare:
+                    element = DontCare()
+                if isinstance(element, DontCare):
+                    displayed = str(element)
+                elif (acts_like_a_hash(element) and
+                        acts_like_a_hash(other_element)):
+                    displayed = {}
+                    for key in element.keys():
+                        displayed[key] = None
+                        stack.append((
+                            element.get(key),
+                            other_element.get(key),
+                            displayed,
+                            key))
+                elif (acts_like_a_list(element) and
+                        acts_like_a_list(other_element)):
+                    if (isinstance(element, tuple) and
+                            isinstance(other_element, tuple)):
+                        tuples.append((target, slot))
+                    displayed = cls.display_slots(
                         element,
-                        other_element.payload)
-        elif isinstance(element, hints.ParsingHint):
-            try:
-                return cls.display(
-                        element.payload,
-                        element.parse(other_element))
-            except kobold.InvalidMatch:
-                return cls.display(
-                        element.payload,
-                        other_element)
-        else:
-            return element
+                        other_element,
+                        stack)
+                elif type(element) == pattern_type:
+                    displayed = 'regex: %s' % element.pattern
+                elif isinstance(other_element, hints.ParsingHint):
+                    try:
+                        element = parse_hint(other_element, element)
+                    except kobold.InvalidMatch:
+                        pass
+                    other_element = other_element.payload
+                    continue
+                elif isinstance(element, hints.ParsingHint):
+                    try:
+                        other_element = parse_hint(element, other_element)
+                    except kobold.InvalidMatch:
+                        pass
+                    element = element.payload
+                    continue
+                else:
+                    displayed = element
+                break
+            target[slot] = displayed
+
+        for (target, slot) in reversed(tuples):
+            target[slot] = tuple(target[slot])
+        return root[0]
+
+    @classmethod
+    def display_slots(cls, one_list, other_list, stack):
+        # A list with a slot for each element of the longer list,
+        # with the work of filling them in pushed onto stack
+        max_len = max(len(one_list), len(other_list))
+        display_list = [None] * max_len
+        for i in range(max_len):
+            if i > len(one_list) - 1:
+                element = kobold.NotPresent
+            else:
+                element = one_list[i]
+
+            if i > len(other_list) - 1:
+                other_element = kobold.NotPresent
+            else:
+                other_element = other_list[i]
+
+            stack.append((element, other_element, display_list, i))
+        return display_list
 
     @classmethod
     def display_hash(cls, one_hash, other_hash):
@@ -750,51 +1955,707 @@ class Compare(object):
             expected,
             actual,
             type_compare={},
-            names=None):
-        default_type_compare =\
-            {'hash' : 'full',
-             'dontcare_keys' : [],
-             'ordered' : True}
-        type_compare =\
-            combine(default_type_compare, type_compare)
+            names=None,
+            fail_fast=False):
+        if names is None:
+            names = {}
+        return cls.run(cls.structured_string_compare_steps(
+            expected,
+            actual,
+            normalize_type_compare(type_compare),
+            names,
+            fail_fast))
 
+    @classmethod
+    def structured_string_compare_steps(
+            cls,
+            expected,
+            actual,
+            type_compare,
+            names,
+            fail_fast):
         match = expected.regex.match(actual)
         if match:
-            groups = match.groups()
-            return cls.compare(
+            return (yield cls.compare_step(
                 expected.arguments,
                 match.groups(),
-                type_compare=type_compare,
-                names=names)
+                type_compare,
+                names,
+                fail_fast))
+        elif fail_fast:
+            return MISMATCH
         else:
-            return (
+            return Mismatch(
                 'structured string regex: {}'.format(
                     expected.regex.pattern),
                 actual)
 
+# Comparers, for compare_step.  Each one is called with the Compare class
+# and compare_step's arguments, and returns a step (see Compare.run), or an
+# (expected, actual, type_compare) tuple to compare in place of expected
+# and actual.
+
+
+class DiffBudget(object):
+    '''How much detail one comparison collects about its mismatches.
+       Once max_mismatches mismatches have gone into the diff, the
+       mismatches the rest of the comparison finds are only counted,
+       in skipped.  A list that had some left out is diffed as a dict
+       of what was recorded, by position, so that no "_" stands in for
+       a mismatch.  Mismatched hashes and lists more
+       than max_depth levels down are summarized (their type and size)
+       rather than diffed.'''
+    __slots__ = (
+        'max_mismatches',
+        'max_depth',
+        'mismatches',
+        'skipped',
+        'depth')
+
+    def __init__(self, max_mismatches=None, max_depth=None):
+        if max_mismatches is not None and max_mismatches < 1:
+            raise kobold.ValidationError(
+                'max_mismatches must be at least 1, not {}'.format(
+                    max_mismatches))
+        self.max_mismatches = max_mismatches
+        self.max_depth = max_depth
+        self.mismatches = 0
+        self.skipped = 0
+        # How many hashes and lists down the comparison is (see run)
+        self.depth = 0
+
+    def spent(self):
+        return (self.max_mismatches is not None and
+                self.mismatches >= self.max_mismatches)
+
+    def take(self, count):
+        '''How many of count more mismatches can go into the diff'''
+        if self.max_mismatches is None:
+            recorded = count
+        else:
+            recorded = max(
+                0,
+                min(count, self.max_mismatches - self.mismatches))
+        self.mismatches += recorded
+        self.skipped += count - recorded
+        return recorded
+
+    def summarize(self, result, expected, actual):
+        if result is MATCH:
+            return MATCH
+        self.mismatches += 1
+        return Mismatch(summarize(expected), summarize(actual))
+
+
+def display_mismatch(cls, expected, actual):
+    '''The DisplayMismatch for elements that a list comparison couldn't
+       pair up - or, once a DiffBudget's max_depth is reached, a
+       summary of them, as for anything else that deep'''
+    budget = current_diff_budget.get()
+    if (budget is not None and
+            budget.max_depth is not None and
+            budget.depth >= budget.max_depth):
+        return Mismatch(summarize(expected), summarize(actual))
+    return DisplayMismatch(cls, expected, actual)
+
+
+def summarize(value):
+    '''value, or for a hash or list, a short description of it'''
+    if acts_like_a_hash(value) or acts_like_a_list(value):
+        return '<{} of length {}>'.format(type(value).__name__, len(value))
+    else:
+        return value
+
+
+current_diff_budget = contextvars.ContextVar('diff_budget', default=None)
+
+
+def mismatches_to_record(count):
+    '''How many of count mismatches to put in the diff - with a
+       DiffBudget, the rest are only counted'''
+    budget = current_diff_budget.get()
+    if budget is None:
+        return count
+    return budget.take(count)
+
+
+class ParseCache(object):
+    '''What each ParsingHint has parsed each actual value into, during
+       one comparison, so that an unordered list comparison (which tries
+       a hint against many actual values, and then displays them) only
+       parses each one once.  Strings and bytes are looked up by value,
+       and anything else by identity.  It also keeps the JSON
+       projection (see kobold.compare.projection) each JSONParsingHint
+       needs, so that nothing is kept on the hint.'''
+    __slots__ = ('parsed', 'projections')
+
+    def __init__(self):
+        self.parsed = {}
+        self.projections = {}
+
+    def projection(self, hint, type_compare):
+        key = (id(hint), type_compare)
+        entry = self.projections.get(key)
+        if entry is None or entry[0] is not hint:
+            from .projection import json_projection
+            entry = self.projections[key] = (
+                hint,
+                json_projection(hint.payload, type_compare))
+        return entry[1]
+
+    def parse(self, hint, actual, type_compare):
+        if type(actual) in (str, bytes):
+            actual_key = actual
+        else:
+            actual_key = id(actual)
+        # Most hints parse the same whatever the type_compare, so that
+        # displaying a diff (with no type_compare) finds what the
+        # comparison parsed
+        if type_compare is None:
+            variant = None
+        else:
+            variant = hint.parse_variant(type_compare)
+        key = (id(hint), actual_key, variant)
+        entry = self.parsed.get(key)
+        # The entry holds on to the hint and actual value, so that
+        # their ids can't be reused while it's here
+        if entry is None or entry[0] is not hint or (
+                actual_key is not actual and entry[1] is not actual):
+            try:
+                if variant is None:
+                    parsed = hint.parse(actual)
+                else:
+                    parsed = hint.parse_for(actual, type_compare)
+            except kobold.InvalidMatch:
+                parsed = kobold.InvalidMatch
+            if len(self.parsed) >= max_cached_parses:
+                self.parsed.clear()
+            entry = self.parsed[key] = (hint, actual, parsed)
+
+        if entry[2] is kobold.InvalidMatch:
+            raise kobold.InvalidMatch
+        return entry[2]
+
+
+current_parse_cache = contextvars.ContextVar('parse_cache', default=None)
+
+
+def parse_hint(hint, actual, type_compare=None):
+    '''What hint parses actual into, for comparing under type_compare
+       (or just displaying, with no type_compare).  Within a comparison,
+       this is only worked out once for each hint and actual value.'''
+    cache = current_parse_cache.get()
+    if cache is not None:
+        return cache.parse(hint, actual, type_compare)
+    elif type_compare is None:
+        return hint.parse(actual)
+    else:
+        return hint.parse_for(actual, type_compare)
+
+
+def compare_type_compare_hint(
+        cls, expected, actual, type_compare, names, fail_fast):
+    # Create a new type_compare based on what's on the hint, but using
+    # the type_compare provided to the function as a default
+    return (
+        expected.payload,
+        actual,
+        normalize_type_compare(
+            expected.type_compare,
+            defaults=type_compare))
+
+
+def compare_dontcare(cls, expected, actual, type_compare, names, fail_fast):
+    if expected.compare_with(actual, names=names):
+        return MATCH
+    elif fail_fast:
+        return MISMATCH
+    else:
+        return Mismatch(str(expected), actual)
+
+
+def compare_regex(cls, expected, actual, type_compare, names, fail_fast):
+    if expected.match(actual):
+        return MATCH
+    elif fail_fast:
+        return MISMATCH
+    else:
+        return Mismatch('regex: %s' % expected.pattern, actual)
+
+
+def compare_parsing_hint(
+        cls, expected, actual, type_compare, names, fail_fast):
+    try:
+        parsed = parse_hint(expected, actual, type_compare)
+    except kobold.InvalidMatch:
+        if fail_fast:
+            return MISMATCH
+        return Mismatch(expected, actual)
+    return (expected.payload, parsed, type_compare)
+
+
+def compare_hashes(cls, expected, actual, type_compare, names, fail_fast):
+    return cls.hash_compare_steps(
+        expected,
+        actual,
+        type_compare,
+        names,
+        fail_fast)
+
+
+def compare_tuples(cls, expected, actual, type_compare, names, fail_fast):
+    return cls.list_compare_steps(
+        expected,
+        actual,
+        type_compare,
+        tuple,
+        names,
+        fail_fast)
+
+
+def compare_lists(cls, expected, actual, type_compare, names, fail_fast):
+    return cls.list_compare_steps(
+        expected,
+        actual,
+        type_compare,
+        list,
+        names,
+        fail_fast)
+
+
+def compare_structured_string(
+        cls, expected, actual, type_compare, names, fail_fast):
+    return cls.structured_string_compare_steps(
+        expected,
+        actual,
+        type_compare,
+        names,
+        fail_fast)
+
+
+def compare_arrays(cls, expected, actual, type_compare, names, fail_fast):
+    # expected is a numpy array.  The elements are compared all at once,
+    # exactly, or within a tolerance - as numpy.isclose does with an
+    # "array" type_compare setting of rtol and/or atol, or else as
+    # numbers_close does with a "float" one.
+    import numpy
+    try:
+        actual_array = numpy.asarray(actual)
+    except ValueError:
+        # A ragged list, say
+        actual_array = None
+
+    if actual_array is None:
+        if fail_fast:
+            return MISMATCH
+        return Mismatch(expected, actual)
+    elif actual_array.shape != expected.shape:
+        if fail_fast:
+            return MISMATCH
+        return ArrayMismatch(expected, actual_array)
+
+    settings = type_compare.get('array')
+    tolerance = type_compare.get('float')
+    if settings is None and tolerance is not None:
+        # The tree-wide tolerance for numbers, so that an array matches
+        # just as a list of the same numbers would
+        mismatched = ~array_elements_close(
+            numpy,
+            expected,
+            actual_array,
+            tolerance)
+    else:
+        settings = settings or {}
+        mismatched = ~array_elements_match(
+            numpy,
+            expected,
+            actual_array,
+            settings.get('rtol', 0),
+            settings.get('atol', 0),
+            settings.get('equal_nan', False))
+    count = int(numpy.count_nonzero(mismatched))
+    if count == 0:
+        return MATCH
+    elif fail_fast:
+        return MISMATCH
+
+    positions = numpy.argwhere(mismatched)[:max_array_mismatches]
+    if expected.ndim == 1:
+        indices = [int(position[0]) for position in positions]
+    else:
+        indices = [tuple(int(i) for i in position) for position in positions]
+
+
+    max_abs_error = None
+    if (numpy.issubdtype(expected.dtype, numpy.number) and
+            numpy.issubdtype(actual_array.dtype, numpy.number)):
+        # Worked out in floating point, so unsigned integers
+        # can't wrap around
+        dtype = numpy.result_type(
+            expected.dtype,
+            actual_array.dtype,
+            numpy.float64)
+        errors = numpy.abs(
+            actual_array[mismatched].astype(dtype) -
+            expected[mismatched].astype(dtype))
+        errors = errors[~numpy.isnan(errors)]
+        if errors.size:
+            max_abs_error = float(errors.max())
+
+    return ArrayMismatch(
+        expected,
+        actual_array,
+        count,
+        indices,
+        [expected[index].tolist() for index in indices],
+        [actual_array[index].tolist() for index in indices],
+        max_abs_error)
+
+
+def array_elements_match(numpy, expected, actual, rtol, atol, equal_nan):
+    '''An array of booleans - whether each element of actual matches
+       the one in expected (two arrays of the same shape)'''
+    if rtol or atol:
+        try:
+            return numpy.isclose(
+                actual,
+                expected,
+                rtol=rtol,
+                atol=atol,
+                equal_nan=equal_nan)
+        except TypeError:
+            # Not numbers, so there's no tolerance to be had
+            pass
+
+    equal = numpy.asarray(expected == actual)
+    if equal.shape != expected.shape:
+        # numpy gave up on comparing elements of these dtypes
+        return numpy.zeros(expected.shape, dtype=bool)
+    if equal_nan:
+        try:
+            equal |= numpy.isnan(expected) & numpy.isnan(actual)
+        except TypeError:
+            pass
+    return equal
+
+
+def array_elements_close(numpy, expected, actual, tolerance):
+    '''Like array_elements_match, but with numbers_close's idea of
+       close for a "float" type_compare setting'''
+    equal = array_elements_match(numpy, expected, actual, 0, 0, False)
+    try:
+        # Worked out in floating point, so integers can't overflow
+        dtype = numpy.result_type(expected.dtype, actual.dtype, numpy.float64)
+        return equal | numpy_numbers_close(
+            numpy,
+            expected.astype(dtype),
+            actual.astype(dtype),
+            tolerance)
+    except TypeError:
+        # Not numbers, so there's no tolerance to be had
+        return equal
+
+
+def compare_with_array(cls, expected, actual, type_compare, names, fail_fast):
+    # actual is a numpy array, and expected isn't.  A list is compared
+    # with the array's elements as a list, so that DontCares and the
+    # like still work in it.  Anything else can't match (and an array
+    # can't be compared with == without numpy complaining).
+    if acts_like_a_list(expected) and type(expected) != set:
+        return (expected, actual.tolist(), type_compare)
+    elif fail_fast:
+        return MISMATCH
+    else:
+        return Mismatch(expected, actual)
+
+
+def compare_numbers(cls, expected, actual, type_compare, names, fail_fast):
+    # Numbers - within a tolerance, if there's a "float"
+    # type_compare setting of rel_tol and/or abs_tol
+    if expected == actual:
+        return MATCH
+    tolerance = type_compare.get('float')
+    if tolerance is not None and numbers_close(expected, actual, tolerance):
+        return MATCH
+    elif fail_fast:
+        return MISMATCH
+    else:
+        return Mismatch(expected, actual)
+
+
+def numbers_close(expected, actual, tolerance):
+    '''math.isclose, with the rel_tol and abs_tol from a "float"
+       type_compare setting'''
+    if not isinstance(tolerance, dict):
+        raise NotImplementedError(
+            'Invalid value for float type_compare setting: {}'.format(
+                tolerance))
+    try:
+        return math.isclose(
+            expected,
+            actual,
+            rel_tol=tolerance.get('rel_tol', 1e-09),
+            abs_tol=tolerance.get('abs_tol', 0.0))
+    except OverflowError:
+        # An int too big to be a float
+        return False
+
+
+def is_number(value):
+    '''True for ints, floats and other real numbers (numpy's, say), but
+       not bools'''
+    value_type = type(value)
+    if value_type is int or value_type is float:
+        return True
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def is_number_list(candidate):
+    return (type(candidate) in (list, tuple) and
+            all(is_number(element) for element in candidate))
+
+
+def numpy_number_mismatches(expected, actual, tolerance):
+    '''The indexes where two lists of numbers of the same length
+       aren't close, as numbers_close would say - or None if numpy
+       isn't installed, or can't hold the numbers'''
+    try:
+        import numpy
+    except ImportError:
+        return None
+    try:
+        expected = numpy.asarray(expected, dtype=numpy.float64)
+        actual = numpy.asarray(actual, dtype=numpy.float64)
+    except OverflowError:
+        return None
+    close = numpy_numbers_close(numpy, expected, actual, tolerance)
+    return numpy.flatnonzero(~close).tolist()
+
+
+def numpy_numbers_close(numpy, expected, actual, tolerance):
+    '''numbers_close for each pair of elements of two floating point
+       numpy arrays of the same shape'''
+    if not isinstance(tolerance, dict):
+        raise NotImplementedError(
+            'Invalid value for float type_compare setting: {}'.format(
+                tolerance))
+    rel_tol = tolerance.get('rel_tol', 1e-09)
+    abs_tol = tolerance.get('abs_tol', 0.0)
+    with numpy.errstate(invalid='ignore', over='ignore'):
+        # Infinities are only close to themselves, as with math.isclose
+        return (expected == actual) | (
+            numpy.isfinite(expected) &
+            numpy.isfinite(actual) &
+            (numpy.abs(actual - expected) <= numpy.maximum(
+                rel_tol * numpy.maximum(
+                    numpy.abs(expected),
+                    numpy.abs(actual)),
+                abs_tol)))
+
+
+def compare_equal(cls, expected, actual, type_compare, names, fail_fast):
+    if expected == actual:
+        return MATCH
+    elif fail_fast:
+        return MISMATCH
+    else:
+        return Mismatch(expected, actual)
+
+
+def find_comparer(expected, actual):
+    '''The comparer for expected and actual - one that's been added
+       with add_comparer for their types (or their base classes), or
+       else the built-in comparison that applies to them'''
+    for expected_type in type(expected).__mro__:
+        for actual_type in type(actual).__mro__:
+            comparer = comparers.get((expected_type, actual_type))
+            if comparer is not None:
+                return comparer
+
+    if isinstance(expected, hints.TypeCompareHint):
+        return compare_type_compare_hint
+    elif isinstance(expected, DontCare):
+        return compare_dontcare
+    elif (type(expected) in get_force_compare_types() and
+            type(actual) in get_force_compare_types()):
+        return compare_equal
+    elif (type(expected) == pattern_type and
+            isinstance(actual, str)):
+        return compare_regex
+    elif isinstance(expected, hints.ParsingHint):
+        return compare_parsing_hint
+    elif is_array(expected):
+        return compare_arrays
+    elif is_array(actual):
+        return compare_with_array
+    elif is_number(expected) and is_number(actual):
+        return compare_numbers
+    elif acts_like_a_hash(expected) and acts_like_a_hash(actual):
+        return compare_hashes
+    elif isinstance(expected, tuple) and isinstance(actual, tuple):
+        return compare_tuples
+    elif acts_like_a_list(expected) and acts_like_a_list(actual):
+        return compare_lists
+    elif (isinstance(expected, StructuredString) and
+            isinstance(actual, str)):
+        return compare_structured_string
+    else:
+        return compare_equal
+
+
+def add_comparer(expected_type, actual_type, comparer):
+    '''Use comparer to compare an expected value of expected_type with
+       an actual value of actual_type (or of subclasses of them), in
+       place of the built-in comparison.
+
+       comparer is called as comparer(compare_class, expected, actual,
+       type_compare, names, fail_fast), and returns a CompareResult
+       (MATCH, or a mismatch such as Mismatch(expected, actual)), or
+       an (expected, actual, type_compare) tuple to compare instead.
+       Plans already made with Compare.compile aren't affected.'''
+    with registry_lock:
+        comparers[(expected_type, actual_type)] = comparer
+        clear_comparer_cache()
+
+
+def remove_comparer(expected_type, actual_type):
+    with registry_lock:
+        comparers.pop((expected_type, actual_type), None)
+        clear_comparer_cache()
+
+
+def clear_comparer_cache():
+    # Replaced rather than cleared, so that a comparison going on in
+    # another thread, which may have found a comparer with the old
+    # settings, can only store it in the old cache
+    global comparer_cache
+    comparer_cache = {}
+
+
+# Comparers added with add_comparer, by (expected type, actual type)
+comparers = {}
+
+# The comparer found for each (expected type, actual type) pair that's
+# been compared so far.  Replaced whenever anything that find_comparer
+# depends on is changed.
+comparer_cache = {}
+
+# Held while comparers, hash_compare_types or list_compare_types
+# are changed
+registry_lock = threading.Lock()
+max_cached_comparers = 1024
+
+# The most edits aligned_list_compare will look for before giving up
+# and comparing the lists index by index
+max_alignment_edits = 1000
+
+# The most parsed values a ParseCache holds before it starts over
+max_cached_parses = 1024
+
+# How many mismatches stream_compare finds before it stops
+max_stream_mismatches = 100
+
+# How many of the mismatched elements of an array are shown in its diff
+max_array_mismatches = 10
+
+# Lists of numbers at least this long are compared within a "float"
+# tolerance with numpy, if it's installed
+min_numpy_list_length = 1000
+
+# The values whose == is exactly equality of their hashable forms, so
+# that unordered lists of them (or of dicts, lists and tuples of them)
+# can be matched up by hash (see is_plain_value).  Anything else - even a
+# subclass - could define a looser __eq__.
+plain_value_types = (str, bytes, int, float, bool, type(None))
+
 hash_compare_types = (dict, collections.abc.Mapping)
 list_compare_types = (list, set, tuple)
 
 
 def add_hash_compare_types(new_types):
     global hash_compare_types
-    hash_compare_types_set = set(hash_compare_types)
-    for new_type in new_types:
-        hash_compare_types_set.add(new_type)
-    hash_compare_types = tuple(hash_compare_types_set)
+    with registry_lock:
+        hash_compare_types_set = set(hash_compare_types)
+        for new_type in new_types:
+            hash_compare_types_set.add(new_type)
+        hash_compare_types = tuple(hash_compare_types_set)
+        clear_comparer_cache()
 
 
 def add_list_compare_types(new_types):
     global list_compare_types
-    list_compare_types_set = set(list_compare_types)
-    for new_type in new_types:
-        list_compare_types_set.add(new_type)
-    list_compare_types = tuple(list_compare_types_set)
+    with registry_lock:
+        list_compare_types_set = set(list_compare_types)
+        for new_type in new_types:
+            list_compare_types_set.add(new_type)
+        list_compare_types = tuple(list_compare_types_set)
+        clear_comparer_cache()
     
 
+def is_plain_expected(expected, type_compare):
+    '''True if comparing expected with anything boils down to plain
+       equality - it's a plain value (see is_plain_value), with no NaNs
+       in it, and type_compare doesn't loosen the comparison of any
+       hash, list or number inside it.'''
+    force_compare_types = get_force_compare_types()
+    pending = [expected]
+    while pending:
+        expected = pending.pop()
+        expected_type = type(expected)
+        if expected_type is dict:
+            if (type_compare.get('hash', 'full') != 'full' or
+                    type_compare.get('dontcare_keys') or
+                    '__compare' in expected):
+                return False
+            pending.extend(expected.keys())
+            pending.extend(expected.values())
+        elif expected_type is list or expected_type is tuple:
+            if not type_compare.get('ordered', True):
+                return False
+            pending.extend(expected)
+        elif (expected_type not in plain_value_types or
+                expected_type in force_compare_types):
+            # DontCares, hints, regexes and anything else that isn't
+            # compared by plain equality
+            return False
+        elif (is_number(expected) and
+                type_compare.get('float') is not None):
+            # Numbers near expected match too
+            return False
+        elif expected != expected:
+            # NaN never equals itself, but would still find itself
+            # in a hash bucket
+            return False
+    return True
+
+
+def is_plain_value(value):
+    '''True if value is made of nothing but plain_value_types, and
+       dicts, lists and tuples of them'''
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        value_type = type(value)
+        if value_type is dict:
+            pending.extend(value.keys())
+            pending.extend(value.values())
+        elif value_type is list or value_type is tuple:
+            pending.extend(value)
+        elif value_type not in plain_value_types:
+            return False
+    return True
+
+
 def acts_like_a_hash(candidate):
     return isinstance(candidate, hash_compare_types)
 
 
 def acts_like_a_list(candidate):
     return isinstance(candidate, list_compare_types)
+
+
+def is_array(candidate):
+    # numpy is optional, and there can't be any numpy arrays to compare
+    # until something else has imported it
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(candidate, numpy.ndarray)
@@ -0,0 +1,424 @@
+'''Compiled comparison plans.
+
+Compare.compile walks an expected data structure once and turns it into
+a tree of matchers.  All of the work that Compare.compare repeats on every
+call - normalizing type_compare, stripping __compare keys, unwrapping
+TypeCompareHints, resolving Hint rule chains and picking a comparison
+branch for the expected value - happens up front.  The resulting
+CompiledCompare can then be matched against any number of actual values,
+giving the same results as kobold.compare.compare.
+
+Structures that depend on per-comparison state (unordered lists, sets,
+MultiMatch hints in lists) are handed back to Compare for the subtree in
+question, using the type_compare resolved at compile time.  So is
+anything nested more than max_compiled_depth deep, since compiling and
+matching both recurse, where Compare.compare doesn't.'''
+
+import kobold
+from kobold import NotPresent
+from . import (
+    Compare,
+    DontCare,
+    OrderedList,
+    StructuredString,
+    UnorderedList,
+    acts_like_a_hash,
+    acts_like_a_list,
+    comparers,
+    get_force_compare_types,
+    is_array,
+    is_number,
+    normalize_type_compare,
+    numbers_close,
+    pattern_type)
+from .hints import (
+    Hint,
+    MultiMatch,
+    ParsingHint,
+    TypeCompareHint,
+    hints_by_name)
+from .result import HashMismatch, ListMismatch, MATCH, Mismatch
+
+# How deep a plan's matchers nest before the rest of the expected value
+# is left to Compare.compare
+max_compiled_depth = 100
+
+
+class Matcher(object):
+    '''Base class for the nodes of a compiled comparison plan.
+       A matcher holds the (original) expected value, and match
+       returns the CompareResult that Compare.compare would return
+       for that expected value and the given actual value'''
+    __slots__ = ('expected',)
+
+    def __init__(self, expected):
+        self.expected = expected
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.expected)
+
+    def match(self, actual, names):
+        raise NotImplementedError()
+
+    def equal(self, actual):
+        if is_array(actual):
+            # Nothing but a list can match an array, and numpy
+            # won't say whether anything else == one
+            return Mismatch(self.expected, actual)
+        elif self.expected == actual:
+            return MATCH
+        else:
+            return Mismatch(self.expected, actual)
+
+
+class EqualMatcher(Matcher):
+    __slots__ = ()
+
+    def match(self, actual, names):
+        return self.equal(actual)
+
+
+class NumberMatcher(Matcher):
+    '''A number, matching numbers within a "float" type_compare
+       tolerance'''
+    __slots__ = ('tolerance',)
+
+    def __init__(self, expected, tolerance):
+        super().__init__(expected)
+        self.tolerance = tolerance
+
+    def match(self, actual, names):
+        if (is_number(actual) and
+                (self.expected == actual or
+                    numbers_close(self.expected, actual, self.tolerance))):
+            return MATCH
+        return self.equal(actual)
+
+
+class DontCareMatcher(Matcher):
+    __slots__ = ()
+
+    def match(self, actual, names):
+        if self.expected.compare_with(actual, names=names):
+            return MATCH
+        else:
+            return Mismatch(str(self.expected), actual)
+
+
+class RegexMatcher(Matcher):
+    __slots__ = ()
+
+    def match(self, actual, names):
+        if isinstance(actual, str):
+            if self.expected.match(actual):
+                return MATCH
+            else:
+                return Mismatch('regex: %s' % self.expected.pattern, actual)
+        return self.equal(actual)
+
+
+class ParsingHintMatcher(Matcher):
+    __slots__ = ('parsers', 'payload')
+
+    def __init__(self, expected, parsers, payload):
+        super().__init__(expected)
+        self.parsers = parsers
+        self.payload = payload
+
+    def match(self, actual, names):
+        try:
+            parsed = actual
+            if parsed is not NotPresent:
+                for parser in self.parsers:
+                    parsed = parser(parsed)
+            return self.payload.match(parsed, names)
+        except kobold.InvalidMatch:
+            return Mismatch(self.expected, actual)
+
+
+class HashMatcher(Matcher):
+    __slots__ = ('matchers', 'full', 'dontcare_keys', 'dontcare_matcher')
+
+    def __init__(self, expected, matchers, full, dontcare_keys):
+        super().__init__(expected)
+        self.matchers = matchers
+        self.full = full
+        self.dontcare_keys = dontcare_keys
+        self.dontcare_matcher = DontCareMatcher(DontCare())
+
+    def match(self, actual, names):
+        if not acts_like_a_hash(actual):
+            return self.equal(actual)
+
+        mismatched = {}
+        for key, matcher in self.matchers.items():
+            result = matcher.match(actual.get(key, NotPresent), names)
+            if result is not MATCH:
+                mismatched[key] = result
+
+        if self.full:
+            for key in actual.keys():
+                if key in self.matchers:
+                    continue
+                value = actual.get(key, NotPresent)
+                if key in self.dontcare_keys:
+                    result = self.dontcare_matcher.match(value, names)
+                elif value is NotPresent:
+                    continue
+                else:
+                    result = Mismatch(NotPresent, value)
+                if result is not MATCH:
+                    mismatched[key] = result
+
+        if len(mismatched) == 0:
+            return MATCH
+        else:
+            return HashMismatch(mismatched)
+
+
+class OrderedListMatcher(Matcher):
+    __slots__ = ('matchers', 'type_compare', 'not_present')
+
+    def __init__(self, expected, matchers, type_compare):
+        super().__init__(expected)
+        self.matchers = matchers
+        self.type_compare = type_compare
+        self.not_present = EqualMatcher(NotPresent)
+
+    def match(self, actual, names):
+        if isinstance(self.expected, tuple) and isinstance(actual, tuple):
+            iter_type = tuple
+        elif acts_like_a_list(actual):
+            iter_type = list
+        elif is_array(actual):
+            return self.match(actual.tolist(), names)
+        else:
+            return self.equal(actual)
+
+        if type(actual) == set:
+            # A set can't be indexed, so this is the same failure
+            # that Compare.ordered_list_compare would hit
+            return Compare.list_compare(
+                self.expected,
+                actual,
+                self.type_compare,
+                iter_type=iter_type,
+                names=names)
+
+        matchers = self.matchers
+        length = max(len(matchers), len(actual))
+        entries = []
+        for index in range(length):
+            if index < len(matchers):
+                matcher = matchers[index]
+            else:
+                matcher = self.not_present
+
+            if index < len(actual):
+                actual_value = actual[index]
+            else:
+                actual_value = NotPresent
+
+            result = matcher.match(actual_value, names)
+            if result is not MATCH:
+                entries.append((index, index, result))
+
+        if len(entries) == 0:
+            return MATCH
+        else:
+            return ListMismatch(entries, length, length, iter_type)
+
+
+class StructuredStringMatcher(Matcher):
+    __slots__ = ('arguments',)
+
+    def __init__(self, expected, arguments):
+        super().__init__(expected)
+        self.arguments = arguments
+
+    def match(self, actual, names):
+        if not isinstance(actual, str):
+            return self.equal(actual)
+
+        match = self.expected.regex.match(actual)
+        if match:
+            return self.arguments.match(match.groups(), names)
+        else:
+            return Mismatch(
+                'structured string regex: {}'.format(
+                    self.expected.regex.pattern),
+                actual)
+
+
+class FallbackMatcher(Matcher):
+    '''Defers to Compare.compare for a subtree that can't be compiled'''
+    __slots__ = ('type_compare',)
+
+    def __init__(self, expected, type_compare):
+        super().__init__(expected)
+        self.type_compare = type_compare
+
+    def match(self, actual, names):
+        return Compare.compare(
+            self.expected,
+            actual,
+            self.type_compare,
+            names=names)
+
+
+class CompiledCompare(object):
+    '''A reusable, immutable comparison plan for one expected value.
+       Build one with Compare.compile.'''
+    __slots__ = ('expected', 'type_compare', 'matcher')
+
+    def __init__(self, expected, type_compare, matcher):
+        self.expected = expected
+        self.type_compare = type_compare
+        self.matcher = matcher
+
+    def __repr__(self):
+        return 'CompiledCompare({!r})'.format(self.expected)
+
+    def match(self, actual, names=None):
+        '''Equivalent to kobold.compare.compare(expected, actual,
+           type_compare) for the expected value and type_compare this
+           plan was compiled with'''
+        if names is None:
+            names = {}
+        return self.matcher.match(actual, names)
+
+
+def compile_expected(expected, type_compare=None):
+    type_compare = normalize_type_compare(type_compare)
+    return CompiledCompare(
+        expected,
+        type_compare,
+        compile_matcher(expected, type_compare))
+
+
+def compile_matcher(expected, type_compare, depth=0):
+    # The branches here follow the same order as Compare.compare
+    type_compare = normalize_type_compare(type_compare)
+    if depth > max_compiled_depth:
+        return FallbackMatcher(expected, type_compare)
+    if isinstance(expected, TypeCompareHint):
+        return compile_matcher(
+            expected.payload,
+            normalize_type_compare(
+                expected.type_compare,
+                defaults=type_compare),
+            depth + 1)
+    if type_compare['ordered'] and type_compare['list'] == 'existing':
+        raise kobold.ValidationError(
+            'Ordered list compare must always be "full", not "existing"')
+
+    if any(isinstance(expected, expected_type)
+           for (expected_type, _) in list(comparers)):
+        # An added comparer could apply, depending on the actual type
+        return FallbackMatcher(expected, type_compare)
+    elif expected is DontCare:
+        return DontCareMatcher(DontCare())
+    elif isinstance(expected, DontCare):
+        return DontCareMatcher(expected)
+    elif type(expected) in get_force_compare_types():
+        return FallbackMatcher(expected, type_compare)
+    elif type(expected) == pattern_type:
+        return RegexMatcher(expected)
+    elif isinstance(expected, ParsingHint):
+        return compile_parsing_hint(expected, type_compare, depth)
+    elif is_array(expected):
+        # Arrays are compared all at once anyway
+        return FallbackMatcher(expected, type_compare)
+    elif acts_like_a_hash(expected):
+        return compile_hash(expected, type_compare, depth)
+    elif acts_like_a_list(expected):
+        return compile_list(expected, type_compare, depth)
+    elif isinstance(expected, StructuredString):
+        return compile_structured_string(expected, type_compare, depth)
+    elif (is_number(expected) and
+            type_compare.get('float') is not None):
+        return NumberMatcher(expected, type_compare['float'])
+    else:
+        return EqualMatcher(expected)
+
+
+def compile_parsing_hint(expected, type_compare, depth):
+    if type(expected) is Hint:
+        if isinstance(expected.rule, list):
+            rules = expected.rule
+        else:
+            rules = [expected.rule]
+        parsers = []
+        for rule in rules:
+            hint_class = hints_by_name.get(rule)
+            if hint_class is None or hint_class is TypeCompareHint:
+                # Let Compare raise the same error it always has,
+                # at comparison time
+                return FallbackMatcher(expected, type_compare)
+            hint = hint_class(expected.payload, **expected.init_params)
+            parsers.append(hint.sub_parse)
+    else:
+        def parse(thing_to_parse):
+            return expected.parse_for(thing_to_parse, type_compare)
+        parsers = [parse]
+
+    return ParsingHintMatcher(
+        expected,
+        tuple(parsers),
+        compile_matcher(expected.payload, type_compare, depth + 1))
+
+
+def compile_hash(expected, type_compare, depth):
+    # Resolve the settings that Compare.hash_compare would work out
+    if '__compare' in expected:
+        compare_override = expected['__compare']
+        if acts_like_a_hash(compare_override):
+            type_compare = normalize_type_compare(compare_override)
+        elif isinstance(compare_override, str):
+            type_compare = type_compare.derive(compare_override)
+        else:
+            type_compare = type_compare.derive({'hash': compare_override})
+
+    dontcare_keys = type_compare['dontcare_keys']
+    dontcare_matcher = DontCareMatcher(DontCare())
+    matchers = {}
+    for key, value in expected.items():
+        if key == '__compare':
+            continue
+        if key in dontcare_keys:
+            matchers[key] = dontcare_matcher
+        else:
+            matchers[key] = compile_matcher(value, type_compare, depth + 1)
+
+    return HashMatcher(
+        expected,
+        matchers,
+        type_compare['hash'] == 'full',
+        dontcare_keys)
+
+
+def compile_list(expected, type_compare, depth):
+    # Only plain ordered lists and tuples are compiled - the unordered
+    # comparison keeps state (names, MultiMatch counts) across its
+    # elements, so it stays with Compare
+    ordered = (
+        isinstance(expected, OrderedList) or
+        (type_compare['ordered'] and
+            not isinstance(expected, UnorderedList)))
+    if (not ordered or
+            type_compare.get('alignment', 'index') != 'index' or
+            not isinstance(expected, (list, tuple)) or
+            any(isinstance(element, MultiMatch) for element in expected)):
+        return FallbackMatcher(expected, type_compare)
+
+    return OrderedListMatcher(
+        expected,
+        tuple(compile_matcher(element, type_compare, depth + 1)
+              for element in expected),
+        type_compare)
+
+
+def compile_structured_string(expected, type_compare, depth):
+    return StructuredStringMatcher(
+        expected,
+        compile_matcher(expected.arguments, type_compare, depth + 1))
@@ -0,0 +1,195 @@
+'''Skipping the parts of a comparison that matched last time.
+
+A FingerprintCache is for comparing the same expected value against a
+large actual value over and over, as the actual value slowly changes -
+polling a service's state, say.  Whenever an expected hash or list
+matches an actual one, the cache remembers the pair, by a fingerprint
+of the actual one: a digest of its contents.  On later comparisons, an
+actual subtree with the same fingerprint as one that matched the same
+expected subtree is taken to match without comparing it again.  The
+comparison only works its way down into the subtrees that changed.
+
+Fingerprints are digests of pickles, which are quick to make - much
+quicker than comparing - but a subtree is pickled again at every level
+the comparison has to go down through to reach a change.  Only plain
+data (hashes, lists, tuples, strings, bytes, numbers, booleans and None)
+is fingerprinted, and subtrees with anything else in them are always
+compared.
+
+Expected subtrees are remembered by identity, so the expected value
+mustn't be changed in place between comparisons.  Subtrees with named
+DontCares or MultiMatch hints in them are always compared, since their
+results depend on more than their contents.'''
+
+import contextvars
+import hashlib
+import io
+import pickle
+
+import kobold
+from ..snapshot import PlainDataPickler
+from . import Compare, DontCare, normalize_type_compare
+from .hints import MultiMatch, ParsingHint, TypeCompareHint
+from .result import CompareResult, MATCH
+
+# Hashes and lists that pickle to fewer bytes than this aren't worth
+# remembering
+min_fingerprint_size = 1024
+
+# The most matches (or expected subtrees) a FingerprintCache remembers
+# before it starts over
+max_fingerprints = 100000
+
+current_fingerprints = contextvars.ContextVar('fingerprints', default=None)
+
+
+class FingerprintCache(object):
+    '''Remembers which expected subtrees matched which actual subtrees
+       (by fingerprint), across comparisons.  Use its compare method,
+       or pass it to kobold.compare.compare (or assert_equal) as
+       fingerprints.'''
+
+    def __init__(self):
+        # (id of expected subtree, type_compare, fingerprint of actual
+        # subtree) -> the expected subtree, for each pair that matched
+        self.matched = {}
+        # id -> subtree, for the expected subtrees that can be skipped
+        self.cacheable = {}
+        # id -> value, for the expected values that have been looked at
+        self.prepared = {}
+
+    def compare(self,
+                expected,
+                actual,
+                type_compare=None,
+                names=None,
+                fail_fast=False):
+        '''Compare.compare, skipping the subtrees of actual that are
+           known to match'''
+        self.prepare(expected)
+        token = current_fingerprints.set(self)
+        try:
+            return FingerprintCompare.compare(
+                expected,
+                actual,
+                type_compare,
+                names=names,
+                fail_fast=fail_fast)
+        finally:
+            current_fingerprints.reset(token)
+
+    def prepare(self, expected):
+        '''Work out which of expected's subtrees can be skipped'''
+        if self.prepared.get(id(expected)) is expected:
+            return
+        if len(self.cacheable) >= max_fingerprints:
+            # Too many different expected values - start over
+            self.clear()
+        self.prepared[id(expected)] = expected
+
+        # Post-order, so a subtree is only cacheable if everything
+        # in it is
+        pending = [(expected, False)]
+        uncacheable = set()
+        while pending:
+            value, visited = pending.pop()
+            children = subtree_children(value)
+            if not visited:
+                pending.append((value, True))
+                pending.extend((child, False) for child in children)
+                continue
+            if (isinstance(value, MultiMatch) or
+                    (isinstance(value, DontCare) and value.name is not None) or
+                    any(id(child) in uncacheable for child in children)):
+                uncacheable.add(id(value))
+            elif isinstance(value, (dict, list, tuple)):
+                self.cacheable[id(value)] = value
+
+    def remember(self, key, expected):
+        if len(self.matched) >= max_fingerprints:
+            self.matched.clear()
+        self.matched[key] = expected
+
+    def clear(self):
+        self.matched.clear()
+        self.cacheable.clear()
+        self.prepared.clear()
+
+
+class FingerprintCompare(Compare):
+    '''Compare, checking the current FingerprintCache before comparing
+       a hash or list'''
+
+    @classmethod
+    def compare_step(cls, expected, actual, type_compare, names, fail_fast):
+        cache = current_fingerprints.get()
+        if (type(actual) not in (dict, list, tuple) or
+                cache.cacheable.get(id(expected)) is not expected):
+            return super().compare_step(
+                expected,
+                actual,
+                type_compare,
+                names,
+                fail_fast)
+
+        digest = fingerprint(actual)
+        if digest is None:
+            return super().compare_step(
+                expected,
+                actual,
+                type_compare,
+                names,
+                fail_fast)
+
+        type_compare = normalize_type_compare(type_compare)
+        key = (id(expected), type_compare, digest)
+        if cache.matched.get(key) is expected:
+            return MATCH
+
+        step = super().compare_step(
+            expected,
+            actual,
+            type_compare,
+            names,
+            fail_fast)
+        if isinstance(step, CompareResult):
+            if step is MATCH:
+                cache.remember(key, expected)
+            return step
+        return cls.remember_step(step, cache, key, expected)
+
+    @classmethod
+    def remember_step(cls, step, cache, key, expected):
+        result = yield step
+        if result is MATCH:
+            cache.remember(key, expected)
+        return result
+
+
+def subtree_children(value):
+    if isinstance(value, dict):
+        return list(value.values())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    elif isinstance(value, (ParsingHint, TypeCompareHint)):
+        return [value.payload]
+    else:
+        return []
+
+
+def fingerprint(actual):
+    '''A digest of actual's contents, if it's plain data, and big
+       enough to be worth remembering - otherwise None'''
+    buffer = io.BytesIO()
+    pickler = PlainDataPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    # No memo, so that the pickle doesn't depend on which values in
+    # actual happen to be the same object
+    pickler.fast = True
+    try:
+        pickler.dump(actual)
+    except (kobold.ValidationError, ValueError, RecursionError):
+        return None
+    pickled = buffer.getbuffer()
+    if len(pickled) < min_fingerprint_size:
+        return None
+    return hashlib.blake2b(pickled, digest_size=16).digest()
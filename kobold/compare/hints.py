@@ -1,9 +1,4 @@
-import base64
-import binascii
-import json
-import pickle
-import urllib.parse
-import zlib
+import contextvars
 
 import kobold
 
@@ -32,6 +27,16 @@ class ParsingHint(object):
     def sub_parse(self, thing_to_parse):
         return thing_to_parse
 
+    def parse_for(self, thing_to_parse, type_compare):
+        '''Parse, knowing the type_compare the result will be compared
+           with the payload under'''
+        return self.parse(thing_to_parse)
+
+    def parse_variant(self, type_compare):
+        '''What parse_for's result depends on, besides the thing being
+           parsed - or None, if it's always the same as parse's'''
+        return None
+
 
 class Hint(ParsingHint):
     def __init__(self, payload, rule, init_params=None):
@@ -77,11 +82,42 @@ class TypeCompareHint(ParsingHint):
 
 class JSONParsingHint(ParsingHint):
     def sub_parse(self, thing_to_parse):
+        import json
         try:
             return json.loads(thing_to_parse)
         except (TypeError, json.decoder.JSONDecodeError):
             raise kobold.InvalidMatch
 
+    def parse_for(self, thing_to_parse, type_compare):
+        # If only some keys of the document are going to be compared,
+        # only parse those (see kobold.compare.projection)
+        if not isinstance(thing_to_parse, str):
+            return self.parse(thing_to_parse)
+        from .projection import parse_json_projection
+        projection = self.projection(type_compare)
+        if projection is None:
+            return self.parse(thing_to_parse)
+        try:
+            return parse_json_projection(thing_to_parse, projection)
+        except (ValueError, IndexError, StopIteration):
+            # Let the full parse decide what's wrong with it
+            return self.parse(thing_to_parse)
+
+    def parse_variant(self, type_compare):
+        if self.projection(type_compare) is None:
+            return None
+        return type_compare
+
+    def projection(self, type_compare):
+        from . import current_parse_cache
+        from .projection import json_projection
+        # Worked out once per comparison, in its ParseCache - not on
+        # the hint, which can be shared between comparisons
+        cache = current_parse_cache.get()
+        if cache is None:
+            return json_projection(self.payload, type_compare)
+        return cache.projection(self, type_compare)
+
 
 class ObjectDictParsingHint(ParsingHint):
     def sub_parse(self, thing_to_parse):
@@ -115,6 +151,8 @@ class ObjectAttrParsingHint(ParsingHint):
 
 class Base64Hint(ParsingHint):
     def sub_parse(self, thing_to_parse):
+        import base64
+        import binascii
         try:
             return base64.b64decode(thing_to_parse)
         except binascii.Error:
@@ -122,10 +160,12 @@ class Base64Hint(ParsingHint):
 
 class PickleParsingHint(ParsingHint):
     def sub_parse(self, thing_to_parse):
+        import pickle
         return pickle.loads(thing_to_parse)
 
 
 def parse_qs(qs, qs_lists=True):
+    import urllib.parse
     query_dict = urllib.parse.parse_qs(qs)
     if not qs_lists:
         new_query_dict = {}
@@ -174,21 +214,101 @@ class UrlEncodedParsingHint(ParsingHint):
 
 class ZLibParsingHint(ParsingHint):
     def sub_parse(self, thing_to_parse):
+        import zlib
         return zlib.decompress(thing_to_parse)
 
 
 class MultiMatch(ParsingHint):
-    def __init__(self, payload):
-        self.payload = payload
-        self.count = 0
+    '''Matches any number of elements of a list.  How many it has
+       matched is kept per comparison (see current_match_counts), not
+       on the hint, so the same MultiMatch can be used in any number of
+       comparisons, including at the same time.'''
+
+    @property
+    def count(self):
+        counts = current_match_counts.get()
+        if counts is None:
+            return 0
+        return counts.get(id(self), 0)
 
     def add_match(self, element):
-        self.count += 1
+        counts = current_match_counts.get()
+        if counts is None:
+            raise kobold.ValidationError(
+                'MultiMatch matches can only be counted during a comparison')
+        counts[id(self)] = counts.get(id(self), 0) + 1
 
     def matched(self):
         return self.count > 0
 
 
+# id of MultiMatch -> how many elements it has matched, in the comparison
+# going on in this thread (or task).  Compare.run sets it.
+current_match_counts = contextvars.ContextVar('match_counts', default=None)
+
+
+class KeyedList(ParsingHint):
+    '''Compares a list of rows (dicts) with the actual list row by row,
+       matching them up by key - a field, or a tuple of fields - rather
+       than by position or by trying every pair.  The payload is
+       indexed by key here, and the actual list when it's parsed, so
+       the rows are compared as a hash of rows.  Rows whose key is
+       missing from the actual list, or that are only in the actual
+       list, show up in the diff under their key.'''
+
+    def __init__(self, payload, key='id'):
+        self.rows = payload
+        self.key = key
+        self.payload = {}
+        for row in payload:
+            try:
+                row_key = self.row_key(row)
+                duplicate = row_key in self.payload
+            except (AttributeError, TypeError):
+                raise kobold.ValidationError(
+                    'KeyedList rows must be hashes with a hashable '
+                    'key: {}'.format(row))
+            if duplicate:
+                raise kobold.ValidationError(
+                    'KeyedList has more than one row with key '
+                    '{}'.format(row_key))
+            self.payload[row_key] = row
+
+    def __repr__(self):
+        return '{}(payload={}, key={})'.format(
+            self.__class__.__name__,
+            self.rows,
+            self.key)
+
+    def row_key(self, row):
+        if isinstance(self.key, (list, tuple)):
+            return tuple(row.get(field, kobold.NotPresent)
+                         for field in self.key)
+        else:
+            return row.get(self.key, kobold.NotPresent)
+
+    def sub_parse(self, thing_to_parse):
+        if not isinstance(thing_to_parse, (list, tuple)):
+            raise kobold.InvalidMatch
+        keyed = {}
+        duplicated = set()
+        try:
+            for row in thing_to_parse:
+                row_key = self.row_key(row)
+                if row_key in duplicated:
+                    keyed[row_key].append(row)
+                elif row_key in keyed:
+                    # Every row with the same key is shown together,
+                    # which can't match the one expected row
+                    keyed[row_key] = [keyed[row_key], row]
+                    duplicated.add(row_key)
+                else:
+                    keyed[row_key] = row
+        except (AttributeError, TypeError):
+            raise kobold.InvalidMatch
+        return keyed
+
+
 class NamedTupleHint(ParsingHint):
     def sub_parse(self, thing_to_parse):
         return thing_to_parse._asdict()
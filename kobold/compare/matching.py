@@ -0,0 +1,101 @@
+'''Maximum bipartite matching, used by the "optimal" unordered list
+comparison to pair expected elements with actual elements.'''
+
+import collections
+
+INFINITY = float('inf')
+
+
+def maximum_matching(adjacency, right_count):
+    '''Hopcroft-Karp.  adjacency[left] is the list of right-hand
+       vertices (0 <= right < right_count) that the left-hand vertex
+       can be paired with.  Returns a list where element [left] is the
+       right-hand vertex paired with left, or None.
+
+       The matching is seeded with a first-fit pass in adjacency order,
+       so where first-fit already finds a complete pairing, that's the
+       pairing that's returned.'''
+    left_count = len(adjacency)
+    match_left = [None] * left_count
+    match_right = [None] * right_count
+
+    for left, rights in enumerate(adjacency):
+        for right in rights:
+            if match_right[right] is None:
+                match_left[left] = right
+                match_right[right] = left
+                break
+
+    dist = [INFINITY] * left_count
+    while _layer(adjacency, match_left, match_right, dist):
+        next_edge = [0] * left_count
+        for left in range(left_count):
+            if match_left[left] is None:
+                _augment(
+                    left,
+                    adjacency,
+                    match_left,
+                    match_right,
+                    dist,
+                    next_edge)
+
+    return match_left
+
+
+def _layer(adjacency, match_left, match_right, dist):
+    # Breadth-first search from the free left-hand vertices, along
+    # alternating paths.  Returns True if a free right-hand vertex
+    # can be reached (ie. there's an augmenting path)
+    queue = collections.deque()
+    for left in range(len(adjacency)):
+        if match_left[left] is None:
+            dist[left] = 0
+            queue.append(left)
+        else:
+            dist[left] = INFINITY
+
+    found = False
+    while queue:
+        left = queue.popleft()
+        for right in adjacency[left]:
+            next_left = match_right[right]
+            if next_left is None:
+                found = True
+            elif dist[next_left] == INFINITY:
+                dist[next_left] = dist[left] + 1
+                queue.append(next_left)
+    return found
+
+
+def _augment(root, adjacency, match_left, match_right, dist, next_edge):
+    # Depth-first search along the layers found by _layer, with an
+    # explicit stack so that long augmenting paths can't exhaust
+    # the interpreter's recursion limit
+    stack = [root]
+    path = []
+    while stack:
+        left = stack[-1]
+        rights = adjacency[left]
+        advanced = False
+        while next_edge[left] < len(rights):
+            right = rights[next_edge[left]]
+            next_edge[left] += 1
+            next_left = match_right[right]
+            if next_left is None:
+                path.append(right)
+                for path_left, path_right in zip(stack, path):
+                    match_left[path_left] = path_right
+                    match_right[path_right] = path_left
+                return True
+            if dist[next_left] == dist[left] + 1:
+                stack.append(next_left)
+                path.append(right)
+                advanced = True
+                break
+
+        if not advanced:
+            dist[left] = INFINITY
+            stack.pop()
+            if path:
+                path.pop()
+    return False
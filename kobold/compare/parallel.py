@@ -0,0 +1,311 @@
+'''Comparing large collections across processes.
+
+Compare.compare(..., workers=N) splits the top level of the comparison
+into shards - groups of keys, for a pair of hashes, or ranges of
+indexes, for a pair of ordered lists - and compares the shards in a
+pool of N processes.  The results are merged into the one result that
+comparing in-process would have given.
+
+Everything else is compared in-process, as usual: collections too small
+for it to be worth pickling them (see min_parallel_items), unordered
+lists and sets (which have to be matched up as a whole), lists with
+MultiMatch hints or Myers alignment, and a top-level pair handled by a
+comparer added with add_comparer.  Named DontCares can't be used with
+workers at all, since a name bound in one process can't be checked in
+another.
+
+Workers that don't start as a fork of this process (with the "spawn"
+or "forkserver" start methods) are sent everything added with
+add_comparer, add_dontcare_rule, add_hash_compare_types and
+add_list_compare_types, which then has to be picklable.'''
+
+import multiprocessing
+import pickle
+
+import kobold
+from . import (
+    DontCare,
+    MISMATCH,
+    OrderedList,
+    StructuredString,
+    UnorderedList,
+    add_comparer,
+    add_dontcare_rule,
+    add_hash_compare_types,
+    add_list_compare_types,
+    compare_hashes,
+    compare_lists,
+    compare_tuples,
+    find_comparer,
+    normalize_type_compare)
+from .hints import MultiMatch, ParsingHint, TypeCompareHint
+from .result import HashMismatch, ListMismatch, MATCH
+
+# Below this many top-level keys or elements, pickling the shards costs
+# more than comparing them in-process
+min_parallel_items = 10000
+
+# Shards per worker, so that a slow shard doesn't hold up the rest
+shards_per_worker = 4
+
+
+def parallel_compare(compare_class,
+                     expected,
+                     actual,
+                     type_compare,
+                     names,
+                     fail_fast,
+                     workers):
+    type_compare = normalize_type_compare(type_compare)
+    while isinstance(expected, TypeCompareHint):
+        type_compare = normalize_type_compare(
+            expected.type_compare,
+            defaults=type_compare)
+        expected = expected.payload
+
+    comparer = find_comparer(expected, actual)
+    if type_compare['ordered'] and type_compare['list'] == 'existing':
+        # Not valid - let Compare say so
+        shards = None
+    elif comparer is compare_hashes and '__compare' not in expected:
+        shards = hash_shards(expected, actual, type_compare, workers)
+        shard_steps = 'hash_compare_steps'
+        iter_type = None
+    elif (comparer in (compare_lists, compare_tuples) and
+            is_shardable_list(expected, actual, type_compare, fail_fast)):
+        shards = list_shards(expected, actual, workers)
+        shard_steps = 'ordered_list_compare_steps'
+        iter_type = tuple if comparer is compare_tuples else list
+    else:
+        shards = None
+
+    if shards is None or len(shards) < 2:
+        return compare_class.compare(
+            expected,
+            actual,
+            type_compare,
+            names=names,
+            fail_fast=fail_fast)
+
+    name = find_named_dontcare(expected)
+    if name is not None:
+        raise kobold.ValidationError(
+            'Named DontCares cannot be used when comparing with workers '
+            '(found "{}")'.format(name))
+
+    results = run_shards(
+        compare_class,
+        shard_steps,
+        shards,
+        type_compare,
+        iter_type,
+        fail_fast,
+        workers)
+    if results is MISMATCH:
+        return MISMATCH
+    elif iter_type is None:
+        return merge_hash_results(results)
+    else:
+        return merge_list_results(
+            results,
+            shards,
+            max(len(expected), len(actual)),
+            iter_type)
+
+
+def run_shards(compare_class,
+               shard_steps,
+               shards,
+               type_compare,
+               iter_type,
+               fail_fast,
+               workers):
+    '''The result of each shard, in order - or MISMATCH as soon as any
+       shard mismatches, when failing fast'''
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    context = multiprocessing.get_context()
+    start_method = context.get_start_method()
+    if start_method == 'fork':
+        # Workers start with this process's registries as they are
+        initializer = None
+        initargs = ()
+    else:
+        initializer = install_registries
+        initargs = (registry_snapshot(start_method),)
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=initializer,
+        initargs=initargs)
+    wait = True
+    try:
+        futures = [
+            executor.submit(
+                compare_shard,
+                compare_class,
+                shard_steps,
+                shard_expected,
+                shard_actual,
+                type_compare,
+                iter_type,
+                fail_fast)
+            for (_, shard_expected, shard_actual) in shards]
+        if fail_fast:
+            for future in as_completed(futures):
+                if future.result() is not MATCH:
+                    # The shards still running are left to finish
+                    # on their own
+                    wait = False
+                    return MISMATCH
+        return [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def registry_snapshot(start_method):
+    '''What's been added with add_comparer, add_dontcare_rule,
+       add_hash_compare_types and add_list_compare_types (along with
+       the built-in rules and types), for install_registries to add
+       again in a worker'''
+    from . import (
+        comparers,
+        dontcare_rules,
+        hash_compare_types,
+        list_compare_types)
+    registries = (
+        dict(comparers),
+        dict(dontcare_rules),
+        hash_compare_types,
+        list_compare_types)
+    try:
+        pickle.dumps(registries)
+    except (pickle.PicklingError, AttributeError, TypeError) as error:
+        raise kobold.ValidationError(
+            'Comparers, DontCare rules and compare types must be '
+            'picklable to compare with workers that are started with '
+            '"{}" ({})'.format(start_method, error))
+    return registries
+
+
+def install_registries(registries):
+    (comparers, dontcare_rules, hash_compare_types, list_compare_types) = (
+        registries)
+    for (expected_type, actual_type), comparer in comparers.items():
+        add_comparer(expected_type, actual_type, comparer)
+    for rule, make_validator in dontcare_rules.items():
+        add_dontcare_rule(rule, make_validator)
+    add_hash_compare_types(hash_compare_types)
+    add_list_compare_types(list_compare_types)
+
+
+def compare_shard(compare_class,
+                  shard_steps,
+                  expected,
+                  actual,
+                  type_compare,
+                  iter_type,
+                  fail_fast):
+    steps = getattr(compare_class, shard_steps)
+    if iter_type is None:
+        step = steps(expected, actual, type_compare, {}, fail_fast)
+    else:
+        step = steps(expected, actual, type_compare, iter_type, {}, fail_fast)
+    return compare_class.run(step)
+
+
+def hash_shards(expected, actual, type_compare, workers):
+    '''(None, expected shard, actual shard) for each group of keys'''
+    keys = list(expected.keys())
+    if type_compare['hash'] == 'full':
+        keys.extend(key for key in actual.keys() if key not in expected)
+    if len(keys) < min_parallel_items:
+        return None
+
+    shards = []
+    for start, stop in shard_ranges(len(keys), workers):
+        shard_expected = {}
+        shard_actual = {}
+        for key in keys[start:stop]:
+            if key in expected:
+                shard_expected[key] = expected[key]
+            if key in actual:
+                shard_actual[key] = actual[key]
+        shards.append((None, shard_expected, shard_actual))
+    return shards
+
+
+def is_shardable_list(expected, actual, type_compare, fail_fast):
+    # Only lists compared index by index can be cut up - see
+    # Compare.list_compare_steps
+    ordered = (
+        isinstance(expected, OrderedList) or
+        (type_compare['ordered'] and not isinstance(expected, UnorderedList)))
+    return (
+        ordered and
+        isinstance(expected, (list, tuple)) and
+        isinstance(actual, (list, tuple)) and
+        (fail_fast or type_compare.get('alignment', 'index') == 'index') and
+        not any(isinstance(element, MultiMatch) for element in expected))
+
+
+def list_shards(expected, actual, workers):
+    '''(start index, expected shard, actual shard) for each range
+       of indexes'''
+    length = max(len(expected), len(actual))
+    if length < min_parallel_items:
+        return None
+    return [
+        (start, list(expected[start:stop]), list(actual[start:stop]))
+        for (start, stop) in shard_ranges(length, workers)]
+
+
+def shard_ranges(item_count, workers):
+    size = -(-item_count // (workers * shards_per_worker))
+    return [
+        (start, min(start + size, item_count))
+        for start in range(0, item_count, size)]
+
+
+def merge_hash_results(results):
+    mismatched = {}
+    for result in results:
+        if result is not MATCH:
+            mismatched.update(result.mismatched)
+    if mismatched:
+        return HashMismatch(mismatched)
+    else:
+        return MATCH
+
+
+def merge_list_results(results, shards, length, iter_type):
+    entries = []
+    for result, (start, _, _) in zip(results, shards):
+        if result is not MATCH:
+            entries.extend(
+                (start + expected_position, start + actual_position, sub)
+                for (expected_position, actual_position, sub)
+                in result.entries)
+    if entries:
+        return ListMismatch(entries, length, length, iter_type)
+    else:
+        return MATCH
+
+
+def find_named_dontcare(expected):
+    '''The name of a named DontCare somewhere in expected, or None'''
+    pending = [expected]
+    while pending:
+        expected = pending.pop()
+        if isinstance(expected, DontCare):
+            if expected.name is not None:
+                return expected.name
+        elif isinstance(expected, dict):
+            pending.extend(expected.values())
+        elif isinstance(expected, (list, tuple, set, frozenset)):
+            pending.extend(expected)
+        elif isinstance(expected, ParsingHint):
+            pending.append(expected.payload)
+        elif isinstance(expected, StructuredString):
+            pending.append(expected.arguments)
+    return None
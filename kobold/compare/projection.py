@@ -0,0 +1,204 @@
+'''Parsing just the parts of a JSON document that a comparison needs.
+
+When a JSONParsingHint's payload is a hash compared with
+type_compare "existing", the comparison only looks at the keys in the
+payload - nothing else in the document needs to be kept, and nothing
+after the last of those keys needs to be read at all.  With a "json"
+type_compare setting of "projected", json_projection works out which
+parts of the document are needed, and parse_json_projection parses
+those, skipping over the rest (and stopping as soon as it has every
+top-level key it needs).
+
+Once it stops, the rest of the document is only scanned to check that
+its strings end and its brackets close in the right order - so a
+document that's been cut short still doesn't parse - but it isn't
+checked to be entirely valid JSON.  And if a key is repeated, the first
+value may be used rather than the last.  That's why it has to be asked
+for: without the setting, the whole document is parsed, and has to be
+valid.'''
+
+import json
+import json.scanner
+import re
+
+from . import acts_like_a_hash, normalize_type_compare
+from .hints import TypeCompareHint
+
+whitespace = re.compile(r'[ \t\n\r]*')
+
+scan_once = json.scanner.make_scanner(json.JSONDecoder())
+scan_string = json.decoder.scanstring
+
+# For check_closes: every byte but a quote or a bracket, and a string
+# (once there's nothing left in it but brackets)
+not_quote_or_bracket = bytes(
+    byte for byte in range(256) if byte not in b'"[]{}')
+reduced_string = re.compile(rb'"[^"]*"')
+closing = {'{': '}', '[': ']'}
+
+# After this many passes of removing the innermost pairs of brackets,
+# check_closes goes through them one by one instead
+max_bracket_passes = 64
+
+
+def json_projection(payload, type_compare):
+    '''A dict of the keys needed from a JSON object to compare it with
+       payload, mapping each to the projection for its value - or None,
+       if the whole value has to be parsed'''
+    type_compare = normalize_type_compare(type_compare)
+    while isinstance(payload, TypeCompareHint):
+        type_compare = normalize_type_compare(
+            payload.type_compare,
+            defaults=type_compare)
+        payload = payload.payload
+    if type(payload) is not dict:
+        return None
+
+    if '__compare' in payload:
+        compare_override = payload['__compare']
+        if acts_like_a_hash(compare_override):
+            type_compare = normalize_type_compare(compare_override)
+        elif isinstance(compare_override, str):
+            type_compare = type_compare.derive(compare_override)
+        else:
+            type_compare = type_compare.derive({'hash': compare_override})
+    if (type_compare.get('json') != 'projected' or
+            type_compare['hash'] != 'existing'):
+        return None
+
+    projection = {}
+    for key, value in payload.items():
+        if key == '__compare':
+            continue
+        if not isinstance(key, str):
+            # Can't be a key in a JSON object, so parse it all,
+            # and let the comparison say so
+            return None
+        projection[key] = json_projection(value, type_compare)
+    return projection
+
+
+def parse_json_projection(document, projection):
+    '''The object in document, with just the keys in projection.
+       Raises ValueError (or IndexError, or StopIteration, at the
+       end of the document) if it isn't valid JSON.'''
+    value, index, still_open = parse_object(document, 0, projection, False)
+    if still_open:
+        check_closes(document, index, still_open)
+    elif whitespace.match(document, index).end() != len(document):
+        raise ValueError('Extra data at {}'.format(index))
+    return value
+
+
+def parse_object(document, index, projection, need_end):
+    '''(object, the index just after it, 0).  Unless need_end, this
+       stops once it has all of the keys in projection, and returns
+       (object, where it stopped, how many objects it stopped inside).'''
+    index = whitespace.match(document, index).end()
+    if document[index] != '{':
+        # Not an object, so it can't match anyway - but parse it
+        # so the diff shows what it is
+        value, index = scan_once(document, index)
+        return value, index, 0
+
+    parsed = {}
+    remaining = len(projection)
+    index += 1
+    if remaining == 0 and not need_end:
+        return parsed, index, 1
+    while True:
+        index = whitespace.match(document, index).end()
+        if document[index] == '}':
+            return parsed, index + 1, 0
+        elif document[index] != '"':
+            raise ValueError('Expected a key at {}'.format(index))
+        key, index = scan_string(document, index + 1)
+        index = whitespace.match(document, index).end()
+        if document[index] != ':':
+            raise ValueError('Expected ":" at {}'.format(index))
+        index = whitespace.match(document, index + 1).end()
+
+        still_open = 0
+        if key in projection:
+            last_needed = remaining == 1 and key not in parsed
+            if projection[key] is None:
+                value, index = scan_once(document, index)
+            else:
+                value, index, still_open = parse_object(
+                    document,
+                    index,
+                    projection[key],
+                    need_end or not last_needed)
+            if key not in parsed:
+                remaining -= 1
+            parsed[key] = value
+            if remaining == 0 and not need_end:
+                return parsed, index, still_open + 1
+        else:
+            index = skip_value(document, index)
+
+        index = whitespace.match(document, index).end()
+        if document[index] == ',':
+            index += 1
+        elif document[index] != '}':
+            raise ValueError('Expected "," or "}}" at {}'.format(index))
+
+
+def check_closes(document, index, still_open):
+    '''Raises ValueError unless the rest of document, from index,
+       closes the still_open objects it's in - with every string
+       ended, and every bracket closed in order'''
+    # Cut down to just the quotes and brackets (with escaped quotes
+    # and backslashes taken out first), with bytes methods, which are
+    # much quicker than going through it here
+    rest = document[index:].encode('utf-8')
+    if b'\\' in rest:
+        rest = rest.replace(b'\\\\', b'').replace(b'\\"', b'')
+    rest = rest.translate(None, not_quote_or_bracket)
+    without_strings = rest.replace(b'""', b'')
+    if b'"' in without_strings:
+        # Some strings have brackets in them (or don't end)
+        without_strings = reduced_string.sub(b'', rest)
+        if b'"' in without_strings:
+            raise ValueError('Unterminated string after {}'.format(index))
+    brackets = without_strings
+
+    for _ in range(max_bracket_passes):
+        inner_removed = brackets.replace(b'{}', b'').replace(b'[]', b'')
+        if inner_removed == brackets:
+            break
+        brackets = inner_removed
+    else:
+        brackets = close_brackets(brackets.decode('ascii'))
+    if brackets != b'}' * still_open:
+        raise ValueError('Brackets not closed in order after {}'.format(
+            index))
+    if not document.rstrip(' \t\n\r').endswith('}'):
+        raise ValueError('Extra data after the object')
+
+
+def close_brackets(brackets):
+    '''The closing brackets left in brackets once each opening
+       bracket has been matched with the one that closes it'''
+    opened = []
+    unmatched = []
+    for bracket in brackets:
+        if bracket in closing:
+            opened.append(closing[bracket])
+        elif opened:
+            if opened.pop() != bracket:
+                raise ValueError('Brackets not closed in order')
+        else:
+            unmatched.append(bracket)
+    if opened:
+        raise ValueError('Unexpected end of document')
+    return ''.join(unmatched).encode('ascii')
+
+
+def skip_value(document, index):
+    '''The index just after the value that starts at index'''
+    # Finding the end of a value in Python (counting brackets, and
+    # stepping over strings) turns out to be slower than json's C
+    # scanner parsing it, so the value is parsed and thrown away
+    _, index = scan_once(document, index)
+    return index
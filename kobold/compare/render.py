@@ -0,0 +1,99 @@
+'''Comparison results as text, one line for each mismatch:
+
+    body.items[3].price: expected 10, got 12
+
+Only the mismatched leaves of a result are visited (see
+CompareResult.leaves), and the lines are written out as they're made,
+so a huge diff can go straight to a file.  Long values are shortened,
+and max_chars limits how much is written in all - the mismatches that
+didn't fit are counted in a last line instead.'''
+
+import io
+import reprlib
+
+import kobold
+from .result import Inserted, TruncatedMismatch
+
+# How values are shortened in a line
+value_repr = reprlib.Repr()
+value_repr.maxlevel = 3
+value_repr.maxdict = 10
+value_repr.maxlist = 10
+value_repr.maxtuple = 10
+value_repr.maxset = 10
+value_repr.maxstring = 100
+value_repr.maxother = 100
+
+# The end of a line that was cut short
+ellipsis = '...'
+
+
+def render(result, max_chars=None):
+    '''The text for result (a mismatched CompareResult)'''
+    out = io.StringIO()
+    write(result, out, max_chars=max_chars)
+    return out.getvalue()
+
+
+def write(result, out, max_chars=None):
+    '''Write the text for result to out (a text file), stopping
+       before max_chars characters (if it's given), and then saying
+       how many mismatches were left out.  The first line is always
+       written, cut short if it has to be.'''
+    written = 0
+    remaining = 0
+    for path, leaf in result.leaves():
+        if remaining:
+            remaining += 1
+            continue
+        expected, actual = leaf.diff()
+        line = format_mismatch(path, expected, actual) + '\n'
+        if max_chars is not None and written + len(line) > max_chars:
+            if written:
+                remaining = 1
+                continue
+            cut = max(max_chars - len(ellipsis) - 1, 0)
+            line = line[:cut] + ellipsis + '\n'
+        out.write(line)
+        written += len(line)
+
+    if isinstance(result, TruncatedMismatch):
+        remaining += result.skipped
+    if remaining == 1:
+        out.write('... 1 more mismatch\n')
+    elif remaining:
+        out.write('... {:,} more mismatches\n'.format(remaining))
+
+
+def format_mismatch(path, expected, actual):
+    if actual is kobold.NotPresent:
+        text = 'expected {}, but it is missing'.format(format_value(expected))
+    elif expected is kobold.NotPresent:
+        text = 'not expected, got {}'.format(format_value(actual))
+    else:
+        text = 'expected {}, got {}'.format(
+            format_value(expected),
+            format_value(actual))
+    if path:
+        return '{}: {}'.format(format_path(path), text)
+    return text
+
+
+def format_path(path):
+    '''body.items[3].price, for ('body', 'items', 3, 'price').  Something
+       only in an actual list shows its position there, as [3 in actual].'''
+    parts = []
+    for key in path:
+        if isinstance(key, str) and key.isidentifier():
+            if parts:
+                parts.append('.')
+            parts.append(key)
+        elif isinstance(key, Inserted):
+            parts.append('[{} in actual]'.format(key.position))
+        else:
+            parts.append('[{!r}]'.format(key))
+    return ''.join(parts)
+
+
+def format_value(value):
+    return value_repr.repr(value)
@@ -0,0 +1,412 @@
+'''The objects that comparisons return.
+
+Compare.compare used to return either the string "match", or a tuple of
+two nested diffs (the mismatched parts of expected, and the mismatched
+parts of actual), built eagerly at every level of the comparison.  It
+now returns a CompareResult, which is truthy for a match, and records
+just enough about each mismatch to build that same pair of diffs when
+diff() is called.
+
+For compatibility, a CompareResult still compares equal to "match" (or
+to the diff tuple), and can be unpacked into its two diffs.
+
+Those nested diffs show a "_" for every element of a list that matched,
+so one mismatch in a long list makes two diffs just as long.  Nothing
+is built that way until diff() is called - the results only keep their
+mismatched parts - and sparse_diff() gives the same mismatches keyed by
+path instead, which is only as big as the number of mismatches.'''
+
+
+class Inserted(object):
+    '''The path element for something only in the actual list, at
+       position there.  The other path elements of a list are
+       positions in the expected list.'''
+    __slots__ = ('position',)
+
+    def __init__(self, position):
+        self.position = position
+
+    def __eq__(self, other):
+        return isinstance(other, Inserted) and other.position == self.position
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((Inserted, self.position))
+
+    def __repr__(self):
+        return 'Inserted({})'.format(self.position)
+
+
+class CompareResult(object):
+    __slots__ = ('_diff',)
+    matched = False
+
+    def __init__(self):
+        self._diff = None
+
+    def __bool__(self):
+        return self.matched
+
+    def diff(self):
+        '''The pair of nested diffs (expected, actual) that
+           compare has always returned for a mismatch, or "match"'''
+        if self._diff is None:
+            # Build the diffs of the nested results first (deepest
+            # first), without recursing, so that build_diff only ever
+            # needs the cached diffs of its parts
+            pending = [self]
+            unbuilt = []
+            while pending:
+                result = pending.pop()
+                unbuilt.append(result)
+                pending.extend(
+                    part for part in result.parts() if part._diff is None)
+            for result in reversed(unbuilt):
+                if result._diff is None:
+                    result._diff = result.build_diff()
+        return self._diff
+
+    def build_diff(self):
+        raise NotImplementedError()
+
+    def parts(self):
+        '''The CompareResults that build_diff builds on'''
+        return ()
+
+    def children(self):
+        '''(path element, CompareResult) for each mismatched part
+           of this result.  Empty for a leaf.'''
+        return ()
+
+    def leaves(self):
+        '''Yields (path, CompareResult) for each mismatched leaf, where
+           path is a tuple of the keys and indexes leading to it.  No
+           diffs are built.'''
+        # Each path is kept as (parent's path, key) until it's yielded,
+        # so that a deep result doesn't copy a longer tuple at each level
+        stack = [(None, self)]
+        while stack:
+            link, result = stack.pop()
+            children = result.children()
+            if children:
+                for key, child in reversed(children):
+                    stack.append(((link, key), child))
+            elif not result.matched:
+                path = []
+                while link is not None:
+                    link, key = link
+                    path.append(key)
+                path.reverse()
+                yield (tuple(path), result)
+
+    def mismatches(self):
+        '''Yields (path, expected, actual) for each mismatched leaf,
+           where expected and actual are what the diff shows there.'''
+        for path, result in self.leaves():
+            expected, actual = result.diff()
+            yield (path, expected, actual)
+
+    def paths(self):
+        '''The path of every mismatched leaf'''
+        return [path for (path, _) in self.leaves()]
+
+    def sparse_diff(self):
+        '''{path: (expected, actual)} for each mismatched leaf - the
+           diff without the "_" placeholders'''
+        return dict(
+            (path, (expected, actual))
+            for (path, expected, actual) in self.mismatches())
+
+    # Compatibility with results that were "match" or a tuple
+
+    def __eq__(self, other):
+        if isinstance(other, CompareResult):
+            if self.matched or other.matched:
+                return self.matched == other.matched
+            return self.diff() == other.diff()
+        return self.diff() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __iter__(self):
+        return iter(self.diff())
+
+    def __len__(self):
+        return len(self.diff())
+
+    def __getitem__(self, index):
+        return self.diff()[index]
+
+    def __repr__(self):
+        return repr(self.diff())
+
+
+class Match(CompareResult):
+    __slots__ = ()
+    matched = True
+
+    def build_diff(self):
+        return 'match'
+
+    def __reduce__(self):
+        # There's only the one MATCH, even once it's been pickled
+        # (by a worker process, say)
+        return 'MATCH'
+
+
+MATCH = Match()
+
+
+class Mismatch(CompareResult):
+    '''A leaf of the diff - these are the values that are displayed'''
+    __slots__ = ('expected', 'actual')
+
+    def __init__(self, expected, actual):
+        super().__init__()
+        self.expected = expected
+        self.actual = actual
+
+    def build_diff(self):
+        return (self.expected, self.actual)
+
+
+class DisplayMismatch(CompareResult):
+    '''A leaf whose values are worked out by Compare.display (which
+       diffs two unrelated values as well as it can) - but only
+       when the diff is asked for.  Hints are displayed with whatever
+       they parsed during the comparison, rather than parsing again.'''
+    __slots__ = ('compare_class', 'expected', 'actual', 'parse_cache')
+
+    def __init__(self, compare_class, expected, actual):
+        from . import current_parse_cache
+        super().__init__()
+        self.compare_class = compare_class
+        self.expected = expected
+        self.actual = actual
+        self.parse_cache = current_parse_cache.get()
+
+    def build_diff(self):
+        from . import current_parse_cache
+        token = current_parse_cache.set(self.parse_cache)
+        try:
+            return (
+                self.compare_class.display(self.expected, self.actual),
+                self.compare_class.display(self.actual, self.expected))
+        finally:
+            current_parse_cache.reset(token)
+
+
+class HashMismatch(CompareResult):
+    __slots__ = ('mismatched',)
+
+    def __init__(self, mismatched):
+        '''mismatched maps each mismatched key to its CompareResult'''
+        super().__init__()
+        self.mismatched = mismatched
+
+    def build_diff(self):
+        expected_diff = {}
+        actual_diff = {}
+        for key, result in self.mismatched.items():
+            expected_diff[key], actual_diff[key] = result.diff()
+        return (expected_diff, actual_diff)
+
+    def children(self):
+        return list(self.mismatched.items())
+
+    def parts(self):
+        return self.mismatched.values()
+
+
+class ListMismatch(CompareResult):
+    '''The diff of two lists shows an entry for every element, with
+       "_" standing in for the elements that matched.  Only the
+       mismatched entries are stored here.
+
+       If a DiffBudget left some mismatches out (truncated), a "_"
+       could be one of those, so instead each side of the diff is a
+       dict of just the recorded entries, by position.'''
+    __slots__ = (
+        'entries',
+        'expected_length',
+        'actual_length',
+        'iter_type',
+        'truncated')
+
+    def __init__(self,
+                 entries,
+                 expected_length,
+                 actual_length,
+                 iter_type,
+                 truncated=False):
+        '''entries is a list of (expected_position, actual_position,
+           CompareResult).  The expected side of the result's diff is
+           shown at expected_position in the expected list, and the
+           actual side at actual_position in the actual list.  Either
+           position may be None, for something that only shows up
+           on one side.'''
+        super().__init__()
+        self.entries = entries
+        self.expected_length = expected_length
+        self.actual_length = actual_length
+        self.iter_type = iter_type
+        self.truncated = truncated
+
+    def build_diff(self):
+        if self.truncated:
+            expected_diff = {}
+            actual_diff = {}
+        else:
+            expected_diff = ['_'] * self.expected_length
+            actual_diff = ['_'] * self.actual_length
+        for (expected_position, actual_position, result) in self.entries:
+            expected_sub, actual_sub = result.diff()
+            if expected_position is not None:
+                expected_diff[expected_position] = expected_sub
+            if actual_position is not None:
+                actual_diff[actual_position] = actual_sub
+        if self.truncated:
+            return (expected_diff, actual_diff)
+        return (self.iter_type(expected_diff), self.iter_type(actual_diff))
+
+    def children(self):
+        children = []
+        for (expected_position, actual_position, result) in self.entries:
+            if expected_position is None:
+                children.append((Inserted(actual_position), result))
+            else:
+                children.append((expected_position, result))
+        return children
+
+    def parts(self):
+        return [result for (_, _, result) in self.entries]
+
+
+class SetMismatch(CompareResult):
+    '''Sets are compared as unordered lists, but the diff is shown
+       as a pair of sets, without the "_" placeholders.  Since set
+       elements have no position, this is a leaf.'''
+    __slots__ = ('list_result',)
+
+    def __init__(self, list_result):
+        super().__init__()
+        self.list_result = list_result
+
+    def parts(self):
+        return self.list_result.parts()
+
+    def build_diff(self):
+        # Straight from the mismatched entries, rather than from the
+        # list diffs, which would be as long as the sets
+        expected_diff = set()
+        actual_diff = set()
+        for (expected_position, actual_position, result) in (
+                self.list_result.entries):
+            expected_sub, actual_sub = result.diff()
+            if expected_position is not None:
+                expected_diff.add(expected_sub)
+            if actual_position is not None:
+                actual_diff.add(actual_sub)
+        return (expected_diff, actual_diff)
+
+
+class ArrayMismatch(CompareResult):
+    '''Two numpy arrays that don't match.  Rather than showing every
+       element, each side of the diff summarizes its array: its shape
+       and dtype and - when the shapes agree - how many elements
+       differ, the values of the first few of those (by index), and
+       the largest absolute difference between them, for numbers.'''
+    __slots__ = (
+        'expected',
+        'actual',
+        'count',
+        'indices',
+        'expected_values',
+        'actual_values',
+        'max_abs_error')
+
+    def __init__(self,
+                 expected,
+                 actual,
+                 count=None,
+                 indices=(),
+                 expected_values=(),
+                 actual_values=(),
+                 max_abs_error=None):
+        '''count is None if the shapes of the arrays differ'''
+        super().__init__()
+        self.expected = expected
+        self.actual = actual
+        self.count = count
+        self.indices = indices
+        self.expected_values = expected_values
+        self.actual_values = actual_values
+        self.max_abs_error = max_abs_error
+
+    def summarize(self, array, values):
+        summary = {'shape': array.shape, 'dtype': str(array.dtype)}
+        if self.count is not None:
+            summary['mismatched'] = self.count
+            summary['values'] = dict(zip(self.indices, values))
+            if self.max_abs_error is not None:
+                summary['max_abs_error'] = self.max_abs_error
+        return summary
+
+    def build_diff(self):
+        return (
+            self.summarize(self.expected, self.expected_values),
+            self.summarize(self.actual, self.actual_values))
+
+
+class StreamMismatch(CompareResult):
+    '''Two iterables, compared element by element as they're read.
+       Only the mismatched elements are kept, so each side of the diff
+       is a dict of them by index, rather than a list.  stopped is True
+       if the comparison gave up at its limit of mismatches, before
+       reaching the end of both iterables.'''
+    __slots__ = ('entries', 'stopped')
+
+    def __init__(self, entries, stopped):
+        '''entries is a list of (index, CompareResult)'''
+        super().__init__()
+        self.entries = entries
+        self.stopped = stopped
+
+    def build_diff(self):
+        expected_diff = {}
+        actual_diff = {}
+        for index, result in self.entries:
+            expected_diff[index], actual_diff[index] = result.diff()
+        return (expected_diff, actual_diff)
+
+    def children(self):
+        return list(self.entries)
+
+    def parts(self):
+        return [result for (_, result) in self.entries]
+
+
+class TruncatedMismatch(CompareResult):
+    '''A mismatch with only part of its detail - result, as far as
+       the comparison's DiffBudget went - and how many more mismatches
+       were found (skipped) but left out of it'''
+    __slots__ = ('result', 'skipped')
+
+    def __init__(self, result, skipped):
+        super().__init__()
+        self.result = result
+        self.skipped = skipped
+
+    def build_diff(self):
+        return self.result.diff()
+
+    def children(self):
+        return self.result.children()
+
+    def parts(self):
+        return (self.result,)
@@ -1,9 +1,5 @@
-import asyncio
 import fnmatch
-import inspect
-import pprint
 import types
-import uuid
 
 from kobold import (
     compare,
@@ -20,6 +16,7 @@ async def wrap_with_coroutine(
         raise raises
 
     if is_call:
+        import inspect
         if inspect.isawaitable(returns):
             returns = await returns
 
@@ -309,6 +306,7 @@ class RoutableStubFunction(object):
             route_priority=0,
             replace_route=False):
         if key is None:
+            import uuid
             key = uuid.uuid4().hex
         if route is None:
             route = Route(
@@ -354,9 +352,7 @@ class RoutableStubFunction(object):
         for key, route in self.routes.items():
             condition = route.condition
             if isinstance(condition, Condition):
-                if condition.compare(
-                        args,
-                        kwargs) == 'match':
+                if condition.matches(args, kwargs):
                     candidates.append((key, route))
                 continue
 
@@ -383,10 +379,10 @@ class RoutableStubFunction(object):
             else:
                 raise Exception("Unknown condition type: %s" % type(condition))
 
-            if compare.compare(
+            if compare.matches(
                     condition, 
                     thing_to_compare, 
-                    type_compare='existing') == 'match':
+                    type_compare='existing'):
                 candidates.append((key, route))
 
         if len(candidates) == 0:
@@ -418,6 +414,7 @@ class RoutableStubFunction(object):
         candidates = self.get_candidates(args, kwargs)
 
         if len(candidates) > 1:
+            import pprint
             raise StubRoutingException(
                 "More than one route candidate for stub: \n{}".format(
                     pprint.pformat(candidates)
@@ -425,6 +422,7 @@ class RoutableStubFunction(object):
             )
 
         if len(candidates) == 0:
+            import pprint
             raise StubRoutingException(
                 "No route candidates for stub\n{}\n\nRoutes:\n{}".format(
                     pprint.pformat((args, kwargs)),
@@ -501,15 +499,23 @@ class Condition:
         self.exclusive_args = exclusive_args
         self.kwargs.update(exclusive_args)
 
-    def compare(self, args, kwargs):
-        normalized_kwargs = hash_functions.get_from_args_and_kwargs(
+    def normalize(self, args, kwargs):
+        return hash_functions.get_from_args_and_kwargs(
             args=args,
             kwargs=kwargs,
             arg_names=self.arg_names,
             exclusive_args=self.exclusive_args)
+
+    def compare(self, args, kwargs):
         return compare.compare(
             self.kwargs,
-            normalized_kwargs,
+            self.normalize(args, kwargs),
+            type_compare='existing')
+
+    def matches(self, args, kwargs):
+        return compare.matches(
+            self.kwargs,
+            self.normalize(args, kwargs),
             type_compare='existing')
 
     def update(self, kwargs):
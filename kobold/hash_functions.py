@@ -1,5 +1,4 @@
 import kobold
-import six
 
 
 def project(hash_in, attributes):
@@ -104,20 +103,43 @@ class HashableList(list):
 
 
 def make_hashable(data_structure):
-    if kobold.compare.acts_like_a_list(data_structure):
-        new_data_structure = HashableList()
-        for element in data_structure:
-            new_data_structure.append(make_hashable(element))
-        return new_data_structure
-    elif kobold.compare.acts_like_a_hash(data_structure):
-        new_data_structure = HashableDict()
-        for key, value in data_structure.items():
-            new_key = make_hashable(key)
-            new_value = make_hashable(value)
-            new_data_structure[new_key] = new_value
-        return new_data_structure
-    else:
-        return data_structure
+    # Work out the order of the conversion with an explicit stack
+    # (rather than recursing), so that any depth of nesting is fine.
+    # Each list or dict is recorded along with how many values it
+    # will be built from, and then everything is built bottom up.
+    pending = [data_structure]
+    order = []
+    while pending:
+        node = pending.pop()
+        if kobold.compare.acts_like_a_list(node):
+            elements = list(node)
+            order.append((HashableList, len(elements)))
+            pending.extend(elements)
+        elif kobold.compare.acts_like_a_hash(node):
+            items = list(node.items())
+            order.append((HashableDict, len(items) * 2))
+            for key, value in items:
+                pending.append(key)
+                pending.append(value)
+        else:
+            order.append((None, node))
+
+    built = []
+    for (new_type, value) in reversed(order):
+        if new_type is None:
+            built.append(value)
+            continue
+        start = len(built) - value
+        values = built[start:]
+        del built[start:]
+        new_data_structure = new_type()
+        if new_type is HashableList:
+            new_data_structure.extend(values)
+        else:
+            for index in range(0, len(values), 2):
+                new_data_structure[values[index]] = values[index + 1]
+        built.append(new_data_structure)
+    return built[0]
 
 
 def get_from_args_and_kwargs(
@@ -41,11 +41,11 @@ def response_matches(expected,
     type_compare can be set to "existing" to change this behavior.
 
     Ultimately, the expected and response hashes are compared using
-    kobold.compare, and the result is returned.  In the case of a match,
-    the result will be the string "match".  In the case of a mismatch,
-    the result will be a tuple of two elements - the first describing
-    the mismatched values in the first argument, and the second
-    describing the mismatched values in the second argument.
+    kobold.compare, and the result (a CompareResult) is returned.  A
+    match is truthy, and compares equal to the string "match".  For a
+    mismatch, result.diff() is a tuple of two elements - the first
+    describing the mismatched values in the first argument, and the
+    second describing the mismatched values in the second argument.
     '''
 
     if expected is None:
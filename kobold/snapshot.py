@@ -0,0 +1,297 @@
+'''Golden snapshots, kept in one compact file per store.
+
+A snapshot store is a single binary file of named snapshots - plain data
+(hashes, lists, tuples, sets, strings, bytes, numbers, booleans and
+None), each pickled into its own record - followed by an index of where
+each record is, and a small trailer pointing at the index.  Opening a
+store reads just the index.  The file is memory-mapped, and a snapshot
+is only unpickled when a test asks for it.
+
+    store = SnapshotStore('test/snapshots/orders.kobold')
+    store.assert_matches('list_orders', response_body)
+
+assert_matches compares with kobold.compare, with the snapshot as the
+expected value.  In update mode (update=True, or the
+KOBOLD_UPDATE_SNAPSHOTS environment variable set), a snapshot that
+doesn't match, or doesn't exist yet, is replaced with the actual value
+instead of failing, and save() writes the changes.  Changed snapshots go
+after the existing records, which are copied over as they are (never
+unpickled and pickled again), followed by a new index.  compact()
+leaves out the records that have been replaced.  Either way, the new
+file is written alongside the old one and only then moved into place,
+so a save that fails part way leaves the store as it was.'''
+
+import collections.abc
+import io
+import mmap
+import os
+import pickle
+import stat
+import struct
+import tempfile
+
+import kobold
+
+magic = b'KOBOLDSNAP1\n'
+
+# The last bytes of the file: where the index starts, then trailer_magic
+trailer = struct.Struct('<Q8s')
+trailer_magic = b'KOBIDX01'
+
+
+# How much of the old file save copies at a time
+copy_chunk_size = 1 << 20
+
+
+def record_length(record):
+    if isinstance(record, tuple):
+        start, end = record
+        return end - start
+    return len(record)
+
+
+class PlainDataPickler(pickle.Pickler):
+    '''Pickles plain data only - the pickler only calls
+       reducer_override for other kinds of objects.  (Fingerprints are
+       made with this too - see kobold.compare.fingerprint.)'''
+
+    def reducer_override(self, obj):
+        raise kobold.ValidationError(
+            'Snapshots can only hold plain data, not {}'.format(type(obj)))
+
+
+class PlainDataUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(
+            'Snapshots can only hold plain data, not {}.{}'.format(
+                module,
+                name))
+
+
+def dumps(value):
+    buffer = io.BytesIO()
+    PlainDataPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(value)
+    return buffer.getvalue()
+
+
+def loads(data):
+    return PlainDataUnpickler(io.BytesIO(data)).load()
+
+
+def normalize(value):
+    '''value as plain data - any other kind of hash becomes a dict'''
+    if isinstance(value, collections.abc.Mapping):
+        if type(value) is not dict:
+            value = dict(value)
+        return dict((key, normalize(item)) for (key, item) in value.items())
+    elif type(value) is list:
+        return [normalize(item) for item in value]
+    elif type(value) is tuple:
+        return tuple(normalize(item) for item in value)
+    else:
+        return value
+
+
+class SnapshotStore(object):
+    '''The snapshots in the store file at path (which is created when
+       the first snapshot is saved)'''
+    def __init__(self, path, update=None):
+        if update is None:
+            update = bool(os.environ.get('KOBOLD_UPDATE_SNAPSHOTS'))
+        self.path = path
+        self.update = update
+        # name -> (offset, length) of each record in the file
+        self.index = {}
+        # Where the records end and the index starts
+        self.data_end = len(magic)
+        # name -> record, for snapshots changed since the file was read
+        self.changed = {}
+        self.file = None
+        self.map = None
+        self.closed = False
+        if os.path.exists(path):
+            self.open()
+
+    def __repr__(self):
+        return 'SnapshotStore({!r})'.format(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.save()
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.changed or name in self.index
+
+    def names(self):
+        return sorted(set(self.index) | set(self.changed))
+
+    def open(self):
+        self.file = open(self.path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file can't be mapped
+            self.unmap()
+            raise kobold.ValidationError(
+                '{} is not a snapshot store'.format(self.path))
+        if (self.map[:len(magic)] != magic or
+                len(self.map) < len(magic) + trailer.size):
+            self.unmap()
+            raise kobold.ValidationError(
+                '{} is not a snapshot store'.format(self.path))
+        index_offset, end_magic = trailer.unpack(self.map[-trailer.size:])
+        if end_magic != trailer_magic:
+            self.unmap()
+            raise kobold.ValidationError(
+                '{} is not a snapshot store'.format(self.path))
+        self.index = loads(self.map[index_offset:-trailer.size])
+        self.data_end = index_offset
+
+    def close(self):
+        '''Close the file.  The store can't be used after this.'''
+        self.unmap()
+        self.closed = True
+
+    def unmap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def check_open(self):
+        if self.closed:
+            raise kobold.ValidationError(
+                'The snapshot store {} has been closed'.format(self.path))
+
+    def load(self, name):
+        '''The snapshot called name.  Raises KeyError if there
+           isn't one.'''
+        self.check_open()
+        if name in self.changed:
+            return loads(self.changed[name])
+        offset, length = self.index[name]
+        return loads(self.map[offset:offset + length])
+
+    def put(self, name, value):
+        '''Set the snapshot called name (written by save)'''
+        self.check_open()
+        self.changed[name] = dumps(normalize(value))
+
+    def assert_matches(self,
+                       name,
+                       actual,
+                       type_compare=None,
+                       exception_context=None):
+        '''Raise an AssertionError if actual doesn't match the snapshot
+           called name - unless in update mode, where the snapshot is
+           replaced with actual instead'''
+        if name not in self:
+            if self.update:
+                self.put(name, actual)
+                return
+            raise AssertionError('No snapshot named {} in {}'.format(
+                name,
+                self.path))
+
+        result = kobold.compare.compare(
+            self.load(name),
+            actual,
+            type_compare=type_compare)
+        if not result:
+            if self.update:
+                self.put(name, actual)
+            else:
+                kobold.assertions.raise_if_not_match(
+                    result,
+                    exception_context=exception_context)
+
+    def save(self):
+        '''Write the snapshots that have changed, after the records
+           already in the file, and a new index'''
+        self.check_open()
+        if not self.changed:
+            return
+        index = dict(self.index)
+        offset = self.data_end
+        records = []
+        for name in sorted(self.changed):
+            record = self.changed[name]
+            records.append(record)
+            index[name] = (offset, len(record))
+            offset += len(record)
+        if self.map is None:
+            existing = magic
+        else:
+            existing = (0, self.data_end)
+        self.replace_file([existing] + records, index)
+        self.changed = {}
+
+    def compact(self):
+        '''Rewrite the file with just the current snapshots'''
+        self.check_open()
+        index = {}
+        offset = len(magic)
+        records = [magic]
+        for name in self.names():
+            if name in self.changed:
+                record = self.changed[name]
+            else:
+                record_offset, length = self.index[name]
+                record = (record_offset, record_offset + length)
+            records.append(record)
+            index[name] = (offset, record_length(record))
+            offset += record_length(record)
+        self.replace_file(records, index)
+        self.changed = {}
+
+    def replace_file(self, records, index):
+        '''Write records (the bytes of the file up to its index - each
+           either bytes, or the (start, end) of bytes to copy from the
+           current file) and index to a new file, move it into place,
+           and open it'''
+        # Named uniquely, so that processes saving the same store at
+        # once don't write over each other's new file
+        descriptor, temporary_path = tempfile.mkstemp(
+            prefix=os.path.basename(self.path) + '.',
+            suffix='.tmp',
+            dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(descriptor, 'wb') as data_file:
+                # mkstemp makes the file readable by its owner only
+                os.chmod(temporary_path, self.file_mode())
+                for record in records:
+                    if isinstance(record, tuple):
+                        # A piece at a time, rather than all in memory
+                        start, end = record
+                        for chunk in range(start, end, copy_chunk_size):
+                            chunk_end = min(chunk + copy_chunk_size, end)
+                            data_file.write(self.map[chunk:chunk_end])
+                    else:
+                        data_file.write(record)
+                index_offset = data_file.tell()
+                data_file.write(dumps(index))
+                data_file.write(trailer.pack(index_offset, trailer_magic))
+                data_file.flush()
+                os.fsync(data_file.fileno())
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        self.unmap()
+        os.replace(temporary_path, self.path)
+        self.open()
+
+    def file_mode(self):
+        '''The permissions the old file had - or for a new store, the
+           ones open would have given it'''
+        if os.path.exists(self.path):
+            return stat.S_IMODE(os.stat(self.path).st_mode)
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
@@ -1,6 +1,3 @@
-import asyncio
-import inspect
-
 from kobold import compare, doubles
 
 
@@ -111,6 +108,8 @@ class SafeSwap(object):
             before=None,
             after=None,
             on_failure=None):
+        import asyncio
+
         if asyncio.iscoroutinefunction(decorated_function):
             async def decorator(*args, **kwargs):
                 if before:
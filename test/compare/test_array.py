@@ -0,0 +1,203 @@
+import unittest
+
+from kobold import compare
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestArrayCompare(unittest.TestCase):
+    def test_exact_match(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                numpy.arange(1000),
+                numpy.arange(1000)))
+
+    def test_exact_mismatch(self):
+        actual = numpy.arange(1000, dtype=float)
+        actual[[3, 500]] += 0.5
+        result = compare.compare(numpy.arange(1000, dtype=float), actual)
+        self.assertFalse(result)
+        self.assertEqual(2, result.count)
+        self.assertEqual(
+            ({'shape': (1000,),
+              'dtype': 'float64',
+              'mismatched': 2,
+              'values': {3: 3.0, 500: 500.0},
+              'max_abs_error': 0.5},
+             {'shape': (1000,),
+              'dtype': 'float64',
+              'mismatched': 2,
+              'values': {3: 3.5, 500: 500.5},
+              'max_abs_error': 0.5}),
+            result)
+
+    def test_only_the_first_mismatches_are_shown(self):
+        result = compare.compare(numpy.zeros(100), numpy.ones(100))
+        self.assertEqual(100, result.count)
+        expected_diff, actual_diff = result
+        self.assertEqual(
+            list(range(compare.max_array_mismatches)),
+            list(actual_diff['values']))
+
+    def test_multidimensional_indices(self):
+        actual = numpy.zeros((3, 4))
+        actual[1, 2] = -2
+        expected_diff, actual_diff = compare.compare(
+            numpy.zeros((3, 4)),
+            actual)
+        self.assertEqual({(1, 2): -2.0}, actual_diff['values'])
+        self.assertEqual(2.0, actual_diff['max_abs_error'])
+
+    def test_shape_mismatch(self):
+        self.assertEqual(
+            ({'shape': (3,), 'dtype': 'int64'},
+             {'shape': (2, 2), 'dtype': 'int64'}),
+            compare.compare(
+                numpy.array([1, 2, 3], dtype='int64'),
+                numpy.array([[1, 2], [3, 4]], dtype='int64')))
+
+    def test_tolerance(self):
+        expected = numpy.linspace(0, 1, 50)
+        actual = expected + 1e-9
+        self.assertFalse(compare.compare(expected, actual))
+        self.assertEqual(
+            'match',
+            compare.compare(
+                expected,
+                actual,
+                type_compare={'array': {'atol': 1e-8}}))
+        self.assertEqual(
+            'match',
+            compare.compare(
+                expected + 1,
+                actual + 1,
+                type_compare={'array': {'rtol': 1e-8}}))
+        result = compare.compare(
+            expected,
+            actual + 0.1,
+            type_compare={'array': {'atol': 1e-8}})
+        self.assertEqual(50, result.count)
+
+    def test_float_tolerance(self):
+        # The same as for a list of the same numbers - symmetric, with
+        # no tolerance but the one given
+        tolerance = {'float': {'rel_tol': 0.1}}
+        for (expected, actual) in [(1.0, 1.1), (1.1, 1.0), (0.0, 1e-9)]:
+            self.assertEqual(
+                bool(compare.compare([expected], [actual], tolerance)),
+                bool(compare.compare(
+                    numpy.array([expected]),
+                    numpy.array([actual]),
+                    tolerance)))
+        self.assertEqual(
+            'match',
+            compare.compare(
+                numpy.array([1, 2 ** 62]),
+                numpy.array([1.05, 2 ** 62 + 1]),
+                tolerance))
+        self.assertEqual(
+            1,
+            compare.compare(
+                numpy.array([1.0, numpy.inf]),
+                numpy.array([1.0, 1e308]),
+                tolerance).count)
+        self.assertEqual(
+            'match',
+            compare.compare(
+                numpy.array(['a', 'b']),
+                numpy.array(['a', 'b']),
+                tolerance))
+
+    def test_nan(self):
+        expected = numpy.array([1.0, numpy.nan])
+        self.assertFalse(compare.compare(expected, expected.copy()))
+        self.assertEqual(
+            'match',
+            compare.compare(
+                expected,
+                expected.copy(),
+                type_compare={'array': {'equal_nan': True}}))
+        self.assertEqual(
+            'match',
+            compare.compare(
+                expected,
+                expected.copy(),
+                type_compare={'array': {'atol': 0.1, 'equal_nan': True}}))
+
+    def test_strings(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                numpy.array(['a', 'b']),
+                numpy.array(['a', 'b']),
+                type_compare={'array': {'atol': 0.1}}))
+        result = compare.compare(
+            numpy.array(['a', 'b']),
+            numpy.array(['a', 'c']))
+        self.assertEqual(1, result.count)
+        self.assertIsNone(result.max_abs_error)
+
+    def test_array_with_list(self):
+        self.assertEqual(
+            'match',
+            compare.compare(numpy.array([1, 2, 3]), [1, 2, 3]))
+        self.assertEqual(
+            'match',
+            compare.compare([1, compare.DontCare(), 3], numpy.array([1, 2, 3])))
+        self.assertEqual(
+            (['_', 2], ['_', 4]),
+            compare.compare([1, 2], numpy.array([1, 4])))
+
+    def test_array_with_other_values(self):
+        actual = numpy.array([1])
+        result = compare.compare(1, actual)
+        self.assertFalse(result)
+        self.assertIs(actual, result[1])
+        self.assertFalse(compare.compare({'a': 1}, actual))
+        self.assertFalse(compare.compare(numpy.array([1]), 'abc'))
+
+    def test_nested(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                {'values': numpy.array([0.5, 1.5]), 'name': 'x'},
+                {'values': numpy.array([0.5, 1.5 + 1e-12]), 'name': 'x'},
+                type_compare={'array': {'atol': 1e-9}}))
+        result = compare.compare(
+            {'values': numpy.array([1, 2])},
+            {'values': numpy.array([1, 3])})
+        self.assertEqual([('values',)], result.paths())
+
+    def test_matches(self):
+        self.assertTrue(
+            compare.matches(numpy.arange(10), numpy.arange(10)))
+        self.assertFalse(
+            compare.matches(numpy.arange(10), numpy.arange(1, 11)))
+
+    def test_unordered(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                compare.UnorderedList([numpy.array([1]), numpy.array([2])]),
+                [numpy.array([2]), numpy.array([1])]))
+
+    def test_compiled(self):
+        compiled = compare.Compare.compile(
+            {'a': numpy.array([1.0, 2.0]), 'b': [1, 2], 'c': 3},
+            type_compare={'array': {'atol': 0.01}})
+        self.assertEqual(
+            'match',
+            compiled.match({
+                'a': numpy.array([1.0, 2.001]),
+                'b': numpy.array([1, 2]),
+                'c': 3}))
+        result = compiled.match({
+            'a': numpy.array([1.0, 2.1]),
+            'b': [1, 2],
+            'c': numpy.array([3])})
+        self.assertEqual([('a',), ('c',)], sorted(result.paths()))
@@ -0,0 +1,157 @@
+import unittest
+
+import kobold
+from kobold import compare
+from kobold.compare.result import TruncatedMismatch
+
+
+def rows(count, sign=1):
+    return [[sign * i, [sign * i]] for i in range(1, count + 1)]
+
+
+class TestMaxMismatches(unittest.TestCase):
+    def test_stops_collecting(self):
+        result = compare.compare(
+            {'rows': rows(100)},
+            {'rows': rows(100, -1)},
+            max_mismatches=3)
+        self.assertIsInstance(result, TruncatedMismatch)
+        self.assertEqual(
+            [('rows', 0, 0), ('rows', 0, 1, 0), ('rows', 1, 0)],
+            result.paths())
+        # The rest of the second row, and both mismatches in each of
+        # the other 98 rows
+        self.assertEqual(197, result.skipped)
+        self.assertFalse(result)
+
+    def test_under_budget(self):
+        expected = rows(3)
+        actual = rows(3, -1)
+        result = compare.compare(expected, actual, max_mismatches=100)
+        self.assertNotIsInstance(result, TruncatedMismatch)
+        self.assertEqual(compare.compare(expected, actual), result)
+        self.assertEqual(
+            'match',
+            compare.compare(expected, rows(3), max_mismatches=1))
+
+    def test_skipped_parts_still_mismatch(self):
+        # Everything in 'b' is skipped, but 'b' still doesn't match
+        result = compare.compare(
+            {'a': 1, 'b': {'c': [1, 2]}},
+            {'a': 2, 'b': {'c': [3, 4]}},
+            max_mismatches=1)
+        self.assertFalse(result)
+        self.assertEqual([('a',)], result.paths())
+        self.assertEqual(2, result.skipped)
+
+    def test_hash_keys_in_order(self):
+        expected = dict(('key{}'.format(i), i) for i in range(20, 0, -1))
+        actual = dict((key, -value) for (key, value) in expected.items())
+        actual['extra'] = 1
+        result = compare.compare(expected, actual, max_mismatches=3)
+        self.assertEqual(
+            [('key20',), ('key19',), ('key18',)],
+            sorted(result.paths(), reverse=True))
+        self.assertEqual(18, result.skipped)
+
+    def test_counts_every_skipped_mismatch(self):
+        result = compare.compare(
+            {'a': list(range(100)),
+             'b': dict((i, i) for i in range(50))},
+            {'a': list(range(1, 101)),
+             'b': dict((i, -i) for i in range(1, 51))},
+            type_compare='full',
+            max_mismatches=10)
+        unbudgeted = compare.compare(
+            {'a': list(range(100)),
+             'b': dict((i, i) for i in range(50))},
+            {'a': list(range(1, 101)),
+             'b': dict((i, -i) for i in range(1, 51))},
+            type_compare='full')
+        self.assertEqual(
+            len(unbudgeted.paths()),
+            len(result.paths()) + result.skipped)
+
+    def test_unordered(self):
+        result = compare.compare(
+            list(range(10)),
+            list(range(10, 20)),
+            type_compare={'ordered': False},
+            max_mismatches=2)
+        self.assertEqual(8, result.skipped)
+        self.assertEqual([(0,), (1,)], result.paths())
+
+    def test_left_out_elements_are_not_shown_as_matched(self):
+        # With some mismatches left out, a "_" would look like a
+        # match, so the list diffs only show what was recorded
+        self.assertEqual(
+            ({0: 1, 1: 2}, {0: 4, 1: 5}),
+            compare.compare(
+                compare.UnorderedList([1, 2, 3]),
+                [4, 5, 6, 7],
+                max_mismatches=2))
+        self.assertEqual(
+            ({0: 1}, {0: 2}),
+            compare.compare([1, 2, 3], [2, 3, 4], max_mismatches=1))
+
+    def test_aligned(self):
+        result = compare.compare(
+            [1, 2, 3],
+            [1, 'x', 'y', 'z', 2, 3],
+            type_compare={'alignment': 'myers'},
+            max_mismatches=1)
+        self.assertEqual(2, result.skipped)
+
+    def test_number_lists(self):
+        result = compare.compare(
+            [1.0] * 10,
+            [2.0] * 12,
+            type_compare={'float': {'rel_tol': 1e-6}},
+            max_mismatches=4)
+        self.assertEqual(8, result.skipped)
+        self.assertEqual([(0,), (1,), (2,), (3,)], result.paths())
+
+    def test_invalid(self):
+        self.assertRaises(
+            kobold.ValidationError,
+            compare.compare,
+            1,
+            2,
+            max_mismatches=0)
+        self.assertRaises(
+            kobold.ValidationError,
+            compare.compare,
+            1,
+            2,
+            max_mismatches=1,
+            workers=2)
+
+
+class TestMaxDepth(unittest.TestCase):
+    def test_summarized(self):
+        self.assertEqual(
+            ({'a': 1, 'b': '<dict of length 1>'},
+             {'a': 2, 'b': '<list of length 2>'}),
+            compare.compare(
+                {'a': 1, 'b': {'c': 1}, 'd': {'e': 1}},
+                {'a': 2, 'b': [1, 2], 'd': {'e': 1}},
+                max_depth=1))
+
+    def test_whole_value(self):
+        self.assertEqual(
+            ('<list of length 1>', '<list of length 1>'),
+            compare.compare([1], [2], max_depth=0))
+
+    def test_unpaired_elements(self):
+        expected = {'a': [1]}
+        actual = {'a': [1, {'deep': {'deeper': [1, 2, 3]}}]}
+        for type_compare in [None, {'alignment': 'myers'}, {'ordered': False}]:
+            result = compare.compare(
+                expected,
+                actual,
+                type_compare,
+                max_depth=2)
+            self.assertEqual(
+                ['_', '<dict of length 1>'],
+                result[1]['a'],
+                type_compare)
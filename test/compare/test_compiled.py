@@ -0,0 +1,165 @@
+import re
+import unittest
+
+import kobold
+from kobold import compare
+from kobold.compare import hints
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ObjectThing(object):
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+class TestCompile(unittest.TestCase):
+    def assert_same_as_compare(self, expected, actual, type_compare=None):
+        compiled = compare.Compare.compile(
+            expected,
+            type_compare=type_compare)
+        self.assertEqual(
+            compare.compare(expected, actual, type_compare=type_compare),
+            compiled.match(actual))
+
+    def test_hash_match(self):
+        self.assert_same_as_compare(
+            {'a': 1, 'b': {'c': [1, 2, 3]}},
+            {'a': 1, 'b': {'c': [1, 2, 3]}})
+
+    def test_hash_mismatch(self):
+        self.assert_same_as_compare(
+            {'a': 1, 'b': {'c': [1, 2, 3]}},
+            {'b': {'c': [1, 4]}, 'd': 5})
+
+    def test_hash_existing(self):
+        self.assert_same_as_compare(
+            {'a': 1, 'b': {'c': 2}},
+            {'a': 2, 'b': {'c': 2, 'd': 3}, 'e': 4},
+            type_compare='existing')
+
+    def test_compare_override(self):
+        self.assert_same_as_compare(
+            {'a': {'__compare': 'existing', 'b': 1}, 'c': 2},
+            {'a': {'b': 1, 'x': 2}, 'c': 2, 'd': 3})
+
+    def test_dontcare_keys(self):
+        self.assert_same_as_compare(
+            {'__compare': {'hash': 'full', 'dontcare_keys': ['id']},
+             'name': 'a'},
+            {'name': 'b', 'id': None})
+
+    def test_type_compare_hint(self):
+        self.assert_same_as_compare(
+            {'a': compare.TypeCompareHint(
+                {'b': 1},
+                type_compare='existing'),
+             'c': [1, 2]},
+            {'a': {'b': 1, 'x': 2}, 'c': [2, 1]})
+
+    def test_dontcare_and_regex(self):
+        self.assert_same_as_compare(
+            [compare.DontCare, re.compile('ab+'), re.compile('x')],
+            [None, 'abbb', 5])
+
+    def test_parsing_hints(self):
+        self.assert_same_as_compare(
+            {'body': hints.JSONParsingHint({'a': [1, 2]}),
+             'obj': hints.ObjectDictParsingHint({'x': 1}),
+             'missing': hints.JSONParsingHint({})},
+            {'body': '{"a": [1, 3]}',
+             'obj': ObjectThing(x=2)})
+
+    def test_hint_rule_chain(self):
+        self.assert_same_as_compare(
+            hints.Hint({'a': 1}, rule=['base64', 'json']),
+            'eyJhIjogMn0=')
+
+    def test_invalid_match(self):
+        self.assert_same_as_compare(
+            {'a': hints.JSONParsingHint({'a': 1})},
+            {'a': 'not json'})
+
+    def test_tuples(self):
+        self.assert_same_as_compare(
+            ((1, 2), [3, 4], (5, 6)),
+            ((1, 2), [3, 5], (5, 7), 8))
+
+    def test_unordered_fallback(self):
+        self.assert_same_as_compare(
+            {'a': [1, {'b': 2}, 3]},
+            {'a': [3, {'b': 4}, 1]},
+            type_compare={'hash': 'full', 'ordered': False})
+
+    def test_sets(self):
+        self.assert_same_as_compare(
+            set([1, 2, 3]),
+            set([1, 3, 4]))
+
+    def test_structured_string(self):
+        self.assert_same_as_compare(
+            compare.StructuredString(
+                regex=re.compile(r'x=(.*);(.*)'),
+                arguments=['a', hints.JSONParsingHint({'b': 1})]),
+            'x=a;{"b": 2}')
+
+    def test_mismatched_types(self):
+        self.assert_same_as_compare(
+            {'a': {'b': 1}, 'c': [1], 'd': (1,)},
+            {'a': [1], 'c': {'b': 1}, 'd': 'x'})
+
+    def test_named_dontcare(self):
+        expected = [compare.DontCare(name='x'), compare.DontCare(name='x')]
+        compiled = compare.Compare.compile(expected)
+        self.assertEqual('match', compiled.match([1, 1]))
+        names = {}
+        self.assertEqual(
+            (['_', 'variable: x'], ['_', 2]),
+            compiled.match([1, 2], names=names))
+        self.assertEqual({'x': 1}, names)
+
+    def test_reuse(self):
+        compiled = compare.Compare.compile(
+            {'a': hints.JSONParsingHint([1, 2])},
+            type_compare='existing')
+        for value in range(10):
+            actual = {'a': '[1, {}]'.format(value), 'b': value}
+            self.assertEqual(
+                compare.compare(
+                    {'a': hints.JSONParsingHint([1, 2])},
+                    actual,
+                    type_compare='existing'),
+                compiled.match(actual))
+
+    def test_invalid_type_compare(self):
+        self.assertRaises(
+            kobold.ValidationError,
+            compare.Compare.compile,
+            [1],
+            type_compare={'list': 'existing'})
+
+    def test_deep_nesting(self):
+        expected = 1
+        actual = 2
+        for _ in range(20000):
+            expected = {'a': [expected]}
+            actual = {'a': [actual]}
+        compiled = compare.Compare.compile(expected)
+        self.assertEqual('match', compiled.match(expected))
+        self.assertFalse(compiled.match(actual))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_extra_array(self):
+        self.assert_same_as_compare(
+            {'a': 1},
+            {'a': 1, 'b': numpy.array([1, 2])})
+
+    def test_aligned_fallback(self):
+        self.assert_same_as_compare(
+            [1, 2, 3],
+            [0, 1, 2, 3],
+            type_compare={'alignment': 'myers'})
@@ -0,0 +1,131 @@
+import unittest
+
+import kobold
+from kobold import assertions, compare
+from kobold.compare import fingerprint
+
+
+def state(count, changed=()):
+    return {
+        'shards': [
+            {'id': shard,
+             'rows': [{'id': row, 'value': 'changed' if shard in changed else row}
+                      for row in range(100)]}
+            for shard in range(count)]}
+
+
+class TestFingerprintCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = fingerprint.FingerprintCache()
+        self.compared = []
+        original = fingerprint.Compare.compare_step.__func__
+        compared = self.compared
+
+        def counting_compare_step(cls, expected, actual, *args):
+            if isinstance(expected, dict) and 'rows' in expected:
+                compared.append(expected['id'])
+            return original(cls, expected, actual, *args)
+
+        self.patched = fingerprint.Compare.compare_step
+        fingerprint.Compare.compare_step = classmethod(counting_compare_step)
+
+    def tearDown(self):
+        fingerprint.Compare.compare_step = self.patched
+
+    def test_unchanged_subtrees_are_skipped(self):
+        expected = state(10)
+        self.assertEqual('match', self.cache.compare(expected, state(10)))
+        self.assertEqual(list(range(10)), self.compared)
+
+        del self.compared[:]
+        self.assertEqual('match', self.cache.compare(expected, state(10)))
+        self.assertEqual([], self.compared)
+
+    def test_changed_subtrees_are_compared(self):
+        expected = state(10)
+        self.cache.compare(expected, state(10))
+        del self.compared[:]
+        result = self.cache.compare(expected, state(10, changed=(3,)))
+        self.assertEqual([3], self.compared)
+        self.assertEqual(
+            compare.compare(expected, state(10, changed=(3,))),
+            result)
+
+    def test_mismatches_are_not_remembered(self):
+        expected = state(3)
+        self.assertFalse(self.cache.compare(expected, state(3, changed=(1,))))
+        self.assertFalse(self.cache.compare(expected, state(3, changed=(1,))))
+
+    def test_different_expected(self):
+        self.cache.compare(state(3), state(3))
+        self.assertFalse(
+            self.cache.compare(state(3, changed=(0,)), state(3)))
+
+    def test_type_compare(self):
+        expected = state(2)
+        actual = state(2)
+        actual['shards'][0]['extra'] = 1
+        self.assertEqual(
+            'match',
+            self.cache.compare(expected, actual, type_compare='existing'))
+        self.assertFalse(self.cache.compare(expected, actual))
+
+    def test_named_dontcares_are_compared(self):
+        expected = state(2)
+        expected['shards'][0]['rows'][0]['value'] = compare.DontCare(
+            name='first')
+        self.cache.compare(expected, state(2))
+        del self.compared[:]
+        names = {}
+        self.assertEqual(
+            'match',
+            self.cache.compare(expected, state(2), names=names))
+        self.assertEqual([0], self.compared)
+        self.assertEqual({'first': 0}, names)
+
+    def test_compare_and_assert_equal(self):
+        expected = state(3)
+        compare.compare(expected, state(3), fingerprints=self.cache)
+        del self.compared[:]
+        assertions.assert_equal(expected, state(3), fingerprints=self.cache)
+        self.assertEqual([], self.compared)
+        self.assertRaises(
+            AssertionError,
+            assertions.assert_equal,
+            expected,
+            state(3, changed=(2,)),
+            fingerprints=self.cache)
+        self.assertRaises(
+            kobold.ValidationError,
+            compare.compare,
+            expected,
+            state(3),
+            workers=2,
+            fingerprints=self.cache)
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_contents_matter(self):
+        values = [
+            list(range(1000)),
+            list(range(1, 1001)),
+            [float(i) for i in range(1000)],
+            [str(i) for i in range(1000)],
+            [-1] + list(range(999)),
+            [-2] + list(range(999)),
+            tuple(range(1000)),
+            dict((i, i) for i in range(1000))]
+        self.assertEqual(
+            len(values),
+            len(set(fingerprint.fingerprint(value) for value in values)))
+        self.assertEqual(
+            fingerprint.fingerprint([str(i) for i in range(1000)]),
+            fingerprint.fingerprint([str(i) for i in range(1000)]))
+
+    def test_small_and_unplain_values_are_left_out(self):
+        self.assertIsNone(fingerprint.fingerprint([1, 2, 3]))
+        self.assertIsNone(
+            fingerprint.fingerprint([object()] + list(range(1000))))
+        self.assertIsNone(
+            fingerprint.fingerprint(
+                [compare.OrderedList()] + list(range(1000))))
@@ -0,0 +1,88 @@
+import unittest
+
+import kobold
+from kobold import compare
+
+
+class TestKeyedList(unittest.TestCase):
+    def test_match_out_of_order(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                compare.KeyedList([{'id': 1, 'a': 'x'}, {'id': 2, 'a': 'y'}]),
+                [{'id': 2, 'a': 'y'}, {'id': 1, 'a': 'x'}]))
+
+    def test_rows_are_compared_with_their_partner(self):
+        result = compare.compare(
+            compare.KeyedList([
+                {'id': 1, 'a': 'x', 'b': 1},
+                {'id': 2, 'a': 'y', 'b': 2}]),
+            [{'id': 2, 'a': 'y', 'b': 3},
+             {'id': 1, 'a': 'x', 'b': 1}])
+        self.assertEqual(({2: {'b': 2}}, {2: {'b': 3}}), result)
+        self.assertEqual([(2, 'b')], result.paths())
+
+    def test_missing_and_extra_rows(self):
+        self.assertEqual(
+            ({1: {'id': 1}, 3: kobold.NotPresent},
+             {1: kobold.NotPresent, 3: {'id': 3}}),
+            compare.compare(
+                compare.KeyedList([{'id': 1}, {'id': 2}]),
+                [{'id': 2}, {'id': 3}]))
+
+    def test_extra_rows_with_existing(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                compare.KeyedList([{'id': 2, 'a': 1}]),
+                [{'id': 2, 'a': 1, 'b': 2}, {'id': 3}],
+                type_compare='existing'))
+
+    def test_composite_key(self):
+        result = compare.compare(
+            compare.KeyedList(
+                [{'org': 'a', 'id': 1, 'v': 1},
+                 {'org': 'b', 'id': 1, 'v': 2}],
+                key=('org', 'id')),
+            [{'org': 'b', 'id': 1, 'v': 3},
+             {'org': 'a', 'id': 1, 'v': 1}])
+        self.assertEqual([(('b', 1), 'v')], result.paths())
+
+    def test_duplicate_actual_keys(self):
+        expected_diff, actual_diff = compare.compare(
+            compare.KeyedList([{'id': 1}]),
+            [{'id': 1}, {'id': 1}])
+        self.assertEqual({1: [{'id': 1}, {'id': 1}]}, actual_diff)
+
+    def test_duplicate_expected_keys(self):
+        self.assertRaises(
+            kobold.ValidationError,
+            compare.KeyedList,
+            [{'id': 1}, {'id': 1}])
+
+    def test_not_a_list(self):
+        self.assertFalse(
+            compare.compare(compare.KeyedList([{'id': 1}]), {'id': 1}))
+        self.assertFalse(
+            compare.compare(compare.KeyedList([{'id': 1}]), [1, 2]))
+
+    def test_nested_hints(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                {'rows': compare.KeyedList(
+                    [{'id': 1, 'at': compare.DontCare()}])},
+                {'rows': [{'id': 1, 'at': '2020-01-01'}]}))
+
+    def test_compiled(self):
+        compiled = compare.Compare.compile(
+            compare.KeyedList([{'id': i, 'v': i} for i in range(100)]))
+        actual = [{'id': i, 'v': i} for i in reversed(range(100))]
+        self.assertEqual('match', compiled.match(actual))
+        actual[0]['v'] = -1
+        self.assertEqual([(99, 'v')], compiled.match(actual).paths())
+
+    def test_large(self):
+        rows = [{'id': i, 'v': i} for i in range(100000)]
+        self.assertTrue(
+            compare.matches(compare.KeyedList(rows), list(reversed(rows))))
@@ -136,3 +136,483 @@ class TestMultiMatch(unittest.TestCase):
         kobold.assertions.assert_match(
             'match',
             diff)
+
+
+class TestUnorderedHashBucket(unittest.TestCase):
+    def assert_same_as_first_fit(self, expected, actual, type_compare):
+        type_compare = compare.normalize_type_compare(type_compare)
+        self.assertIsNotNone(
+            compare.Compare.hash_bucket_match(
+                expected,
+                actual,
+                type_compare))
+        bucketed = compare.compare(expected, actual, type_compare)
+
+        hash_bucket_match = compare.Compare.hash_bucket_match
+        compare.Compare.hash_bucket_match = classmethod(
+            lambda cls, *args: None)
+        try:
+            first_fit = compare.compare(expected, actual, type_compare)
+        finally:
+            compare.Compare.hash_bucket_match = hash_bucket_match
+        self.assertEqual(first_fit, bucketed)
+
+    def test_scalars(self):
+        self.assert_same_as_first_fit(
+            [1, 2, 2, 3, 'a'],
+            [2, 'a', 4, 1, 2, 2],
+            {'ordered': False})
+
+    def test_dicts(self):
+        # Nested lists are still compared in order, so the
+        # elements are plain
+        self.assert_same_as_first_fit(
+            compare.UnorderedList([
+                {'id': 1, 'tags': ['a', 'b']},
+                {'id': 2, 'tags': []},
+                {'id': 3, 'tags': ['c']}]),
+            [{'id': 3, 'tags': ['c']},
+             {'id': 2, 'tags': ['x']},
+             {'id': 4, 'tags': []}],
+            None)
+
+    def test_existing_list(self):
+        self.assert_same_as_first_fit(
+            [{'a': 1}, {'a': 2}, {'a': 2}],
+            [{'a': 2}, {'a': 3}, {'a': 1}],
+            {'ordered': False, 'list': 'existing'})
+
+    def test_sets(self):
+        self.assert_same_as_first_fit(
+            set([1, 2, 3]),
+            set([1, 3, 4]),
+            None)
+
+    def test_not_plain(self):
+        type_compare = compare.normalize_type_compare({'ordered': False})
+        for expected in (
+                [compare.DontCare],
+                [{'a': compare.DontCare()}],
+                [compare.hints.JSONParsingHint({})],
+                [compare.MultiMatch({})],
+                [{'__compare': 'existing'}],
+                [[1, 2]],
+                [float('nan')],
+                [{'a': kobold.NotPresent}]):
+            self.assertIsNone(
+                compare.Compare.hash_bucket_match(
+                    expected,
+                    [],
+                    type_compare))
+
+    def test_existing_hashes_not_plain(self):
+        self.assertIsNone(
+            compare.Compare.hash_bucket_match(
+                [{'a': 1}],
+                [{'a': 1, 'b': 2}],
+                compare.normalize_type_compare(
+                    {'ordered': False, 'hash': 'existing'})))
+
+    def test_unhashable_actual(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                [1, {'a': 2}],
+                [{'a': 2}, 1],
+                type_compare={'ordered': False}))
+        self.assertIsNone(
+            compare.Compare.hash_bucket_match(
+                [1],
+                [{1: 'a', 'b': 2}],
+                compare.normalize_type_compare({'ordered': False})))
+
+    def test_loose_equality(self):
+        # Objects with their own __eq__ aren't bucketed, on either side
+        class Loose(object):
+            def __eq__(self, other):
+                return True
+
+            __hash__ = object.__hash__
+
+        class Text(str):
+            def __eq__(self, other):
+                return str(self).lower() == str(other).lower()
+
+            __hash__ = str.__hash__
+
+        type_compare = {'ordered': False}
+        for (expected, actual) in (
+                ([Loose()], [5]),
+                ([5], [Loose()]),
+                ([{'a': Loose()}], [{'a': 5}]),
+                ([Text('A')], ['a']),
+                (['a'], [Text('A')])):
+            self.assertIsNone(
+                compare.Compare.hash_bucket_match(
+                    expected,
+                    actual,
+                    compare.normalize_type_compare(type_compare)))
+            self.assertEqual(
+                'match',
+                compare.compare(expected, actual, type_compare))
+
+    def test_large_list(self):
+        expected = [{'id': i, 'value': str(i)} for i in range(20000)]
+        actual = list(reversed(expected))
+        self.assertEqual(
+            'match',
+            compare.compare(
+                expected,
+                actual,
+                type_compare={'ordered': False}))
+
+
+class TestUnorderedOptimalMatching(unittest.TestCase):
+    def test_dontcare_steals_partner_first_fit(self):
+        # With first-fit, the DontCare takes the 1, and leaves
+        # nothing for the expected 1
+        self.assertEqual(
+            (['_', 1], ['_', 2]),
+            compare.compare(
+                [compare.DontCare(), 1],
+                [1, 2],
+                type_compare={'ordered': False}))
+
+    def test_dontcare_optimal(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                [compare.DontCare(), 1],
+                [1, 2],
+                type_compare={'ordered': False, 'matching': 'optimal'}))
+
+    def test_hashes_optimal(self):
+        expected = [
+            {'color': 'blue'},
+            {'color': 'blue', 'shape': 'circle'},
+            {'shape': 'square'}]
+        actual = [
+            {'color': 'blue', 'shape': 'circle'},
+            {'color': 'blue', 'shape': 'square'},
+            {'color': 'red', 'shape': 'triangle'}]
+        self.assertEqual(
+            (['_', {'color': 'blue', 'shape': 'circle'}, '_'],
+             ['_', '_', {'color': 'red', 'shape': 'triangle'}]),
+            compare.compare(
+                expected,
+                actual,
+                type_compare={
+                    'ordered': False,
+                    'hash': 'existing',
+                    'matching': 'optimal'}))
+
+    def test_mismatch_optimal(self):
+        self.assertEqual(
+            (['_', 3, '_'], ['_', '_', 4]),
+            compare.compare(
+                [compare.DontCare(), 3, 1],
+                [1, 2, 4],
+                type_compare={'ordered': False, 'matching': 'optimal'}))
+
+    def test_multimatch_optimal(self):
+        actual = [
+            {'color': 'blue', 'shape': 'square'},
+            {'color': 'blue', 'shape': 'triangle'},
+            {'color': 'red', 'shape': 'circle'}]
+        self.assertEqual(
+            'match',
+            compare.compare(
+                [compare.MultiMatch({'color': 'blue'}),
+                 {'shape': compare.DontCare(), 'color': 'red'}],
+                actual,
+                type_compare={
+                    'hash': 'existing',
+                    'ordered': False,
+                    'matching': 'optimal'}))
+
+    def test_pairs_compared_once(self):
+        calls = []
+
+        class Counted(compare.DontCare):
+            def compare_with(self, other_thing, names=None):
+                calls.append(other_thing)
+                return True
+
+        compare.compare(
+            [Counted(), Counted(), 1],
+            [1, 2, 3],
+            type_compare={'ordered': False, 'matching': 'optimal'})
+        self.assertEqual(6, len(calls))
+
+    def test_invalid_matching(self):
+        self.assertRaises(
+            NotImplementedError,
+            compare.compare,
+            [compare.DontCare()],
+            [1],
+            type_compare={'ordered': False, 'matching': 'best'})
+
+
+class TestMaximumMatching(unittest.TestCase):
+    def test_augmenting_path(self):
+        self.assertEqual(
+            [1, 0, 2],
+            compare.matching.maximum_matching(
+                [[0, 1], [0], [1, 2]],
+                3))
+
+    def test_unmatched(self):
+        self.assertEqual(
+            [0, None],
+            compare.matching.maximum_matching([[0], [0]], 2))
+
+    def test_long_chain(self):
+        # Left i can take right i or right i + 1.  First-fit
+        # pairs left i with right i, except the last left vertex
+        # only accepts right 0, so the whole chain has to shift
+        count = 5000
+        adjacency = [[i, i + 1] for i in range(count - 1)]
+        adjacency.append([0])
+        match_left = compare.matching.maximum_matching(adjacency, count)
+        self.assertEqual(
+            list(range(1, count)) + [0],
+            match_left)
+
+
+class TestAlignedListCompare(unittest.TestCase):
+    type_compare = {'alignment': 'myers'}
+
+    def test_match(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                [1, {'a': 2}, [3]],
+                [1, {'a': 2}, [3]],
+                type_compare=self.type_compare))
+
+    def test_insert_at_head(self):
+        self.assertEqual(
+            (['_', '_', '_'], [0, '_', '_', '_']),
+            compare.compare(
+                [1, 2, 3],
+                [0, 1, 2, 3],
+                type_compare=self.type_compare))
+
+    def test_remove_from_middle(self):
+        self.assertEqual(
+            (['_', {'b': 2}, '_'], ['_', '_']),
+            compare.compare(
+                [{'a': 1}, {'b': 2}, {'c': 3}],
+                [{'a': 1}, {'c': 3}],
+                type_compare=self.type_compare))
+
+    def test_replacement_is_diffed(self):
+        self.assertEqual(
+            (['_', {'b': 2}, '_'], ['_', {'b': 3}, '_']),
+            compare.compare(
+                [{'a': 1, 'b': 1}, {'a': 2, 'b': 2}, {'a': 3, 'b': 3}],
+                [{'a': 1, 'b': 1}, {'a': 2, 'b': 3}, {'a': 3, 'b': 3}],
+                type_compare=self.type_compare))
+
+    def test_insert_and_replace(self):
+        self.assertEqual(
+            (['_', 2, '_', '_'], ['_', 'x', 5, '_', '_']),
+            compare.compare(
+                [1, 2, 3, 4],
+                [1, 'x', 5, 3, 4],
+                type_compare=self.type_compare))
+
+    def test_tuples(self):
+        self.assertEqual(
+            (('_', '_'), (0, '_', '_')),
+            compare.compare(
+                (1, 2),
+                (0, 1, 2),
+                type_compare=self.type_compare))
+
+    def test_named_dontcares(self):
+        expected = [
+            0,
+            {'id': compare.DontCare(name='id')},
+            {'parent': compare.DontCare(name='id')}]
+        names = {}
+        self.assertEqual(
+            (['_', '_', '_'], ['x', '_', '_', '_']),
+            compare.compare(
+                expected,
+                ['x', 0, {'id': 5}, {'parent': 5}],
+                type_compare=self.type_compare,
+                names=names))
+        self.assertEqual({'id': 5}, names)
+        self.assertEqual(
+            (['_', '_', {'parent': 'variable: id'}],
+             ['_', '_', {'parent': 6}]),
+            compare.compare(
+                expected,
+                [0, {'id': 5}, {'parent': 6}],
+                type_compare=self.type_compare))
+
+    def test_each_pair_probed_once(self):
+        calls = []
+
+        class Counted(compare.DontCare):
+            def compare_with(self, other_thing, names=None):
+                calls.append(other_thing)
+                return other_thing == 1
+
+        self.assertEqual(
+            (['_', Counted.__str__(Counted())], [2, '_', 3]),
+            compare.compare(
+                [1, Counted()],
+                [2, 1, 3],
+                type_compare=self.type_compare))
+        # Each pair is probed once.  The last pair was probed in full
+        # (trimming the suffix), so it isn't compared again for its diff.
+        self.assertEqual([2, 3], sorted(calls))
+
+    def test_nested_lists_compared_once(self):
+        calls = []
+
+        class Counted(compare.DontCare):
+            def compare_with(self, other_thing, names=None):
+                calls.append(other_thing)
+                return False
+
+        expected = Counted()
+        actual = 1
+        for i in range(50):
+            expected = [expected, i]
+            actual = [actual, i]
+        result = compare.compare(
+            expected,
+            actual,
+            type_compare=self.type_compare)
+        self.assertEqual([(0,) * 50], result.paths())
+        self.assertEqual([1], calls)
+
+    def test_full_probe_binds_names_again(self):
+        # The last pair is compared in full before 'x' is bound to 7,
+        # so it's compared again once it is
+        x = compare.DontCare(name='x')
+        result = compare.compare(
+            [x, 'm', [x, 'y']],
+            [7, 'n', [8, 'z']],
+            type_compare=self.type_compare)
+        self.assertEqual([(1,), (2, 0), (2, 1)], sorted(result.paths()))
+
+    def test_large_list_one_insert(self):
+        expected = [{'row': i} for i in range(20000)]
+        actual = [{'row': -1}] + expected
+        expected_diff, actual_diff = compare.compare(
+            expected,
+            actual,
+            type_compare=self.type_compare)
+        self.assertEqual([], [x for x in expected_diff if x != '_'])
+        self.assertEqual([{'row': -1}], [x for x in actual_diff if x != '_'])
+
+    def test_too_many_edits(self):
+        max_alignment_edits = compare.max_alignment_edits
+        compare.max_alignment_edits = 1
+        try:
+            self.assertEqual(
+                (['_', 2, 3], ['_', 3, 4]),
+                compare.compare(
+                    [1, 2, 3],
+                    [1, 3, 4],
+                    type_compare=self.type_compare))
+        finally:
+            compare.max_alignment_edits = max_alignment_edits
+
+    def test_invalid_alignment(self):
+        self.assertRaises(
+            NotImplementedError,
+            compare.compare,
+            [1],
+            [1],
+            type_compare={'alignment': 'lcs'})
+
+
+class TestUnorderedNamedDontCares(unittest.TestCase):
+    def rows(self, count):
+        return [
+            {'id': compare.DontCare(name='id{}'.format(i)), 'value': i}
+            for i in range(count)]
+
+    def test_names_bound(self):
+        for matching in ('first_fit', 'optimal'):
+            names = {}
+            self.assertEqual(
+                'match',
+                compare.compare(
+                    self.rows(3) + [{'parent': compare.DontCare(name='id1')}],
+                    [{'parent': 11}] + [
+                        {'id': 10 + i, 'value': i} for i in (2, 1, 0)],
+                    type_compare={'ordered': False, 'matching': matching},
+                    names=names))
+            self.assertEqual({'id0': 10, 'id1': 11, 'id2': 12}, names)
+
+    def test_conflicting_names(self):
+        expected = [
+            {'id': compare.DontCare(name='x'), 'value': 1},
+            {'id': compare.DontCare(name='x'), 'value': 2}]
+        for matching in ('first_fit', 'optimal'):
+            names = {}
+            self.assertFalse(
+                compare.compare(
+                    expected,
+                    [{'id': 1, 'value': 1}, {'id': 2, 'value': 2}],
+                    type_compare={'ordered': False, 'matching': matching},
+                    names=names))
+            # Nothing is bound by a mismatched list
+            self.assertEqual({}, names)
+
+    def test_failed_pairings_roll_back(self):
+        expected = [
+            {'id': compare.DontCare(name='x'), 'kind': 'a'},
+            [{'ref': compare.DontCare(name='x')}]]
+        names = {}
+        self.assertEqual(
+            'match',
+            compare.compare(
+                expected,
+                [{'id': 5, 'kind': 'b'}, {'id': 1, 'kind': 'a'}, [{'ref': 1}]],
+                type_compare={'ordered': False, 'list': 'existing'},
+                names=names))
+        self.assertEqual({'x': 1}, names)
+
+    def test_large_list(self):
+        expected = self.rows(2000)
+        actual = [{'id': i, 'value': i} for i in range(2000)]
+        names = {}
+        self.assertEqual(
+            'match',
+            compare.compare(
+                expected,
+                actual,
+                type_compare={'ordered': False},
+                names=names))
+        self.assertEqual(2000, len(names))
+
+
+class TestBindings(unittest.TestCase):
+    def test_rollback(self):
+        bindings = compare.Bindings({'a': 1})
+        checkpoint = bindings.checkpoint()
+        bindings['b'] = 2
+        bindings.update({'a': 3})
+        self.assertEqual({'a': 3, 'b': 2}, bindings.changes_since(checkpoint))
+        bindings.rollback(checkpoint)
+        self.assertEqual({'a': 1}, bindings)
+
+    def test_consistent(self):
+        bindings = compare.Bindings({'a': 1})
+        self.assertTrue(bindings.consistent({'a': 1, 'b': 2}))
+        self.assertFalse(bindings.consistent({'a': 2}))
+
+    def test_keep(self):
+        names = {'a': 1}
+        bindings = compare.Bindings.of(names)
+        self.assertIs(bindings, compare.Bindings.of(bindings))
+        bindings['b'] = 2
+        bindings.keep(names)
+        self.assertEqual({'a': 1, 'b': 2}, names)
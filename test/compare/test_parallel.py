@@ -0,0 +1,159 @@
+import multiprocessing
+import time
+import unittest
+from unittest import mock
+
+import kobold
+from kobold import compare
+from kobold.compare import parallel
+
+
+class Loose(object):
+    def __init__(self, value):
+        self.value = value
+
+
+def compare_loose(compare_class, expected, actual, type_compare, names,
+                  fail_fast):
+    return (expected.value, actual, type_compare)
+
+
+def validate_even(**options):
+    return lambda other_thing: other_thing % 2 == 0
+
+
+def slow_compare(compare_class, expected, actual, type_compare, names,
+                 fail_fast):
+    time.sleep(expected.value)
+    return (0, actual, type_compare)
+
+
+def spawn_context(method=None):
+    return get_context('spawn')
+
+
+get_context = multiprocessing.get_context
+
+
+class TestParallelCompare(unittest.TestCase):
+    def setUp(self):
+        self.min_parallel_items = parallel.min_parallel_items
+        parallel.min_parallel_items = 100
+
+    def tearDown(self):
+        parallel.min_parallel_items = self.min_parallel_items
+
+    def rows(self, count):
+        return [{'id': i, 'tags': ['a', i]} for i in range(count)]
+
+    def test_list_match(self):
+        self.assertEqual(
+            'match',
+            compare.compare(self.rows(1000), self.rows(1000), workers=2))
+
+    def test_list_mismatch(self):
+        expected = self.rows(1000)
+        actual = self.rows(1003)
+        actual[10]['tags'][1] = 'x'
+        actual[999]['id'] = -1
+        result = compare.compare(expected, actual, workers=2)
+        self.assertEqual(compare.compare(expected, actual), result)
+        self.assertEqual(
+            [(10, 'tags', 1), (999, 'id'), (1000,), (1001,), (1002,)],
+            result.paths())
+
+    def test_tuples(self):
+        expected = tuple(range(500))
+        actual = tuple(range(1, 501))
+        self.assertEqual(
+            compare.compare(expected, actual),
+            compare.compare(expected, actual, workers=3))
+
+    def test_hash(self):
+        expected = dict((str(i), {'v': i}) for i in range(1000))
+        actual = dict((str(i), {'v': i}) for i in range(1, 1001))
+        actual['500']['v'] = 'x'
+        result = compare.compare(expected, actual, workers=2)
+        self.assertEqual(compare.compare(expected, actual), result)
+        self.assertEqual(
+            [('0',), ('500', 'v'), ('1000',)],
+            result.paths())
+
+    def test_hash_existing(self):
+        expected = dict((str(i), i) for i in range(500))
+        actual = dict((str(i), i) for i in range(1000))
+        self.assertEqual(
+            'match',
+            compare.compare(
+                expected,
+                actual,
+                type_compare='existing',
+                workers=2))
+
+    def test_matches(self):
+        rows = self.rows(1000)
+        self.assertTrue(compare.matches(rows, self.rows(1000), workers=2))
+        self.assertFalse(compare.matches(rows, self.rows(999), workers=2))
+
+    def test_unordered_is_compared_in_process(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                compare.UnorderedList(range(1000)),
+                list(reversed(range(1000))),
+                workers=2))
+
+    def test_named_dontcares_are_rejected(self):
+        expected = self.rows(1000)
+        expected[5]['id'] = compare.DontCare(name='first')
+        self.assertRaises(
+            kobold.ValidationError,
+            compare.compare,
+            expected,
+            self.rows(1000),
+            workers=2)
+
+    def test_small_inputs_stay_in_process(self):
+        parallel.min_parallel_items = self.min_parallel_items
+        expected = [compare.DontCare(name='x'), compare.DontCare(name='x')]
+        self.assertEqual(
+            'match',
+            compare.compare(expected, [1, 1], workers=2))
+
+    def test_registries_reach_spawned_workers(self):
+        compare.add_comparer(Loose, int, compare_loose)
+        self.addCleanup(compare.remove_comparer, Loose, int)
+        compare.add_dontcare_rule('even', validate_even)
+        self.addCleanup(compare.remove_dontcare_rule, 'even')
+        expected = [
+            {'id': Loose(i), 'double': compare.DontCare('even')}
+            for i in range(1000)]
+        actual = [{'id': i, 'double': 2 * i} for i in range(1000)]
+        with mock.patch.object(multiprocessing, 'get_context', spawn_context):
+            self.assertEqual(
+                'match',
+                compare.compare(expected, actual, workers=2))
+
+    def test_unpicklable_registries(self):
+        class Local(object):
+            pass
+        compare.add_comparer(Local, int, compare_loose)
+        self.addCleanup(compare.remove_comparer, Local, int)
+        with mock.patch.object(multiprocessing, 'get_context', spawn_context):
+            self.assertRaises(
+                kobold.ValidationError,
+                compare.compare,
+                self.rows(1000),
+                self.rows(1000),
+                workers=2)
+
+    def test_fail_fast_does_not_wait(self):
+        compare.add_comparer(Loose, int, slow_compare)
+        self.addCleanup(compare.remove_comparer, Loose, int)
+        expected = [Loose(0) for _ in range(1000)]
+        expected[125] = Loose(3)
+        actual = [0] * 1000
+        actual[0] = 1
+        start = time.monotonic()
+        self.assertFalse(compare.matches(expected, actual, workers=2))
+        self.assertLess(time.monotonic() - start, 2)
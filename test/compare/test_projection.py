@@ -0,0 +1,181 @@
+import json
+import unittest
+from unittest import mock
+
+from kobold import compare
+from kobold.compare import projection
+from kobold.compare.hints import JSONParsingHint
+
+projected = {'hash': 'existing', 'json': 'projected'}
+
+
+class TestJSONProjection(unittest.TestCase):
+    def test_projection(self):
+        self.assertEqual(
+            {'a': None, 'b': {'c': None}},
+            projection.json_projection(
+                {'a': [1], 'b': {'c': 1}},
+                projected))
+
+    def test_no_projection_for_full(self):
+        self.assertIsNone(
+            projection.json_projection({'a': 1}, {'json': 'projected'}))
+        self.assertEqual(
+            {'a': None},
+            projection.json_projection(
+                {'a': {'b': 1, '__compare': 'full'}},
+                projected))
+        self.assertEqual(
+            {'a': None},
+            projection.json_projection(
+                {'__compare': 'existing', 'a': 1},
+                {'json': 'projected'}))
+        self.assertEqual(
+            {'a': None},
+            projection.json_projection(
+                compare.TypeCompareHint({'a': 1}, 'existing'),
+                {'json': 'projected'}))
+
+    def test_only_when_asked_for(self):
+        self.assertIsNone(projection.json_projection({'a': 1}, 'existing'))
+
+    def test_parse(self):
+        document = json.dumps({
+            'skipped': [{'x': '}]'}, 'y'],
+            'a': {'b': 1, 'c': [1, 2]},
+            'd': 'text'})
+        self.assertEqual(
+            {'a': {'c': [1, 2]}, 'd': 'text'},
+            projection.parse_json_projection(
+                document,
+                {'a': {'c': None}, 'd': None}))
+
+    def test_stops_after_last_key(self):
+        # The rest is only checked to be closed properly
+        self.assertEqual(
+            {'a': 1},
+            projection.parse_json_projection(
+                '{"a": 1, "b": [not json, "]"]} ',
+                {'a': None}))
+        self.assertEqual(
+            {'a': {'b': 1}},
+            projection.parse_json_projection(
+                '{"a": {"b": 1, "c": [{}]}, "d": "}"}',
+                {'a': {'b': None}}))
+
+    def test_cut_short(self):
+        document = json.dumps({'a': {'b': 1, 'c': ['x"]}', {}]}, 'd': 2})
+        for end in range(len(document)):
+            for needed in ({}, {'a': None}, {'a': {'b': None}}):
+                self.assertRaises(
+                    (ValueError, IndexError, StopIteration),
+                    projection.parse_json_projection,
+                    document[:end],
+                    needed)
+        for extra in ('}', ']', ' 1', '{'):
+            self.assertRaises(
+                ValueError,
+                projection.parse_json_projection,
+                document + extra,
+                {'a': {'b': None}})
+
+    def test_rest_of_document(self):
+        for rest, closed in (
+                (r'"x\"]"}', True),
+                (r'"x\\"]}', False),
+                ('[[[{}]]]}', True),
+                ('[[[{]]]}', False),
+                ('[[[{}]]}', False)):
+            document = '{"a": 1, "b": ' + rest
+            for passes in (1, 64):
+                with mock.patch.object(
+                        projection,
+                        'max_bracket_passes',
+                        passes):
+                    if closed:
+                        self.assertEqual(
+                            {'a': 1},
+                            projection.parse_json_projection(
+                                document,
+                                {'a': None}))
+                    else:
+                        self.assertRaises(
+                            ValueError,
+                            projection.parse_json_projection,
+                            document,
+                            {'a': None})
+
+    def test_not_an_object(self):
+        self.assertEqual(
+            [1, 2],
+            projection.parse_json_projection('[1, 2]', {'a': None}))
+
+
+class TestJSONParsingHintProjection(unittest.TestCase):
+    def test_existing(self):
+        document = json.dumps({
+            'status': 'ok',
+            'rows': [{'id': i} for i in range(100)],
+            'meta': {'page': 1, 'count': 100}})
+        self.assertEqual(
+            'match',
+            compare.compare(
+                JSONParsingHint({'status': 'ok', 'meta': {'count': 100}}),
+                document,
+                type_compare=projected))
+        self.assertEqual(
+            ({'meta': {'count': 101}}, {'meta': {'count': 100}}),
+            compare.compare(
+                JSONParsingHint({'status': 'ok', 'meta': {'count': 101}}),
+                document,
+                type_compare=projected))
+
+    def test_missing_key(self):
+        self.assertFalse(
+            compare.compare(
+                JSONParsingHint({'a': compare.DontCare()}),
+                '{"b": 1}',
+                type_compare=projected))
+
+    def test_invalid_json(self):
+        self.assertFalse(
+            compare.compare(
+                JSONParsingHint({'a': 1}),
+                '{"b": [}',
+                type_compare=projected))
+        self.assertFalse(
+            compare.compare(
+                JSONParsingHint({}),
+                '{',
+                type_compare=projected))
+        self.assertFalse(
+            compare.compare(
+                JSONParsingHint({'a': 1}),
+                '{"a": 1, "b": [1, 2',
+                type_compare=projected))
+
+    def test_existing_still_parses_everything(self):
+        for (payload, document) in (
+                ({}, '{"y": [x"b\\"c"]}'),
+                ({'w': {'w': 'a'}}, '{"w": {"w": "a"}, "z" "\\u00e9"}'),
+                ({'a': 1}, '{"a": 1, "b": [not json]}')):
+            self.assertFalse(
+                compare.compare(
+                    JSONParsingHint(payload),
+                    document,
+                    type_compare='existing'))
+
+    def test_full_still_parses_everything(self):
+        self.assertFalse(
+            compare.compare(
+                JSONParsingHint({'a': 1}),
+                '{"a": 1, "b": [not json'))
+
+    def test_compiled(self):
+        compiled = compare.Compare.compile(
+            {'body': JSONParsingHint({'a': 1})},
+            type_compare=projected)
+        self.assertEqual(
+            'match',
+            compiled.match({'body': '{"a": 1, "b": [2]}'}))
+        self.assertFalse(compiled.match({'body': '{"a": 1, "b": [2'}))
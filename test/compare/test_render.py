@@ -0,0 +1,88 @@
+import io
+import unittest
+
+from kobold import compare
+from kobold.compare import render
+
+
+class TestRender(unittest.TestCase):
+    def test_paths(self):
+        result = compare.compare(
+            {'body': {'items': [{'price': 10}, {'price': 11}], 'a b': 1}},
+            {'body': {'items': [{'price': 10}, {'price': 12}], 'a b': 2}})
+        self.assertEqual(
+            sorted([
+                "body.items[1].price: expected 11, got 12",
+                "body['a b']: expected 1, got 2"]),
+            sorted(render.render(result).splitlines()))
+
+    def test_root(self):
+        self.assertEqual(
+            "expected 'a', got 'b'\n",
+            render.render(compare.compare('a', 'b')))
+
+    def test_missing(self):
+        self.assertEqual(
+            "[1]: expected 2, but it is missing\n",
+            render.render(compare.compare([1, 2], [1])))
+        self.assertEqual(
+            "[1]: not expected, got 2\n",
+            render.render(compare.compare([1], [1, 2])))
+
+    def test_inserted(self):
+        self.assertEqual(
+            "[0 in actual]: not expected, got 'i'\n"
+            "[1]: expected 'r', but it is missing\n",
+            render.render(compare.compare(
+                ['a', 'r', 'b'],
+                ['i', 'a', 'b'],
+                type_compare={'alignment': 'myers'})))
+
+    def test_long_values_are_shortened(self):
+        text = render.render(compare.compare('x' * 1000, 'y' * 1000))
+        self.assertLess(len(text), 300)
+
+    def test_max_chars(self):
+        result = compare.compare(list(range(100)), list(range(1, 101)))
+        text = render.render(result, max_chars=100)
+        lines = text.splitlines()
+        self.assertEqual('[0]: expected 0, got 1', lines[0])
+        self.assertEqual(
+            '... {} more mismatches'.format(100 - len(lines) + 1),
+            lines[-1])
+        self.assertLessEqual(len('\n'.join(lines[:-1])), 100)
+
+    def test_long_line(self):
+        # The first mismatch is always shown, even if it's cut short
+        expected = 1
+        actual = 2
+        for i in range(1000):
+            expected = {'key': expected}
+            actual = {'key': actual}
+        text = render.render(
+            compare.compare([expected, 1], [actual, 2]),
+            max_chars=50)
+        lines = text.splitlines()
+        self.assertEqual(
+            '[0]' + '.key' * 10 + '.ke...',
+            lines[0])
+        self.assertEqual(['... 1 more mismatch'], lines[1:])
+
+    def test_one_more(self):
+        self.assertEqual(
+            '[0]: expected 1, got 2\n... 1 more mismatch\n',
+            render.render(compare.compare([1, 2], [2, 3]), max_chars=30))
+
+    def test_truncated(self):
+        result = compare.compare(
+            list(range(100)),
+            list(range(1, 101)),
+            max_mismatches=5)
+        lines = render.render(result).splitlines()
+        self.assertEqual(6, len(lines))
+        self.assertEqual('... 95 more mismatches', lines[-1])
+
+    def test_write(self):
+        out = io.StringIO()
+        render.write(compare.compare({'a': [1]}, {'a': [2]}), out)
+        self.assertEqual('a[0]: expected 1, got 2\n', out.getvalue())
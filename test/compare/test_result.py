@@ -0,0 +1,116 @@
+import unittest
+
+from kobold import NotPresent, compare
+from kobold.compare.result import Inserted
+
+
+class TestCompareResult(unittest.TestCase):
+    def test_match(self):
+        result = compare.compare({'a': [1, 2]}, {'a': [1, 2]})
+        self.assertIs(compare.MATCH, result)
+        self.assertTrue(result)
+        self.assertEqual('match', result)
+        self.assertEqual('match', result.diff())
+        self.assertEqual([], result.paths())
+
+    def test_mismatch_is_falsy(self):
+        result = compare.compare(1, 2)
+        self.assertFalse(result)
+        self.assertNotEqual('match', result)
+        self.assertEqual((1, 2), result)
+
+    def test_unpacking(self):
+        expected_diff, actual_diff = compare.compare(
+            {'a': 1, 'b': [1, 2, 3]},
+            {'a': 2, 'b': [1, 2, 4]})
+        self.assertEqual({'a': 1, 'b': ['_', '_', 3]}, expected_diff)
+        self.assertEqual({'a': 2, 'b': ['_', '_', 4]}, actual_diff)
+
+    def test_mismatches(self):
+        result = compare.compare(
+            {'body': {'items': [{'price': 10}, {'price': 11}]},
+             'status': 200},
+            {'body': {'items': [{'price': 10}, {'price': 12}]},
+             'status': 404})
+        self.assertEqual(
+            [(('body', 'items', 1, 'price'), 11, 12),
+             (('status',), 200, 404)],
+            sorted(result.mismatches()))
+
+    def test_unordered_paths(self):
+        result = compare.compare(
+            compare.UnorderedList([1, 2, 3]),
+            [3, 4, 1])
+        self.assertEqual(
+            (['_', 2, '_'], ['_', 4, '_']),
+            result)
+        self.assertEqual([(1,)], result.paths())
+
+    def test_set_is_a_leaf(self):
+        result = compare.compare(set([1, 2]), set([1, 3]))
+        self.assertEqual((set([2]), set([3])), result)
+        self.assertEqual([()], result.paths())
+
+    def test_diff_is_lazy(self):
+        displayed = []
+
+        class CountingCompare(compare.Compare):
+            @classmethod
+            def display(cls, element, other_element):
+                displayed.append(element)
+                return super().display(element, other_element)
+
+        result = CountingCompare.unordered_list_compare(
+            [{'a': 1}],
+            [{'a': 2}],
+            compare.normalize_type_compare(None))
+        self.assertEqual([], displayed)
+        self.assertEqual(([{'a': 1}], [{'a': 2}]), result.diff())
+        calls = len(displayed)
+        self.assertTrue(calls > 0)
+        result.diff()
+        self.assertEqual(calls, len(displayed))
+
+    def test_results_compare_equal(self):
+        self.assertEqual(
+            compare.compare([1, 2], [1, 3]),
+            compare.compare([1, 2], [1, 3]))
+        self.assertNotEqual(
+            compare.compare([1, 2], [1, 3]),
+            compare.compare([1, 2], [1, 4]))
+
+    def test_sparse_diff(self):
+        actual = list(range(100000))
+        actual[70000] = -1
+        result = compare.compare(
+            {'rows': list(range(100000)), 'status': 200},
+            {'rows': actual, 'status': 404})
+        self.assertEqual(
+            {('rows', 70000): (70000, -1), ('status',): (200, 404)},
+            result.sparse_diff())
+        # The nested diffs, with their placeholders, weren't built
+        self.assertIsNone(result._diff)
+        self.assertIsNone(result.mismatched['rows']._diff)
+
+    def test_sparse_diff_one_sided(self):
+        self.assertEqual(
+            {(1, 0): (2, 3), (1, 1): (NotPresent, 4)},
+            compare.compare([1, [2]], [1, [3, 4]]).sparse_diff())
+        self.assertEqual({}, compare.compare([1], [1]).sparse_diff())
+
+    def test_inserted_paths(self):
+        # 'r' was removed, and 'i' and 'j' inserted - nothing is paired
+        result = compare.compare(
+            ['a', 'r', 'b'],
+            ['i', 'j', 'a', 'b'],
+            type_compare={'alignment': 'myers'})
+        self.assertEqual(
+            {(Inserted(0),): (NotPresent, 'i'),
+             (Inserted(1),): (NotPresent, 'j'),
+             (1,): ('r', NotPresent)},
+            result.sparse_diff())
+
+    def test_set_diff(self):
+        result = compare.compare(set(range(1000)), set(range(1, 1001)))
+        self.assertEqual(({0}, {1000}), result)
+        self.assertIsNone(result.list_result._diff)
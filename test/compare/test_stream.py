@@ -0,0 +1,81 @@
+import io
+import os
+import tempfile
+import unittest
+
+import kobold
+from kobold import compare
+
+
+class TestCompareStream(unittest.TestCase):
+    def rows(self, count, changed=()):
+        for i in range(count):
+            if i in changed:
+                yield {'id': i, 'v': 'changed'}
+            else:
+                yield {'id': i, 'v': i}
+
+    def test_match(self):
+        self.assertEqual(
+            'match',
+            compare.compare_stream(self.rows(1000), self.rows(1000)))
+
+    def test_mismatch(self):
+        result = compare.compare_stream(
+            self.rows(1000),
+            self.rows(1000, changed=(5, 700)))
+        self.assertFalse(result)
+        self.assertFalse(result.stopped)
+        self.assertEqual(
+            ({5: {'v': 5}, 700: {'v': 700}},
+             {5: {'v': 'changed'}, 700: {'v': 'changed'}}),
+            result)
+        self.assertEqual([(5, 'v'), (700, 'v')], result.paths())
+
+    def test_different_lengths(self):
+        self.assertEqual(
+            ({2: kobold.NotPresent}, {2: {'id': 2, 'v': 2}}),
+            compare.compare_stream(self.rows(2), self.rows(3)))
+
+    def test_stops_at_max_mismatches(self):
+        read = []
+
+        def actual():
+            for row in self.rows(1000, changed=range(1000)):
+                read.append(row)
+                yield row
+
+        result = compare.compare_stream(
+            self.rows(1000),
+            actual(),
+            max_mismatches=3)
+        self.assertTrue(result.stopped)
+        self.assertEqual([0, 1, 2], list(result.diff()[0]))
+        self.assertEqual(3, len(read))
+
+    def test_hints(self):
+        self.assertEqual(
+            'match',
+            compare.compare_stream(
+                [{'id': compare.DontCare(name='x')}, {'id': 1}],
+                iter([{'id': 1}, {'id': 1}])))
+
+    def test_json_lines(self):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(handle, 'wb') as f:
+            f.write('{"id": 0}\n\n{"id": "\u00e9\u2603"}\n'.encode('utf-8'))
+        try:
+            self.assertEqual(
+                'match',
+                compare.compare_stream(
+                    [{'id': 0}, {'id': '\u00e9\u2603'}],
+                    compare.read_json_lines(path)))
+        finally:
+            os.remove(path)
+
+    def test_json_lines_file(self):
+        lines = compare.read_json_lines(io.StringIO('[1]\n{"a": \n'))
+        self.assertEqual([1], next(lines))
+        with self.assertRaises(ValueError) as context:
+            next(lines)
+        self.assertIn('line 2', str(context.exception))
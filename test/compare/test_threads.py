@@ -0,0 +1,120 @@
+import concurrent.futures
+import json
+import threading
+import unittest
+
+import kobold
+from kobold import compare
+from kobold.compare import hints
+
+
+def fixture():
+    return {
+        'rows': [
+            hints.MultiMatch({'kind': 'row'}),
+            {'id': compare.DontCare(name='first'), 'kind': 'first'}],
+        'body': hints.JSONParsingHint(
+            {'parent': compare.DontCare(name='first')}),
+        'tags': compare.UnorderedList(
+            ['a', 'b', compare.DontCare('isinstance', of_class=str)]),
+        'at': compare.DontCare('iso8601_datetime')}
+
+
+def actual(i):
+    return {
+        'rows': [
+            {'id': i, 'kind': 'first'},
+            {'id': i + 1, 'kind': 'row'},
+            {'id': i + 2, 'kind': 'row'}],
+        'body': json.dumps({'parent': i if i % 3 else -1}),
+        'tags': ['b', str(i), 'a'],
+        'at': '2017-01-01T00:00:{:02}'.format(i % 60)}
+
+
+class TestSharedExpected(unittest.TestCase):
+    def test_multimatch_counts_are_per_comparison(self):
+        expected = [hints.MultiMatch({'color': 'red'})]
+        type_compare = {'hash': 'existing', 'ordered': False}
+        self.assertEqual(
+            'match',
+            compare.compare(expected, [{'color': 'red'}], type_compare))
+        self.assertFalse(compare.compare(expected, [], type_compare))
+        self.assertEqual(0, expected[0].count)
+        self.assertRaises(
+            kobold.ValidationError,
+            expected[0].add_match,
+            {'color': 'red'})
+
+    def test_hints_are_not_changed(self):
+        hint = hints.JSONParsingHint({'a': 1})
+        state = dict(hint.__dict__)
+        for actual in ('{"a": 1, "b": 2}', '{"a": 2}'):
+            compare.compare(hint, actual, type_compare='existing')
+        self.assertEqual(state, hint.__dict__)
+
+    def test_concurrent_compares(self):
+        expected = fixture()
+        type_compare = {'hash': 'existing', 'ordered': False}
+
+        def compare_one(i):
+            names = {}
+            result = compare.compare(
+                expected,
+                actual(i),
+                type_compare=type_compare,
+                names=names)
+            return (result, names)
+
+        serial = [compare_one(i) for i in range(300)]
+        self.assertTrue(serial[1][0])
+        self.assertFalse(serial[0][0])
+
+        start = threading.Barrier(8)
+
+        def compare_after_start(i):
+            if i < 8:
+                start.wait()
+            return compare_one(i)
+
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            concurrent_results = list(
+                executor.map(compare_after_start, range(300)))
+        self.assertEqual(serial, concurrent_results)
+
+    def test_registries_changed_while_comparing(self):
+        class Record(object):
+            def __init__(self, **fields):
+                self.fields = fields
+
+            def keys(self):
+                return self.fields.keys()
+
+            def __getitem__(self, key):
+                return self.fields[key]
+
+            def __contains__(self, key):
+                return key in self.fields
+
+        hash_compare_types = compare.hash_compare_types
+        stop = threading.Event()
+
+        def change_registries():
+            while not stop.is_set():
+                compare.add_hash_compare_types([Record])
+                compare.add_comparer(Record, int, compare.compare_equal)
+                compare.remove_comparer(Record, int)
+
+        expected = fixture()
+        type_compare = {'hash': 'existing', 'ordered': False}
+        changer = threading.Thread(target=change_registries)
+        changer.start()
+        try:
+            for i in range(1, 300, 3):
+                self.assertEqual(
+                    'match',
+                    compare.compare(expected, actual(i), type_compare))
+        finally:
+            stop.set()
+            changer.join()
+            compare.hash_compare_types = hash_compare_types
+            compare.clear_comparer_cache()
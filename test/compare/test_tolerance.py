@@ -0,0 +1,144 @@
+import fractions
+import unittest
+from unittest import mock
+
+from kobold import NotPresent, compare
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+close = {'float': {'rel_tol': 1e-6}}
+
+
+class TestFloatTolerance(unittest.TestCase):
+    def test_leaves(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                {'a': 1.0, 'b': [2.0, {'c': 3}]},
+                {'a': 1.0000001, 'b': [2.0000001, {'c': 3.0000001}]},
+                type_compare=close))
+        self.assertEqual(
+            ({'a': 1.0}, {'a': 1.1}),
+            compare.compare({'a': 1.0}, {'a': 1.1}, type_compare=close))
+
+    def test_exact_without_tolerance(self):
+        self.assertFalse(compare.compare(1.0, 1.0000001))
+        self.assertEqual('match', compare.compare(1, 1.0))
+
+    def test_abs_tol(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                0.0,
+                1e-12,
+                type_compare={'float': {'abs_tol': 1e-9}}))
+        self.assertFalse(compare.compare(0.0, 1e-12, type_compare=close))
+
+    def test_not_numbers(self):
+        self.assertFalse(compare.compare(1.0, '1.0', type_compare=close))
+        self.assertFalse(
+            compare.compare(10 ** 400, 10 ** 400 + 1, type_compare=close))
+
+    def test_other_numbers(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                fractions.Fraction(1, 3),
+                0.3333334,
+                type_compare=close))
+        self.assertFalse(compare.compare(True, 1.0000001, type_compare=close))
+        compiled = compare.Compare.compile(
+            [fractions.Fraction(1, 3)],
+            close)
+        self.assertEqual('match', compiled.match([0.3333334]))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_numpy_scalars(self):
+        for number_type in (numpy.float32, numpy.float64, numpy.int64):
+            self.assertEqual(
+                'match',
+                compare.compare(
+                    {'a': number_type(1000)},
+                    {'a': 1000.0001},
+                    type_compare=close))
+            self.assertEqual(
+                'match',
+                compare.compare(
+                    [1000.0001, 2.0],
+                    [number_type(1000), number_type(2)],
+                    type_compare=close))
+            compiled = compare.Compare.compile({'a': 1000.0001}, close)
+            self.assertEqual('match', compiled.match({'a': number_type(1000)}))
+
+    def test_invalid_setting(self):
+        self.assertRaises(
+            NotImplementedError,
+            compare.compare,
+            1.0,
+            1.1,
+            type_compare={'float': 0.1})
+
+    def test_unordered_lists(self):
+        self.assertEqual(
+            'match',
+            compare.compare(
+                [1.0, 2.0, 3.0],
+                [3.0000001, 1.0000001, 2.0000001],
+                type_compare={'float': {'rel_tol': 1e-6}, 'ordered': False}))
+
+    def test_compiled(self):
+        compiled = compare.Compare.compile({'a': [1.0, 2]}, close)
+        self.assertEqual('match', compiled.match({'a': [1.0000001, 2]}))
+        self.assertEqual(
+            compare.compare({'a': [1.0, 2]}, {'a': [1.1, '2']}, close),
+            compiled.match({'a': [1.1, '2']}))
+
+
+class TestNumberLists(unittest.TestCase):
+    def test_bulk(self):
+        expected = [float(i) for i in range(10)]
+        actual = [i * 1.0000001 for i in range(10)]
+        self.assertEqual(
+            'match',
+            compare.compare(expected, actual, type_compare=close))
+        actual[4] = 5.0
+        self.assertEqual(
+            (['_'] * 4 + [4.0] + ['_'] * 5, ['_'] * 4 + [5.0] + ['_'] * 5),
+            compare.compare(expected, actual, type_compare=close))
+
+    def test_lengths(self):
+        self.assertEqual(
+            (['_', '_', 3.0], ['_', '_', NotPresent]),
+            compare.compare([1.0, 2.0, 3.0], [1.0, 2.0], type_compare=close))
+        self.assertEqual(
+            (['_', NotPresent], ['_', 2.0]),
+            compare.compare([1.0], [1.0, 2.0], type_compare=close))
+
+    def test_same_as_element_by_element(self):
+        expected = [float(i) for i in range(20)]
+        actual = [i + 1e-3 * (i % 3 == 0) for i in range(20)] + [1.5]
+        in_bulk = compare.compare(expected, actual, type_compare=close)
+        with mock.patch.object(compare, 'is_number_list', lambda values: False):
+            element_by_element = compare.compare(
+                expected,
+                actual,
+                type_compare=close)
+        self.assertEqual(element_by_element, in_bulk)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_numpy(self):
+        expected = [float(i) for i in range(2000)]
+        actual = [i * 1.0000001 for i in range(2000)]
+        actual[1500] = float('inf')
+        with mock.patch.object(compare, 'min_numpy_list_length', 10):
+            with_numpy = compare.compare(expected, actual, type_compare=close)
+        with mock.patch.object(compare, 'min_numpy_list_length', 10 ** 9):
+            without_numpy = compare.compare(
+                expected,
+                actual,
+                type_compare=close)
+        self.assertEqual(without_numpy, with_numpy)
+        self.assertFalse(with_numpy)
@@ -1,5 +1,6 @@
 import collections
 import unittest
+import kobold
 from kobold import assertions
 
 class TestAssertEqual(unittest.TestCase):
@@ -61,3 +62,106 @@ class TestAssertResponseMatches(unittest.TestCase):
                            'headers' : {'header' : 'anothervalue'}}, 
                 actual)
 
+
+
+class TestDiffBudget(unittest.TestCase):
+    def test_more_mismatches(self):
+        with self.assertRaises(AssertionError) as raised:
+            assertions.assert_equal(
+                list(range(100)),
+                list(range(1, 101)),
+                max_mismatches=10)
+        self.assertTrue(
+            str(raised.exception).endswith('... 90 more mismatches'))
+
+    def test_max_diff_chars(self):
+        with self.assertRaises(AssertionError) as raised:
+            assertions.assert_equal(
+                list(range(1000)),
+                list(range(1, 1001)),
+                max_diff_chars=200)
+        message = str(raised.exception)
+        self.assertLess(len(message), 250)
+        self.assertTrue(message.startswith('[0]: expected 0, got 1\n'))
+        self.assertTrue(message.endswith('more mismatches'))
+
+
+class TestMismatchError(unittest.TestCase):
+    def test_message_is_lazy(self):
+        from kobold.compare import render
+        calls = []
+        original = render.render
+
+        def counting_render(*args, **kwargs):
+            calls.append(args)
+            return original(*args, **kwargs)
+
+        render.render = counting_render
+        try:
+            with self.assertRaises(AssertionError) as raised:
+                assertions.assert_equal({'a': 1}, {'a': 2})
+            self.assertEqual([], calls)
+            self.assertEqual('a: expected 1, got 2', str(raised.exception))
+            str(raised.exception)
+            self.assertEqual(1, len(calls))
+        finally:
+            render.render = original
+
+    def test_exception_context(self):
+        with self.assertRaises(AssertionError) as raised:
+            assertions.assert_equal(
+                [1],
+                [2],
+                exception_context='listing')
+        self.assertEqual(
+            'listing: [0]: expected 1, got 2',
+            str(raised.exception))
+
+    def test_diff_path(self):
+        import os
+        import tempfile
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'diff.txt')
+        try:
+            with self.assertRaises(AssertionError) as raised:
+                assertions.assert_equal(
+                    list(range(1000)),
+                    list(range(1, 1001)),
+                    max_diff_chars=100,
+                    diff_path=path)
+            self.assertIn(path, str(raised.exception))
+            with open(path) as diff_file:
+                self.assertEqual(1000, len(diff_file.readlines()))
+        finally:
+            os.remove(path)
+            os.rmdir(directory)
+
+    def test_pickles(self):
+        import pickle
+        with self.assertRaises(AssertionError) as raised:
+            assertions.assert_equal(
+                {'body': kobold.compare.JSONParsingHint({'a': 1})},
+                {'body': '{"a": 2}'},
+                exception_context='listing')
+        error = pickle.loads(pickle.dumps(raised.exception))
+        self.assertIsInstance(error, assertions.MismatchError)
+        self.assertEqual(str(raised.exception), str(error))
+
+    def test_tuple_diff_path(self):
+        import os
+        import tempfile
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'diff.txt')
+        try:
+            with self.assertRaises(AssertionError):
+                assertions.raise_if_not_match(
+                    ({'a': 1}, {'a': 'caf\u00e9 \u2603'}),
+                    diff_path=path)
+            with open(path, encoding='utf-8') as diff_file:
+                self.assertEqual(
+                    "Expected\n\n{'a': 1}\n\n"
+                    "But Got\n\n{'a': 'caf\u00e9 \u2603'}\n",
+                    diff_file.read())
+        finally:
+            os.remove(path)
+            os.rmdir(directory)
@@ -1,4 +1,6 @@
 import unittest
+from unittest import mock
+import kobold
 from kobold import assertions, compare
 
 
@@ -278,3 +280,409 @@ class TestCompare(unittest.TestCase):
                 actual))
 
 
+
+
+class TestMatches(unittest.TestCase):
+    def test_match(self):
+        self.assertTrue(
+            compare.matches(
+                {'a': [1, {'b': 2}], 'c': compare.DontCare()},
+                {'a': [1, {'b': 2}], 'c': 3}))
+
+    def test_mismatch(self):
+        self.assertFalse(compare.matches({'a': 1}, {'a': 2}))
+        self.assertFalse(compare.matches([1, 2], [2, 1]))
+        self.assertFalse(compare.matches({'a': 1}, {'a': 1, 'b': 2}))
+
+    def test_type_compare(self):
+        self.assertTrue(
+            compare.matches(
+                {'a': 1},
+                {'a': 1, 'b': 2},
+                type_compare='existing'))
+        self.assertTrue(
+            compare.matches(
+                [1, 2],
+                [2, 1],
+                type_compare={'ordered': False}))
+        self.assertFalse(
+            compare.matches(
+                [1, 2],
+                [2, 1, 3],
+                type_compare={'ordered': False}))
+        self.assertTrue(
+            compare.matches(
+                [1, 2],
+                [2, 1, 3],
+                type_compare={'ordered': False, 'list': 'existing'}))
+
+    def test_hints(self):
+        self.assertTrue(
+            compare.matches(
+                compare.hints.JSONParsingHint({'a': 1}),
+                '{"a": 1}'))
+        self.assertFalse(
+            compare.matches(
+                compare.hints.JSONParsingHint({'a': 1}),
+                'not json'))
+
+    def test_stops_at_first_mismatch(self):
+        calls = []
+
+        class Counted(compare.DontCare):
+            def compare_with(self, other_thing, names=None):
+                calls.append(other_thing)
+                return False
+
+        expected = [Counted(), Counted(), Counted()]
+        self.assertFalse(compare.matches(expected, [1, 2, 3]))
+        self.assertEqual([1], calls)
+
+    def test_agrees_with_compare(self):
+        cases = [
+            ({'a': [1, 2]}, {'a': [1, 2]}, None),
+            ({'a': [1, 2]}, {'a': [1, 3]}, None),
+            (set([1, 2]), set([2, 1]), None),
+            ((1, 2), (1, 2, 3), None),
+            ([compare.MultiMatch({'a': 1})], [{'a': 1}, {'a': 1}],
+             {'ordered': False}),
+            ([1, 2, 3], [0, 1, 2, 3], {'alignment': 'myers'}),
+        ]
+        for expected, actual, type_compare in cases:
+            self.assertEqual(
+                compare.compare(expected, actual, type_compare) == 'match',
+                compare.matches(expected, actual, type_compare))
+
+
+def nest(leaf, depth, key='a'):
+    for _ in range(depth):
+        leaf = {key: [leaf]}
+    return leaf
+
+
+class TestDeepNesting(unittest.TestCase):
+    # Deeper than Python's default recursion limit
+    depth = 5000
+
+    def test_match(self):
+        self.assertIs(
+            compare.MATCH,
+            compare.compare(nest(1, self.depth), nest(1, self.depth)))
+        self.assertTrue(
+            compare.matches(nest(1, self.depth), nest(1, self.depth)))
+
+    def test_mismatch(self):
+        result = compare.compare(nest(1, self.depth), nest(2, self.depth))
+        [(path, expected, actual)] = list(result.mismatches())
+        self.assertEqual(('a', 0) * self.depth, path)
+        self.assertEqual((1, 2), (expected, actual))
+        expected_diff, actual_diff = result.diff()
+        for _ in range(self.depth):
+            expected_diff = expected_diff['a'][0]
+        self.assertEqual(1, expected_diff)
+
+    def test_unordered(self):
+        expected = compare.UnorderedList([nest(1, self.depth), 2])
+        self.assertTrue(
+            compare.matches(expected, [2, nest(1, self.depth)]))
+        self.assertFalse(
+            compare.matches(expected, [2, nest(3, self.depth)]))
+
+    def test_display(self):
+        displayed = compare.Compare.display(
+            nest(compare.DontCare(), self.depth),
+            nest(3, self.depth))
+        for _ in range(self.depth):
+            displayed = displayed['a'][0]
+        self.assertEqual('dontcare: not_none_or_missing', displayed)
+
+    def test_display_tuples(self):
+        self.assertEqual(
+            ((1, ['x', (2,)]), 3),
+            compare.Compare.display(
+                ((1, ['x', (2,)]), 3),
+                ((1, ['y', (3,)]), 4)))
+
+
+class Record(object):
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def keys(self):
+        return self.fields.keys()
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.fields
+
+
+class TestDispatch(unittest.TestCase):
+    def tearDown(self):
+        compare.comparer_cache.clear()
+
+    def test_cached_by_type_pair(self):
+        compare.comparer_cache.clear()
+        self.assertEqual('match', compare.compare({'a': 1}, {'a': 1}))
+        self.assertIs(
+            compare.compare_hashes,
+            compare.comparer_cache[(dict, dict)])
+        self.assertIs(
+            compare.compare_numbers,
+            compare.comparer_cache[(int, int)])
+
+    def test_force_compare_types_cached(self):
+        self.assertIs(
+            compare.get_force_compare_types(),
+            compare.get_force_compare_types())
+
+    def test_add_hash_compare_types_invalidates(self):
+        expected = {'a': 1, 'b': compare.DontCare()}
+        actual = Record(a=1, b=2)
+        self.assertNotEqual('match', compare.compare(expected, actual))
+        hash_compare_types = compare.hash_compare_types
+        try:
+            compare.add_hash_compare_types([Record])
+            self.assertEqual('match', compare.compare(expected, actual))
+        finally:
+            compare.hash_compare_types = hash_compare_types
+
+    def test_add_comparer(self):
+        def within_a_cent(cls, expected, actual, type_compare, names,
+                          fail_fast):
+            if abs(expected - actual) < 0.01:
+                return compare.MATCH
+            return compare.Mismatch(expected, actual)
+
+        expected = {'price': 10.0, 'count': 1}
+        actual = {'price': 10.004, 'count': 1}
+        self.assertNotEqual('match', compare.compare(expected, actual))
+        compare.add_comparer(float, float, within_a_cent)
+        try:
+            self.assertEqual('match', compare.compare(expected, actual))
+            self.assertEqual(
+                'match',
+                compare.Compare.compile(expected).match(actual))
+            self.assertEqual(
+                ({'price': 10.0}, {'price': 10.5}),
+                compare.compare(expected, {'price': 10.5, 'count': 1}))
+        finally:
+            compare.remove_comparer(float, float)
+        self.assertNotEqual('match', compare.compare(expected, actual))
+
+    def test_comparer_for_base_class(self):
+        class Name(str):
+            pass
+
+        def case_insensitive(cls, expected, actual, type_compare, names,
+                             fail_fast):
+            return (expected.lower(), actual.lower(), type_compare)
+
+        compare.add_comparer(Name, str, case_insensitive)
+        try:
+            self.assertEqual(
+                'match',
+                compare.compare([Name('Bob')], ['BOB']))
+        finally:
+            compare.remove_comparer(Name, str)
+
+
+class TestTypeCompare(unittest.TestCase):
+    def test_interned(self):
+        type_compare = compare.normalize_type_compare(
+            {'hash': 'existing', 'dontcare_keys': ['id']})
+        self.assertIs(
+            type_compare,
+            compare.normalize_type_compare(
+                {'dontcare_keys': ('id',), 'hash': 'existing'}))
+        self.assertEqual(
+            {'hash': 'existing',
+             'list': 'full',
+             'ordered': True,
+             'dontcare_keys': frozenset(['id'])},
+            type_compare)
+        self.assertEqual(hash(type_compare), hash(type_compare))
+
+    def test_normalized_is_unchanged(self):
+        type_compare = compare.normalize_type_compare('existing')
+        self.assertIs(
+            type_compare,
+            compare.normalize_type_compare(type_compare))
+        self.assertIs(
+            compare.normalize_type_compare(None),
+            compare.normalize_type_compare({}))
+
+    def test_derived_memoized(self):
+        type_compare = compare.normalize_type_compare({'ordered': False})
+        derived = type_compare.derive('existing')
+        self.assertIs(derived, type_compare.derive('existing'))
+        self.assertIs(
+            derived,
+            compare.normalize_type_compare(
+                {'hash': 'existing'},
+                defaults=type_compare))
+        self.assertEqual(
+            {'hash': 'existing',
+             'list': 'full',
+             'ordered': False,
+             'dontcare_keys': frozenset()},
+            derived)
+
+    def test_overrides_interned_once(self):
+        settings = {'hash': 'existing'}
+        expected = [
+            compare.TypeCompareHint({'a': i}, settings) for i in range(50)]
+        actual = [{'a': i, 'b': i} for i in range(50)]
+        self.assertEqual('match', compare.compare(expected, actual))
+        with mock.patch.object(
+                compare,
+                'freeze_setting',
+                wraps=compare.freeze_setting) as freeze_setting:
+            self.assertEqual('match', compare.compare(expected, actual))
+        self.assertEqual(0, freeze_setting.call_count)
+
+        # Changing the dict is noticed
+        settings['hash'] = 'full'
+        self.assertFalse(compare.compare(expected, actual))
+
+    def test_immutable(self):
+        type_compare = compare.normalize_type_compare(None)
+        with self.assertRaises(TypeError):
+            type_compare['hash'] = 'existing'
+        with self.assertRaises(TypeError):
+            type_compare.update({'hash': 'existing'})
+        with self.assertRaises(AttributeError):
+            type_compare.normalized = False
+        self.assertEqual('full', type_compare['hash'])
+
+    def test_pickle(self):
+        import pickle
+        type_compare = compare.normalize_type_compare(
+            {'float': {'rel_tol': 0.1}})
+        self.assertIs(
+            type_compare,
+            pickle.loads(pickle.dumps(type_compare)))
+
+
+class CountingJSONHint(compare.JSONParsingHint):
+    parsed = []
+
+    def sub_parse(self, thing_to_parse):
+        self.parsed.append((id(self), thing_to_parse))
+        return super().sub_parse(thing_to_parse)
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        CountingJSONHint.parsed = []
+
+    def test_unordered_parses_once(self):
+        expected = compare.UnorderedList(
+            [CountingJSONHint({'id': i}) for i in range(10)])
+        actual = ['{{"id": {}}}'.format(i) for i in reversed(range(11))]
+        result = compare.compare(expected, actual)
+        self.assertEqual(([], ['{"id": 10}']), (
+            [e for e in result[0] if e != '_'],
+            [a for a in result[1] if a != '_']))
+        self.assertEqual(
+            len(CountingJSONHint.parsed),
+            len(set(CountingJSONHint.parsed)))
+        parses = len(CountingJSONHint.parsed)
+        result.diff()
+        self.assertEqual(parses, len(CountingJSONHint.parsed))
+
+    def test_diff_parses_nothing_again(self):
+        expected = compare.UnorderedList(
+            [CountingJSONHint({'id': 1}), CountingJSONHint({'id': 2})])
+        result = compare.compare(expected, ['{"id": 3}', '{"id": 2}'])
+        parses = len(CountingJSONHint.parsed)
+        self.assertEqual(
+            ([{'id': 1}, '_'], [{'id': 3}, '_']),
+            result.diff())
+        self.assertEqual(parses, len(CountingJSONHint.parsed))
+
+    def test_each_compare_parses_again(self):
+        hint = CountingJSONHint({'id': 1})
+        compare.compare(hint, '{"id": 1}')
+        compare.compare([hint], ['{"id": 1}'])
+        compare.compare([hint], ['{"id": 1}'])
+        self.assertEqual(3, len(CountingJSONHint.parsed))
+
+    def test_invalid_is_remembered(self):
+        expected = compare.UnorderedList(
+            [CountingJSONHint({'id': 1}), 1, 2])
+        self.assertFalse(compare.compare(expected, ['nope', 1, 2]))
+        self.assertEqual(
+            1,
+            [value for (_, value) in CountingJSONHint.parsed].count('nope'))
+
+
+class TestDontCareRules(unittest.TestCase):
+    def tearDown(self):
+        compare.remove_dontcare_rule('even')
+
+    def test_built_in_rules(self):
+        cases = [
+            (compare.DontCare(), 1, None),
+            (compare.DontCare('list'), [], {}),
+            (compare.DontCare('list', length=2), [1, 2], [1]),
+            (compare.DontCare('json'), '{"a": 1}', '{a: 1}'),
+            (compare.DontCare('isinstance', of_class=int), 1, '1'),
+            (compare.DontCare('number_within', number=10, range=1), 10.5, 11),
+            (compare.DontCare(
+                'date_string_with_format',
+                format_string='%Y/%m/%d'), '2017/01/31', '2017/01/32')]
+        for (expected, good, bad) in cases:
+            self.assertEqual('match', compare.compare(expected, good))
+            self.assertFalse(compare.compare(expected, bad))
+        for expected in (compare.DontCare('no_rules'), compare.DontCare(None)):
+            self.assertEqual('match', compare.compare(expected, None))
+
+    def test_iso8601_datetime(self):
+        expected = compare.DontCare('iso8601_datetime')
+        for good in ('2017-01-01T00:00:00',
+                     '2017-01-01T00:00:00+00:00',
+                     'January 1st 2017'):
+            self.assertEqual('match', compare.compare(expected, good))
+        for bad in ('not a date', 20170101, None):
+            self.assertFalse(compare.compare(expected, bad))
+
+    def test_missing_options(self):
+        self.assertRaises(
+            kobold.ValidationError,
+            compare.DontCare,
+            'isinstance')
+        self.assertRaises(
+            kobold.ValidationError,
+            compare.DontCare,
+            'number_within',
+            number=1)
+
+    def test_unknown_rule(self):
+        expected = compare.DontCare('nope')
+        self.assertRaises(
+            kobold.ValidationError,
+            compare.compare,
+            expected,
+            1)
+
+    def test_custom_rule(self):
+        def validate_even(offset=0):
+            return lambda other_thing: (other_thing + offset) % 2 == 0
+
+        compare.add_dontcare_rule('even', validate_even)
+        self.assertEqual(
+            'match',
+            compare.compare([compare.DontCare('even')], [2]))
+        self.assertEqual(
+            'match',
+            compare.compare([compare.DontCare('even', offset=1)], [3]))
+        self.assertFalse(compare.compare([compare.DontCare('even')], [3]))
+
+    def test_pickle(self):
+        import pickle
+        expected = pickle.loads(pickle.dumps(
+            compare.DontCare('date_string_with_format', format_string='%Y')))
+        self.assertEqual('match', compare.compare(expected, '2017'))
+        self.assertFalse(compare.compare(expected, 'x'))
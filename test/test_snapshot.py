@@ -0,0 +1,169 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+import kobold
+from kobold import compare, snapshot
+
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'golden.kobold')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def store(self, update=False):
+        return snapshot.SnapshotStore(self.path, update=update)
+
+    def test_round_trip(self):
+        value = {'a': [1, 2.5, None, True], 'b': ('x', b'y'), 'c': {1, 2}}
+        with self.store() as store:
+            store.put('one', value)
+            store.put('two', [1])
+        store = self.store()
+        self.assertEqual(['one', 'two'], store.names())
+        self.assertEqual(value, store.load('one'))
+        self.assertEqual([1], store.load('two'))
+        self.assertRaises(KeyError, store.load, 'three')
+        store.close()
+
+    def test_assert_matches(self):
+        with self.store() as store:
+            store.put('orders', {'orders': [{'id': 1}, {'id': 2}]})
+        store = self.store()
+        store.assert_matches('orders', {'orders': [{'id': 1}, {'id': 2}]})
+        self.assertRaises(
+            AssertionError,
+            store.assert_matches,
+            'orders',
+            {'orders': [{'id': 1}]})
+        self.assertRaises(
+            AssertionError,
+            store.assert_matches,
+            'missing',
+            {})
+        store.assert_matches(
+            'orders',
+            {'orders': [{'id': 1, 'extra': 1}, {'id': 2}]},
+            type_compare='existing')
+        store.close()
+
+    def test_update_mode_rewrites_only_changed_entries(self):
+        with self.store() as store:
+            store.put('same', list(range(100)))
+            store.put('changes', [1])
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            before = f.read()
+        same_offset, same_length = self.store().index['same']
+
+        with self.store(update=True) as store:
+            store.assert_matches('same', list(range(100)))
+            store.assert_matches('changes', [2])
+            store.assert_matches('new', 'value')
+
+        with open(self.path, 'rb') as f:
+            after = f.read()
+        store = self.store()
+        self.assertEqual(
+            before[same_offset:same_offset + same_length],
+            after[same_offset:same_offset + same_length])
+        self.assertEqual((same_offset, same_length), store.index['same'])
+        self.assertEqual([2], store.load('changes'))
+        self.assertEqual('value', store.load('new'))
+        store.close()
+        self.assertGreater(os.path.getsize(self.path), size)
+
+    def test_update_mode_from_environment(self):
+        os.environ['KOBOLD_UPDATE_SNAPSHOTS'] = '1'
+        try:
+            store = snapshot.SnapshotStore(self.path)
+        finally:
+            del os.environ['KOBOLD_UPDATE_SNAPSHOTS']
+        self.assertTrue(store.update)
+
+    def test_compact(self):
+        with self.store() as store:
+            store.put('a', 'x' * 1000)
+            store.put('b', 1)
+        with self.store() as store:
+            store.put('a', 'y')
+        grown = os.path.getsize(self.path)
+        store = self.store()
+        store.compact()
+        self.assertLess(os.path.getsize(self.path), grown)
+        self.assertEqual('y', store.load('a'))
+        self.assertEqual(1, store.load('b'))
+        store.close()
+
+    def test_only_plain_data(self):
+        store = self.store()
+        self.assertRaises(
+            kobold.ValidationError,
+            store.put,
+            'hint',
+            compare.DontCare())
+
+    def test_not_a_store(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'{"a": 1}')
+        self.assertRaises(kobold.ValidationError, self.store)
+
+    def test_failed_save_leaves_store(self):
+        with self.store() as store:
+            store.put('a', [1, 2])
+        with open(self.path, 'rb') as f:
+            before = f.read()
+        store = self.store()
+        store.put('a', [3])
+        store.put('b', 'new')
+        with mock.patch.object(os, 'fsync', side_effect=OSError('disk full')):
+            self.assertRaises(OSError, store.save)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(before, f.read())
+        self.assertEqual([os.path.basename(self.path)],
+                         os.listdir(self.directory))
+        self.assertEqual([3], store.load('a'))
+        store.close()
+        store = self.store()
+        self.assertEqual([1, 2], store.load('a'))
+        store.close()
+
+    def test_save_keeps_permissions_and_other_files(self):
+        with self.store() as store:
+            store.put('a', 1)
+        self.assertEqual(
+            0o666 & ~self.umask(),
+            stat.S_IMODE(os.stat(self.path).st_mode))
+        os.chmod(self.path, 0o640)
+        with open(self.path + '.tmp', 'wb') as f:
+            f.write(b'another save')
+        with self.store() as store:
+            store.put('b', 2)
+        self.assertEqual(0o640, stat.S_IMODE(os.stat(self.path).st_mode))
+        with open(self.path + '.tmp', 'rb') as f:
+            self.assertEqual(b'another save', f.read())
+        store = self.store()
+        self.assertEqual(['a', 'b'], store.names())
+        store.close()
+
+    def umask(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        return umask
+
+    def test_closed(self):
+        with self.store() as store:
+            store.put('a', 1)
+        for method, args in (
+                (store.load, ('a',)),
+                (store.put, ('a', 2)),
+                (store.save, ()),
+                (store.compact, ()),
+                (store.assert_matches, ('a', 1))):
+            self.assertRaises(kobold.ValidationError, method, *args)
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+def import_times(statement):
+    '''Runs statement in a fresh interpreter with -X importtime, and
+       returns {module name: cumulative import time in microseconds}'''
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    # Generous, so that a slow machine doesn't fail this - the point is
+    # to catch something heavy being imported eagerly again
+    budget_microseconds = 100000
+
+    heavy_modules = (
+        'asyncio',
+        'base64',
+        'dateutil',
+        'json',
+        'numpy',
+        'pickle',
+        'pprint',
+        'six',
+        'urllib.parse',
+        'uuid',
+        'zlib')
+
+    def assert_not_imported(self, times):
+        for module in self.heavy_modules:
+            self.assertNotIn(module, times)
+
+    def test_import_kobold(self):
+        times = import_times('import kobold')
+        self.assert_not_imported(times)
+        self.assertNotIn('kobold.compare', times)
+        self.assertLess(times['kobold'], self.budget_microseconds)
+
+    def test_import_compare(self):
+        times = import_times(
+            'import kobold; kobold.compare.compare({"a": [1]}, {"a": [1]})')
+        self.assert_not_imported(times)
+        self.assertLess(times['kobold.compare'], self.budget_microseconds)
+
+    def test_dateutil_only_for_iso8601(self):
+        times = import_times(
+            'from kobold import compare; '
+            'compare.compare(compare.DontCare("iso8601_datetime"), '
+            '"2017-01-01T00:00:00")')
+        self.assertNotIn('dateutil', times)
+        times = import_times(
+            'from kobold import compare; '
+            'compare.compare(compare.DontCare("iso8601_datetime"), '
+            '"January 1st 2017")')
+        self.assertIn('dateutil', times)